@@ -0,0 +1,128 @@
+"""
+Memory held by many courses as schema models versus a ``CompactCatalog``.
+
+Builds synthetic courses shaped like Maktabkhooneh chapter listings and
+reports the traced allocations of keeping them all as ``CourseInfo``
+models, as a ``CompactCatalog`` built from those models, and as a
+``CompactCatalog`` loaded from a ``CourseIndex`` (with ``--from-index``):
+
+    python benchmarks/catalog_memory.py [--courses 10000] [--chapters 6] [--units 10]
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from maktab_dl.compact import CompactCatalog  # noqa: E402
+from maktab_dl.schemas import (  # noqa: E402
+    Chapter,
+    CourseChaptersModel,
+    CourseInfo,
+    CourseModel,
+    Unit,
+)
+
+UNIT_TYPES = ("lecture", "lecture", "lecture", "text", "quiz", "assignment")
+
+
+def make_course(seed: int, chapters: int, units: int) -> CourseInfo:
+    description = "Explanation of the topic and what the unit covers. " * 4
+    return CourseInfo(
+        link=f"https://maktabkhooneh.org/course/course-mk{seed}/",
+        course=CourseModel(
+            slug_id=seed,
+            slug=f"course-mk{seed}",
+            title=f"Course {seed}",
+            heading="A course heading",
+            type="course",
+            description=description * 4,
+        ),
+        chapters=CourseChaptersModel(
+            chapters=[
+                Chapter(
+                    id=seed * 100 + i,
+                    title=f"Chapter {i}",
+                    slug=f"chapter-{i}",
+                    unit_set=[
+                        Unit(
+                            id=(seed * 100 + i) * 100 + j,
+                            title=f"Unit {i}.{j} of course {seed}",
+                            slug=f"unit-{i}-{j}",
+                            type=UNIT_TYPES[j % len(UNIT_TYPES)],
+                            attachment=j % 3 == 0,
+                            description=description,
+                        )
+                        for j in range(units)
+                    ],
+                )
+                for i in range(chapters)
+            ]
+        ),
+    )
+
+
+def measure(label: str, build) -> object:
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:>22} {current / 2**20:9.1f} MiB held "
+        f"{peak / 2**20:9.1f} MiB peak {elapsed:7.1f}s"
+    )
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--courses", type=int, default=10000)
+    parser.add_argument("--chapters", type=int, default=6)
+    parser.add_argument("--units", type=int, default=10)
+    parser.add_argument("--from-index", action="store_true")
+    args = parser.parse_args()
+
+    def courses():
+        return (
+            make_course(seed, args.chapters, args.units) for seed in range(args.courses)
+        )
+
+    print(
+        f"{args.courses} courses, {args.courses * args.chapters * args.units} units"
+    )
+    models = measure("CourseInfo models", lambda: list(courses()))
+    del models
+
+    def build_compact():
+        catalog = CompactCatalog()
+        for course_info in courses():
+            catalog.add(course_info)
+        return catalog
+
+    catalog = measure("CompactCatalog", build_compact)
+    assert catalog.unit_count() == args.courses * args.chapters * args.units
+    del catalog
+
+    if args.from_index:
+        from maktab_dl.index import CourseIndex
+
+        with tempfile.TemporaryDirectory() as directory:
+            index = CourseIndex(os.path.join(directory, "index.db"))
+            for course_info in courses():
+                index.upsert_course(course_info)
+            catalog = measure("CompactCatalog (index)", lambda: CompactCatalog.from_index(index))
+            assert len(catalog) == args.courses
+            index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Unit page parsing throughput with 1, 2, 4 and 8 parse workers.
+
+Builds synthetic unit pages shaped like large Maktabkhooneh text/quiz pages
+and reports how many units per second ``extract_unit_links`` gets through,
+inline and on a ``ProcessPoolExecutor``:
+
+    python benchmarks/parse_throughput.py [--pages 200] [--paragraphs 4000]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from maktab_dl.parsing import extract_unit_links  # noqa: E402
+
+WORKER_COUNTS = (1, 2, 4, 8)
+
+
+def make_page(paragraphs: int, seed: int) -> str:
+    body = "".join(
+        f"<p class='unit-text'>Paragraph {seed}-{k} "
+        f"<a href='/topics/{k}/'>link {k}</a> some explanatory text.</p>"
+        for k in range(paragraphs)
+    )
+    return (
+        "<html><head><title>Unit</title></head><body>"
+        "<video><source src='/videos/unit-hq.mp4'/>"
+        "<source src='/videos/unit-lq.mp4'/>"
+        "<track kind='subtitles' src='/subs/unit.vtt'/></video>"
+        "<div class='unit-content--download'><a href='https://cdn.example/u.zip'>get</a></div>"
+        f"{body}<a href='/files/extra-{seed}.rar'>rar</a></body></html>"
+    )
+
+
+def run_inline(pages: list[str]) -> float:
+    started = time.perf_counter()
+    for page in pages:
+        extract_unit_links(page)
+    return time.perf_counter() - started
+
+
+def run_pool(pages: list[str], workers: int) -> float:
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Warm the workers up so process start-up is not measured
+        list(executor.map(extract_unit_links, pages[:workers]))
+        started = time.perf_counter()
+        list(executor.map(extract_unit_links, pages, chunksize=1))
+        return time.perf_counter() - started
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=4000)
+    args = parser.parse_args()
+
+    pages = [make_page(args.paragraphs, seed) for seed in range(args.pages)]
+    size = sum(len(page) for page in pages) / len(pages)
+    print(f"{args.pages} pages, {size / 1024:.0f} KiB each, {os.cpu_count()} CPUs")
+
+    elapsed = run_inline(pages)
+    print(f"{'inline':>10} {args.pages / elapsed:10.1f} units/s")
+    for workers in WORKER_COUNTS:
+        elapsed = run_pool(pages, workers)
+        print(f"{workers:>3} workers {args.pages / elapsed:10.1f} units/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Startup-time benchmark for the command-line entry points.
+
+Runs each entry point under ``python -X importtime`` and reports the wall
+time and the cumulative import time of the slowest modules. Exits non-zero
+when a heavy optional dependency is imported by a code path that never uses
+it, so the check can run alongside the rest of the suite:
+
+    python benchmarks/startup.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must stay out of the import graph of these commands
+HEAVY_MODULES = ("pandas", "lxml", "tqdm", "pydantic", "httpx", "openpyxl")
+
+COMMANDS = {
+    "import maktab_dl": ["-c", "import maktab_dl"],
+    "maktab_dl --help": ["-m", "maktab_dl", "--help"],
+    "maktab_dl download --help": ["-m", "maktab_dl", "download", "--help"],
+    "import main": ["-c", "import main"],
+}
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """Maps top-level module names to their cumulative import time in us."""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = (x.strip() for x in line[12:].split("|"))
+        if cumulative_us.isdigit():
+            cumulative[name] = int(cumulative_us)
+    return cumulative
+
+
+def measure(args: list[str], repeat: int = 5) -> tuple[float, dict[str, int]]:
+    """Best wall time of `repeat` runs and the import times of that run."""
+    best = float("inf")
+    modules = {}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", *args],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        )
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(args)} failed:\n{result.stderr[-2000:]}")
+        if elapsed < best:
+            best = elapsed
+            modules = parse_importtime(result.stderr)
+    return best, modules
+
+
+def main() -> int:
+    failed = False
+    for label, args in COMMANDS.items():
+        elapsed, modules = measure(args)
+        heavy = sorted(
+            {name.split(".")[0] for name in modules} & set(HEAVY_MODULES)
+        )
+        slowest = sorted(modules.items(), key=lambda x: -x[1])[:5]
+        print(f"{label:30} {elapsed * 1000:8.1f} ms")
+        for name, cumulative_us in slowest:
+            print(f"    {cumulative_us / 1000:8.1f} ms  {name}")
+        if heavy:
+            failed = True
+            print(f"    heavy imports: {', '.join(heavy)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,193 @@
-from .logging import *  # noqa: F403
-from .schemas import *  # noqa: F403
-from .utils import *  # noqa: F403
-from .cli import *  # noqa: F403
-from .handler import *  # noqa: F403
+import importlib
+
+# Public names and the module each is defined in. They are resolved on first
+# access, so importing the package does not pull in httpx, lxml, pydantic or
+# pandas up front.
+_EXPORTS: dict[str, str] = {
+    **dict.fromkeys(
+        (
+            "set_log_context", "clear_log_context", "ContextFilter",
+            "DeferredQueueHandler", "JsonLinesFormatter", "parse_log_levels",
+            "setup_logging",
+        ),
+        "logging",
+    ),
+    **dict.fromkeys(
+        (
+            "save_cookies", "load_cookies", "load_cookies_from_json_file",
+            "get_xpath_first_element", "remove_extra_spaces", "save_model_to_json",
+            "load_model_from_json", "sanitize_filename", "parse_size",
+            "get_package_file_path", "get_cookies_default_file_path",
+            "get_user_default_path", "get_boolean_manual",
+        ),
+        "utils",
+    ),
+    **dict.fromkeys(
+        (
+            "PARTIAL_SUFFIXES", "MEDIA_EXTENSIONS", "UnitPaths", "Asset",
+            "LocalIndex", "OutputLayout",
+        ),
+        "layout",
+    ),
+    **dict.fromkeys(
+        (
+            "CompactUnit", "CompactChapter", "CompactCourseModel",
+            "CompactChapters", "CompactCourse", "compact_course", "CompactCatalog",
+        ),
+        "compact",
+    ),
+    **dict.fromkeys(
+        (
+            "ManifestError", "Variant", "Track", "manifest_kind",
+            "parse_hls_master", "parse_hls_media", "parse_dash",
+            "SegmentDownloader",
+        ),
+        "manifest",
+    ),
+    **dict.fromkeys(
+        (
+            "PARSE_OFFLOAD_MIN_SIZE", "UnitLinks", "UnitLinkScanner",
+            "scan_unit_links", "scan_unit_file", "extract_unit_links",
+        ),
+        "parsing",
+    ),
+    **dict.fromkeys(
+        (
+            "VideoCandidate", "rank_video_links", "QualityPolicy",
+            "HighestQualityPolicy", "LowestQualityPolicy", "ByteBudgetPolicy",
+            "quality_policy_from_name",
+        ),
+        "quality",
+    ),
+    **dict.fromkeys(
+        (
+            "STORE_DIR_NAME", "file_sha256", "link_or_copy", "BlobStore",
+        ),
+        "store",
+    ),
+    **dict.fromkeys(
+        (
+            "MIN_PART_SIZE", "SinkWriter", "StorageSink", "S3Writer", "S3Sink",
+        ),
+        "sinks",
+    ),
+    **dict.fromkeys(
+        (
+            "ConcurrencyTuner",
+        ),
+        "tuning",
+    ),
+    **dict.fromkeys(
+        (
+            "TransferSettings", "TransferStalled", "TransferPaused",
+            "StallDetector", "PartialFile", "HedgedRange", "TransferWindow",
+            "parse_transfer_window", "TransferSchedule",
+        ),
+        "transfer",
+    ),
+    **dict.fromkeys(
+        (
+            "write_if_changed", "write_stream_if_changed", "ValidatorStore",
+        ),
+        "validators",
+    ),
+    **dict.fromkeys(
+        (
+            "SAMPLE_BLOCK_SIZE", "VERIFY_MODES", "sample_digest", "mmap_sha256",
+            "VerifyResult", "verify_file", "verify_downloads",
+        ),
+        "verify",
+    ),
+    **dict.fromkeys(
+        (
+            "POST_PROCESS_KINDS", "OFFLINE_PAGE_SUFFIX", "vtt_to_srt",
+            "convert_subtitle_to_srt", "offline_page_path", "rewrite_page_links",
+            "localize_page_links", "PostProcessor",
+        ),
+        "postprocess",
+    ),
+    **dict.fromkeys(
+        (
+            "ASSETS_DIRECTORY_NAME", "collect_page_assets", "asset_file_name",
+            "AssetLocalizer",
+        ),
+        "localizer",
+    ),
+    **dict.fromkeys(
+        (
+            "LinkExporter", "known_checksums",
+        ),
+        "exporter",
+    ),
+    **dict.fromkeys(
+        (
+            "CATALOG_COLUMNS", "CATALOG_FORMATS", "iter_catalog_rows",
+            "export_catalog",
+        ),
+        "catalog",
+    ),
+    **dict.fromkeys(
+        (
+            "INDEX_FILE_NAME", "CourseIndex",
+        ),
+        "index",
+    ),
+    **dict.fromkeys(
+        (
+            "MaktabkhoonehCrawler",
+        ),
+        "handler",
+    ),
+    **dict.fromkeys(
+        (
+            "SyncDaemon",
+        ),
+        "daemon",
+    ),
+    **dict.fromkeys(
+        (
+            "JOBS_FILE_NAME", "Job", "JobStore", "SQLiteJobStore",
+            "default_worker_id", "DownloadWorker", "enqueue_course",
+        ),
+        "jobs",
+    ),
+    **dict.fromkeys(
+        (
+            "FAILURES_FILE_NAME", "FailedItem", "failed_url", "FailureQueue",
+            "FailureReplayer",
+        ),
+        "failures",
+    ),
+    **dict.fromkeys(
+        (
+            "main", "export_links", "serve", "enqueue_courses", "run_worker",
+            "verify_archive", "retry_failed", "query_index",
+            "export_courses_catalog", "download_videos",
+        ),
+        "cli",
+    ),
+    **dict.fromkeys(
+        (
+            "LoginResponse", "UserInfo", "CourseModel", "Unit", "Chapter",
+            "CourseChaptersModel", "CourseInfo",
+        ),
+        "schemas",
+    ),
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    # Unknown names fail without importing anything, so `hasattr` probes
+    # and typos stay cheap
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{_EXPORTS[name]}", __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,4 @@
+from maktab_dl.cli import main
+
+if __name__ == "__main__":
+    main()
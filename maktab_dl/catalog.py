@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import csv
+import logging
+import os
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+if TYPE_CHECKING:
+    from maktab_dl.schemas import CourseInfo
+
+CATALOG_COLUMNS = [
+    "Course",
+    "Course Link",
+    "Chapter",
+    "Unit",
+    "Type",
+    "Description",
+    "Has Attachment",
+    "Project Required",
+    "Status",
+]
+CATALOG_FORMATS = ("xlsx", "csv", "parquet")
+
+
+def iter_catalog_rows(course_infos: Iterable[CourseInfo]) -> Iterator[list]:
+    """Yields one row per unit; `course_infos` may be a lazy generator."""
+    for course_info in course_infos:
+        for chapter in course_info.chapters.chapters:
+            for unit in chapter.unit_set:
+                yield [
+                    course_info.course.title,
+                    course_info.link,
+                    chapter.title,
+                    unit.title,
+                    unit.type,
+                    unit.description,
+                    "Yes" if unit.attachment else "No",
+                    "Yes" if unit.project_required else "No",
+                    "Active" if unit.status else "Inactive",
+                ]
+
+
+class _XlsxWriter:
+    def __init__(self, output_file: str):
+        from openpyxl import Workbook
+
+        self.output_file = output_file
+        # Write-only workbooks stream rows to a temp file instead of keeping cells
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("Catalog")
+        self.sheet.append(CATALOG_COLUMNS)
+
+    def write(self, row: list) -> None:
+        self.sheet.append(row)
+
+    def close(self) -> None:
+        self.workbook.save(self.output_file)
+
+
+class _CsvWriter:
+    def __init__(self, output_file: str):
+        # utf-8-sig so spreadsheet apps detect the Persian titles correctly
+        self.file = open(output_file, "w", encoding="utf-8-sig", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CATALOG_COLUMNS)
+
+    def write(self, row: list) -> None:
+        self.writer.writerow(row)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, output_file: str, batch_size: int):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export needs pyarrow: pip install pyarrow")
+        self.pa = pa
+        self.schema = pa.schema([(name, pa.string()) for name in CATALOG_COLUMNS])
+        self.writer = pq.ParquetWriter(output_file, self.schema)
+        self.batch_size = batch_size
+        self.rows: list[list] = []
+
+    def write(self, row: list) -> None:
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self.rows:
+            return
+        columns = {
+            name: [row[k] for row in self.rows]
+            for k, name in enumerate(CATALOG_COLUMNS)
+        }
+        self.writer.write_table(self.pa.Table.from_pydict(columns, schema=self.schema))
+        self.rows = []
+
+    def close(self) -> None:
+        self._flush()
+        self.writer.close()
+
+
+def export_catalog(
+    course_infos: Iterable[CourseInfo],
+    output_file: str,
+    fmt: str | None = None,
+    batch_size: int = 10000,
+) -> int:
+    """
+    Streams the chapter/unit catalog of any number of courses to a file.
+
+    Rows are written as the courses are iterated, so memory stays flat no
+    matter how many courses there are. The format is taken from the file
+    extension unless `fmt` is given. Returns the number of rows written.
+    """
+    fmt = fmt or os.path.splitext(output_file)[1].lstrip(".").lower()
+    if fmt not in CATALOG_FORMATS:
+        raise ValueError(f"Unknown catalog format: {fmt}")
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    if fmt == "xlsx":
+        writer = _XlsxWriter(output_file)
+    elif fmt == "csv":
+        writer = _CsvWriter(output_file)
+    else:
+        writer = _ParquetWriter(output_file, batch_size)
+    count = 0
+    try:
+        for row in iter_catalog_rows(course_infos):
+            writer.write(row)
+            count += 1
+    finally:
+        writer.close()
+    logging.info(f"Exported {count} catalog rows to {output_file}")
+    return count
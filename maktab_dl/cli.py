@@ -1,13 +1,26 @@
 import argparse
 import os
 from maktab_dl.handler import MaktabkhoonehCrawler
+from maktab_dl.exporter import LinkExporter, known_checksums
+from maktab_dl.failures import FAILURES_FILE_NAME, FailureQueue
+from maktab_dl.index import INDEX_FILE_NAME, CourseIndex
+from maktab_dl.logging import parse_log_levels, setup_logging
+from maktab_dl.quality import QualityPolicy, quality_policy_from_name
+from maktab_dl.store import STORE_DIR_NAME
+from maktab_dl.transfer import (
+    TransferSchedule,
+    TransferSettings,
+    parse_transfer_window,
+)
 from maktab_dl.utils import (
     get_cookies_default_file_path,
     get_boolean_manual,
+    parse_size,
 )
 
 cookies_default_path = get_cookies_default_file_path()
 output_default_path = os.getcwd()
+index_default_path = os.path.join(output_default_path, INDEX_FILE_NAME)
 
 
 def main():
@@ -17,6 +30,34 @@ def main():
     parser = argparse.ArgumentParser(
         description="A simple command-line interface for interacting with Maktabkhooneh."
     )
+    parser.add_argument(
+        "--log-level",
+        required=False,
+        type=str.upper,
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        default="INFO",
+        help="Default log level [Default: INFO]",
+    )
+    parser.add_argument(
+        "--log-levels",
+        required=False,
+        type=str,
+        default="",
+        help="Levels per subsystem, e.g. handler=WARNING,tuning=DEBUG,httpx=INFO",
+    )
+    parser.add_argument(
+        "--log-file",
+        required=False,
+        type=str,
+        default="maktab_dl.log",
+        help="Rotating log file, relative to the home directory; empty to disable "
+        "[Default: maktab_dl.log]",
+    )
+    parser.add_argument(
+        "--log-json",
+        action="store_true",
+        help="Write the log file as JSON lines with course/unit fields",
+    )
     subparsers = parser.add_subparsers(
         title="Commands", dest="command", help="Available commands"
     )
@@ -26,14 +67,284 @@ def main():
         "download", help="Loads course info and downloads videos"
     )
 
+    _add_common_arguments(download_parser)
+    download_parser.add_argument(
+        "--blob-store",
+        action="store_true",
+        help="Hardlink repeated files from a content-addressed store under the output directory",
+    )
+    download_parser.add_argument(
+        "-q",
+        "--quality",
+        required=False,
+        choices=["highest", "lowest", "budget"],
+        default="highest",
+        help="Video quality policy [Default: highest]",
+    )
+    download_parser.add_argument(
+        "--budget",
+        required=False,
+        type=parse_size,
+        default=None,
+        help="Per-course video byte budget for the budget policy, e.g. 2G",
+    )
+    download_parser.add_argument(
+        "-t",
+        "--threads",
+        required=False,
+        type=int,
+        default=1,
+        help="Upper bound of units downloaded at once; the number of active media "
+        "streams is tuned from measured throughput [Default: 1]",
+    )
+    download_parser.add_argument(
+        "--lookahead",
+        required=False,
+        type=int,
+        default=2,
+        help="Unit pages fetched ahead while media of the current unit downloads, "
+        "with one thread; 0 to disable [Default: 2]",
+    )
+    download_parser.add_argument(
+        "--post-process",
+        action="store_true",
+        help="Convert subtitles to SRT and write offline copies of saved pages as assets finish",
+    )
+    download_parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Download images, styles and embeds of saved pages and point offline copies at them",
+    )
+    download_parser.add_argument(
+        "--sink",
+        required=False,
+        type=str,
+        default=None,
+        help="Stream files to s3://bucket/prefix instead of the output directory; "
+        "keys follow the output layout (needs boto3)",
+    )
     download_parser.add_argument(
+        "--s3-endpoint",
+        required=False,
+        type=str,
+        default=None,
+        help="Endpoint of an S3-compatible service such as MinIO",
+    )
+    download_parser.add_argument(
+        "--stall-rate",
+        required=False,
+        type=parse_size,
+        default=TransferSettings().stall_min_rate,
+        help="Media transfers slower than this per second for 30s are resumed "
+        "on a new connection, e.g. 64K [Default: 32K]",
+    )
+    download_parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Race the rest of a stalled transfer on a second connection instead "
+        "of dropping the stalled one",
+    )
+    _add_window_argument(download_parser)
+
+    # Links Subcommand
+    links_parser = subparsers.add_parser(
+        "links", help="Exports course download links for an external downloader"
+    )
+    _add_common_arguments(links_parser)
+    links_parser.add_argument(
+        "-f",
+        "--format",
+        required=False,
+        choices=LinkExporter.FORMATS,
+        default="idm",
+        help="Links file format [Default: idm]",
+    )
+    links_parser.add_argument(
+        "-w",
+        "--workers",
+        required=False,
+        type=int,
+        default=4,
+        help="Number of unit pages fetched concurrently [Default: 4]",
+    )
+    links_parser.add_argument(
+        "--links-file",
+        required=False,
+        type=str,
+        default=None,
+        help="Path to the links file [Default: <output>/<course>/<course>_links.*]",
+    )
+
+    # Serve Subcommand
+    serve_parser = subparsers.add_parser(
+        "serve",
+        aliases=["watch"],
+        help="Keeps a session open and syncs courses from a file on a schedule",
+    )
+    serve_parser.add_argument(
+        "-c",
+        "--cookies",
+        required=False,
+        type=str,
+        default=cookies_default_path,
+        help=f"Path to the cookies file [Default: {cookies_default_path}]",
+    )
+    serve_parser.add_argument(
+        "-o",
+        "--output",
+        required=False,
+        type=str,
+        default=output_default_path,
+        help=f"Path to the output directory [Default: {output_default_path}]",
+    )
+    serve_parser.add_argument(
+        "-f",
+        "--courses-file",
+        required=False,
+        type=str,
+        default="courses.txt",
+        help="File with one course URL per line [Default: courses.txt]",
+    )
+    serve_parser.add_argument(
+        "-i",
+        "--interval",
+        required=False,
+        type=int,
+        default=3600,
+        help="Seconds between sync cycles [Default: 3600]",
+    )
+    serve_parser.add_argument(
+        "-p",
+        "--port",
+        required=False,
+        type=int,
+        default=8765,
+        help="Local port of the status endpoint, 0 to disable [Default: 8765]",
+    )
+    _add_window_argument(serve_parser)
+
+    # Catalog Subcommand
+    catalog_parser = subparsers.add_parser(
+        "catalog", help="Exports the chapter/unit catalog of many courses"
+    )
+    catalog_parser.add_argument(
         "-u",
         "--url",
+        required=False,
+        action="append",
+        default=[],
+        help="Course URL in Maktabkhooneh, can be repeated",
+    )
+    catalog_parser.add_argument(
+        "-f",
+        "--courses-file",
+        required=False,
+        type=str,
+        default=None,
+        help="File with one course URL per line",
+    )
+    catalog_parser.add_argument(
+        "-c",
+        "--cookies",
+        required=False,
+        type=str,
+        default=cookies_default_path,
+        help=f"Path to the cookies file [Default: {cookies_default_path}]",
+    )
+    catalog_parser.add_argument(
+        "-o",
+        "--catalog-file",
         required=True,
         type=str,
-        help="Course URL in Maktabkhooneh",
+        help="Output file; .xlsx, .csv or .parquet",
     )
-    download_parser.add_argument(
+
+    # Enqueue Subcommand
+    enqueue_parser = subparsers.add_parser(
+        "enqueue", help="Plans course units as jobs in a shared job store"
+    )
+    enqueue_parser.add_argument(
+        "-u",
+        "--url",
+        required=False,
+        action="append",
+        default=[],
+        help="Course URL in Maktabkhooneh, can be repeated",
+    )
+    enqueue_parser.add_argument(
+        "-f",
+        "--courses-file",
+        required=False,
+        type=str,
+        default=None,
+        help="File with one course URL per line",
+    )
+    _add_worker_arguments(enqueue_parser)
+
+    # Worker Subcommand
+    worker_parser = subparsers.add_parser(
+        "worker", help="Claims unit jobs from a shared job store and downloads them"
+    )
+    _add_worker_arguments(worker_parser)
+    worker_parser.add_argument(
+        "--lease",
+        required=False,
+        type=int,
+        default=300,
+        help="Seconds a claimed job stays leased without a heartbeat [Default: 300]",
+    )
+    worker_parser.add_argument(
+        "--exit-when-idle",
+        action="store_true",
+        help="Stop once the job store has no pending jobs",
+    )
+    _add_window_argument(worker_parser)
+
+    # Verify Subcommand
+    verify_parser = subparsers.add_parser(
+        "verify", help="Checks downloaded files against the sizes and digests in the index"
+    )
+    verify_parser.add_argument(
+        "-c",
+        "--cookies",
+        required=False,
+        type=str,
+        default=cookies_default_path,
+        help=f"Path to the cookies file, for --redownload [Default: {cookies_default_path}]",
+    )
+    verify_parser.add_argument(
+        "-o",
+        "--output",
+        required=False,
+        type=str,
+        default=output_default_path,
+        help=f"Path to the output directory [Default: {output_default_path}]",
+    )
+    verify_parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Compare sizes and sampled head/middle/tail blocks instead of full digests",
+    )
+    verify_parser.add_argument(
+        "-w",
+        "--workers",
+        required=False,
+        type=int,
+        default=None,
+        help="Files hashed concurrently [Default: number of CPUs]",
+    )
+    verify_parser.add_argument(
+        "--redownload",
+        action="store_true",
+        help="Download the units of missing or mismatched files again",
+    )
+
+    # Retry-failed Subcommand
+    retry_parser = subparsers.add_parser(
+        "retry-failed",
+        help="Downloads again only the units and assets that failed before",
+    )
+    retry_parser.add_argument(
         "-c",
         "--cookies",
         required=False,
@@ -41,7 +352,7 @@ def main():
         default=cookies_default_path,
         help=f"Path to the cookies file [Default: {cookies_default_path}]",
     )
-    download_parser.add_argument(
+    retry_parser.add_argument(
         "-o",
         "--output",
         required=False,
@@ -49,49 +360,650 @@ def main():
         default=output_default_path,
         help=f"Path to the output directory [Default: {output_default_path}]",
     )
+    retry_parser.add_argument(
+        "-u",
+        "--url",
+        required=False,
+        type=str,
+        default=None,
+        help="Only retry failures of this course",
+    )
+    retry_parser.add_argument(
+        "--max-attempts",
+        required=False,
+        type=int,
+        default=5,
+        help="Give up on an item after this many failed attempts [Default: 5]",
+    )
+    retry_parser.add_argument(
+        "--backoff",
+        required=False,
+        type=float,
+        default=60,
+        help="Seconds before the first retry, doubled after every failure [Default: 60]",
+    )
+    retry_parser.add_argument(
+        "--no-wait",
+        action="store_true",
+        help="Only retry what is due now instead of waiting for the next backoff",
+    )
+    retry_parser.add_argument(
+        "--list",
+        action="store_true",
+        help="Print the failure queue without retrying",
+    )
+
+    # Query Subcommand
+    query_parser = subparsers.add_parser(
+        "query", help="Answers inventory and search questions from the local index"
+    )
+    query_parser.add_argument(
+        "--db",
+        required=False,
+        type=str,
+        default=index_default_path,
+        help=f"Path to the index database [Default: {index_default_path}]",
+    )
+    query_parser.add_argument(
+        "action",
+        choices=["search", "stats", "courses"],
+        help="search titles/descriptions, show totals or list indexed courses",
+    )
+    query_parser.add_argument(
+        "text", nargs="*", help="Search text for the search action"
+    )
+    query_parser.add_argument(
+        "-n",
+        "--limit",
+        required=False,
+        type=int,
+        default=50,
+        help="Maximum number of search results [Default: 50]",
+    )
     args = parser.parse_args()
+    try:
+        levels = parse_log_levels(args.log_levels)
+    except ValueError as e:
+        parser.error(str(e))
+    setup_logging(
+        log_file=args.log_file,
+        log_level=args.log_level,
+        json_format=args.log_json,
+        levels=levels,
+    )
 
     if args.command == "download":
-        download_videos(args.url, args.cookies, args.output)
+        try:
+            quality_policy = quality_policy_from_name(args.quality, args.budget)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.sink and (args.blob_store or args.post_process or args.offline):
+            parser.error(
+                "--sink cannot be combined with --blob-store, --post-process or "
+                "--offline, which work on local files"
+            )
+        download_videos(
+            args.url,
+            args.cookies,
+            args.output,
+            args.blob_store,
+            quality_policy,
+            args.parse_workers,
+            args.post_process,
+            args.offline,
+            args.threads,
+            TransferSettings(stall_min_rate=args.stall_rate, hedge=args.hedge),
+            args.sink,
+            args.s3_endpoint,
+            args.lookahead,
+            _transfer_schedule(args.window),
+        )
+    elif args.command in ("serve", "watch"):
+        serve(
+            args.cookies,
+            args.output,
+            args.courses_file,
+            args.interval,
+            args.port,
+            _transfer_schedule(args.window),
+        )
+    elif args.command == "enqueue":
+        enqueue_courses(
+            args.url, args.courses_file, args.cookies, args.output, args.jobs_db
+        )
+    elif args.command == "worker":
+        run_worker(
+            args.cookies,
+            args.output,
+            args.jobs_db,
+            args.lease,
+            args.exit_when_idle,
+            _transfer_schedule(args.window),
+        )
+    elif args.command == "verify":
+        verify_archive(
+            args.cookies, args.output, args.fast, args.workers, args.redownload
+        )
+    elif args.command == "retry-failed":
+        retry_failed(
+            args.cookies,
+            args.output,
+            args.url,
+            args.max_attempts,
+            args.backoff,
+            not args.no_wait,
+            args.list,
+        )
+    elif args.command == "query":
+        query_index(args.db, args.action, " ".join(args.text), args.limit)
+    elif args.command == "catalog":
+        export_courses_catalog(
+            args.url, args.courses_file, args.cookies, args.catalog_file
+        )
+    elif args.command == "links":
+        export_links(
+            args.url,
+            args.cookies,
+            args.output,
+            args.format,
+            args.workers,
+            args.links_file,
+            args.parse_workers,
+        )
 
 
-def download_videos(url: str, cookies: str, output: str):
-    """Loads course information from a URL and downloads videos for that course."""
+def _add_common_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--parse-workers",
+        required=False,
+        type=int,
+        default=0,
+        help="Processes that parse large unit pages, 0 to parse in-process [Default: 0]",
+    )
+    parser.add_argument(
+        "-u",
+        "--url",
+        required=True,
+        type=str,
+        help="Course URL in Maktabkhooneh",
+    )
+    parser.add_argument(
+        "-c",
+        "--cookies",
+        required=False,
+        type=str,
+        default=cookies_default_path,
+        help=f"Path to the cookies file [Default: {cookies_default_path}]",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=False,
+        type=str,
+        default=output_default_path,
+        help=f"Path to the output directory [Default: {output_default_path}]",
+    )
+
+
+def _add_worker_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "-c",
+        "--cookies",
+        required=False,
+        type=str,
+        default=cookies_default_path,
+        help=f"Path to the cookies file [Default: {cookies_default_path}]",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=False,
+        type=str,
+        default=output_default_path,
+        help=f"Path to the output directory [Default: {output_default_path}]",
+    )
+    parser.add_argument(
+        "--jobs-db",
+        required=False,
+        type=str,
+        default=None,
+        help="Path to the shared job store, e.g. on a network volume "
+        "[Default: <output>/maktab_jobs.db]",
+    )
+
+
+def _add_window_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--window",
+        required=False,
+        action="append",
+        type=parse_transfer_window,
+        default=[],
+        help="Local hours in which media may transfer, HH:MM-HH:MM with an optional "
+        "@RATE cap shared by all transfers, e.g. 01:00-07:00@2M; can be repeated. "
+        "Transfers pause outside windows and resume in the next one, while "
+        "crawling continues [Default: always]",
+    )
+
+
+def _transfer_schedule(windows: list) -> TransferSchedule | None:
+    return TransferSchedule(windows) if windows else None
+
+
+def _read_course_urls(urls: list[str], courses_file: str | None) -> list[str]:
+    course_urls = list(urls)
+    if courses_file:
+        with open(courses_file, "r", encoding="utf-8") as f:
+            course_urls.extend(line.strip() for line in f if line.strip())
+    return course_urls
+
+
+def _build_crawler(
+    cookies: str, output: str, read_only: bool = False, **kwargs
+) -> MaktabkhoonehCrawler | None:
+    """
+    Creates a logged-in crawler from the cookies file or by asking for credentials.
+
+    Planning commands pass `read_only` so no index or failure queue files
+    are created in the output directory.
+    """
+    if not read_only:
+        # Every crawl run keeps the local course index in the output directory up to date
+        if "index" not in kwargs:
+            kwargs["index"] = CourseIndex(os.path.join(output, INDEX_FILE_NAME))
+        # ...and queues what failed for `retry-failed`
+        if "failures" not in kwargs:
+            kwargs["failures"] = FailureQueue(os.path.join(output, FAILURES_FILE_NAME))
+    if not os.path.exists(cookies):
+        print(
+            "Cookies file not found. You must Enter Maktabkhooneh Username and Password."
+        )
+        username = input("Enter Username: ")
+        password = input("Enter Password: ")
+        crawler = MaktabkhoonehCrawler(
+            username=username,
+            password=password,
+            cookies_path=cookies,
+            output_path=output,
+            **kwargs,
+        )
+
+        force_save_cookies = get_boolean_manual(
+            f"If you want to save cookies on the path `{cookies}` you selected?"
+        )
+        crawler.login(force_save_cookies=force_save_cookies)
+    else:
+        crawler = MaktabkhoonehCrawler(
+            cookies_path=cookies,
+            output_path=output,
+            **kwargs,
+        )
+        crawler.init_cookies()
+        if len(crawler.client.cookies.jar) == 0:
+            print("No Cookies. Please login first.")
+            return None
+    return crawler
+
+
+def export_links(
+    url: str,
+    cookies: str,
+    output: str,
+    fmt: str = "idm",
+    workers: int = 4,
+    links_file: str | None = None,
+    parse_workers: int = 0,
+):
+    """Loads course information from a URL and exports its download links."""
     try:
-        if not os.path.exists(cookies):
-            print(
-                "Cookies file not found. You must Enter Maktabkhooneh Username and Password."
-            )
-            username = input("Enter Username: ")
-            password = input("Enter Password: ")
-            crawler = MaktabkhoonehCrawler(
-                username=username,
-                password=password,
-                cookies_path=cookies,
-                output_path=output,
-            )
+        crawler = _build_crawler(
+            cookies, output, read_only=True, parse_workers=parse_workers
+        )
+        if crawler is None:
+            return
+        course_info = crawler.crawl_course_link(input_link=url)
+        exporter = LinkExporter(
+            crawler,
+            fmt=fmt,
+            max_workers=workers,
+            checksums=known_checksums(output, course_info.course.slug),
+        )
+        links_file = links_file or exporter.default_file_path(course_info, output)
+        count = exporter.export(course_info, links_file)
+        print(f"Exported {count} links to: {links_file}")
+    except Exception as e:
+        print(f"Error exporting links: {e}")
 
-            force_save_cookies = get_boolean_manual(
-                f"If you want to save cookies on the path `{cookies}` you selected?"
-            )
-            crawler.login(force_save_cookies=force_save_cookies)
+
+def serve(
+    cookies: str,
+    output: str,
+    courses_file: str = "courses.txt",
+    interval: int = 3600,
+    port: int = 8765,
+    schedule: TransferSchedule | None = None,
+):
+    """Runs the sync daemon over the courses listed in a file."""
+    from maktab_dl.daemon import SyncDaemon
+
+    crawler = _build_crawler(cookies, output, schedule=schedule)
+    if crawler is None:
+        return
+    daemon = SyncDaemon(
+        crawler,
+        courses_file=courses_file,
+        interval=interval,
+        status_port=port or None,
+    )
+    daemon.run()
+
+
+def enqueue_courses(
+    urls: list[str],
+    courses_file: str | None,
+    cookies: str,
+    output: str,
+    jobs_db: str | None = None,
+):
+    """Crawls courses and adds a job per unit to the shared job store."""
+    from maktab_dl.jobs import JOBS_FILE_NAME, SQLiteJobStore, enqueue_course
+
+    course_urls = _read_course_urls(urls, courses_file)
+    if not course_urls:
+        print("No course URLs given. Use --url or --courses-file.")
+        return
+    crawler = _build_crawler(cookies, output)
+    if crawler is None:
+        return
+    store = SQLiteJobStore(jobs_db or os.path.join(output, JOBS_FILE_NAME))
+    try:
+        for course_url in course_urls:
+            try:
+                added = enqueue_course(crawler, store, course_url)
+                print(f"Enqueued {added} units from: {course_url}")
+            except Exception as e:
+                print(f"Error enqueueing {course_url}: {e}")
+        print(f"Jobs: {store.counts()}")
+    finally:
+        store.close()
+
+
+def run_worker(
+    cookies: str,
+    output: str,
+    jobs_db: str | None = None,
+    lease: int = 300,
+    exit_when_idle: bool = False,
+    schedule: TransferSchedule | None = None,
+):
+    """Runs a download worker against the shared job store."""
+    from maktab_dl.jobs import JOBS_FILE_NAME, DownloadWorker, SQLiteJobStore
+
+    crawler = _build_crawler(cookies, output, schedule=schedule)
+    if crawler is None:
+        return
+    store = SQLiteJobStore(jobs_db or os.path.join(output, JOBS_FILE_NAME))
+    try:
+        worker = DownloadWorker(
+            crawler, store, lease_seconds=lease, exit_when_idle=exit_when_idle
+        )
+        processed = worker.run()
+        print(f"Worker {worker.worker_id} downloaded {processed} units")
+    finally:
+        store.close()
+        crawler.close()
+
+
+def verify_archive(
+    cookies: str,
+    output: str,
+    fast: bool = False,
+    workers: int | None = None,
+    redownload: bool = False,
+):
+    """Verifies recorded downloads and optionally re-downloads broken units."""
+    from maktab_dl.verify import verify_downloads
+
+    db = os.path.join(output, INDEX_FILE_NAME)
+    if not os.path.exists(db):
+        print(f"Index not found: {db}. Nothing was downloaded with an index yet.")
+        return
+    index = CourseIndex(db)
+    try:
+        results = verify_downloads(
+            index, mode="fast" if fast else "full", max_workers=workers
+        )
+        counts: dict[str, int] = {}
+        for result in results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+        failed = [result for result in results if result.failed]
+        for result in failed:
+            print(f"{result.status:8} {result.path} {result.detail}")
+        print(", ".join(f"{status}: {count}" for status, count in counts.items()))
+        if not (redownload and failed):
+            return
+        unit_ids = {result.unit_id for result in failed if result.unit_id is not None}
+        course_links = index.unit_course_links(unit_ids)
+    finally:
+        index.close()
+
+    # Only files whose unit still resolves to a course can be repaired
+    repairable: dict[str, list] = {}
+    for result in failed:
+        link = course_links.get(result.unit_id)
+        if link is None:
+            print(f"Skipping {result.path}: its unit is not in the index")
+            continue
+        repairable.setdefault(link, []).append(result)
+    if not repairable:
+        return
+
+    # Log in before touching anything, so a failed login loses no files
+    crawler = _build_crawler(
+        cookies,
+        output,
+        blob_store=os.path.isdir(os.path.join(output, STORE_DIR_NAME)),
+    )
+    if crawler is None:
+        return
+    try:
+        for link, course_failed in repairable.items():
+            _redownload_units(crawler, link, course_failed)
+    finally:
+        crawler.close()
+
+
+def _redownload_units(crawler: MaktabkhoonehCrawler, link: str, failed: list) -> None:
+    """
+    Downloads the units of `failed` files of one course again.
+
+    Broken files are moved aside first, since same-size corrupt files would
+    otherwise pass the size check, and put back when no new copy arrives;
+    their units are then left in the failure queue for `retry-failed`.
+    """
+    unit_ids = {result.unit_id for result in failed}
+    moved: dict[str, str] = {}
+    for result in failed:
+        if result.status != "missing" and crawler.blob_store is not None:
+            # The file is a hardlink of its blob, which is just as broken
+            crawler.blob_store.evict(result.url)
+        if os.path.exists(result.path):
+            moved[result.path] = f"{result.path}.broken"
+            os.replace(result.path, moved[result.path])
+    error: Exception | None = None
+    try:
+        course_info = crawler.crawl_course_link(link)
+        crawler.enroll_course_link(course_info.link)
+        crawler.download_course_videos(course_info, unit_ids=unit_ids)
+    except Exception as e:
+        error = e
+        print(f"Error re-downloading {link}: {e}")
+    restored = 0
+    for path, aside in moved.items():
+        if error is None and os.path.exists(path):
+            os.remove(aside)
         else:
-            crawler = MaktabkhoonehCrawler(
-                cookies_path=cookies,
-                output_path=output,
-            )
-            crawler.init_cookies()
-            if len(crawler.client.cookies.jar) == 0:
-                print("No Cookies. Please login first.")
+            os.replace(aside, path)
+            restored += 1
+    if error is not None and crawler.failures is not None:
+        for unit_id in unit_ids:
+            crawler.failures.record(link, unit_id, "unit", link, error)
+    if error is None:
+        print(f"Re-downloaded {len(unit_ids)} units of: {link}")
+    if restored:
+        print(f"Kept {restored} old files of {link} that were not downloaded again")
+
+
+def retry_failed(
+    cookies: str,
+    output: str,
+    url: str | None = None,
+    max_attempts: int = 5,
+    backoff: float = 60,
+    wait: bool = True,
+    list_only: bool = False,
+):
+    """Replays the failure queue of an output directory."""
+    from maktab_dl.failures import FailureReplayer
+
+    db = os.path.join(output, FAILURES_FILE_NAME)
+    if not os.path.exists(db):
+        print(f"Failure queue not found: {db}. Nothing has failed yet.")
+        return
+    queue = FailureQueue(db, backoff=backoff)
+    try:
+        course_link = MaktabkhoonehCrawler._clean_course_link(url) if url else None
+        if list_only:
+            for item in queue.items(course_link):
+                print(
+                    f"{item.kind:8} unit {item.unit_id} x{item.attempts} "
+                    f"{item.error_class}: {item.url}"
+                )
+            print(f"Failures: {queue.counts()}")
+            return
+        crawler = _build_crawler(cookies, output, failures=queue)
+        if crawler is None:
+            return
+        replayer = FailureReplayer(crawler, queue, max_attempts=max_attempts)
+        recovered, remaining = replayer.run(course_link, wait=wait)
+        print(f"Recovered {recovered} units, {remaining} still failing")
+    finally:
+        queue.close()
+
+
+def query_index(db: str, action: str, text: str = "", limit: int = 50):
+    """Prints search results or inventory totals from the local course index."""
+    if not os.path.exists(db):
+        print(f"Index not found: {db}. Crawl or download a course first.")
+        return
+    index = CourseIndex(db)
+    try:
+        if action == "search":
+            if not text:
+                print("Nothing to search for.")
                 return
+            results = index.search(text, limit=limit)
+            for row in results:
+                print(f"[{row['kind']}] {row['title']} — {row['course']}")
+                if row["snippet"]:
+                    print(f"    {row['snippet']}")
+            print(f"{len(results)} results")
+        elif action == "stats":
+            for key, value in index.stats().items():
+                print(f"{key}: {value}")
+        elif action == "courses":
+            for row in index.courses():
+                print(
+                    f"{row['title']} — {row['units']} units, "
+                    f"{row['lectures'] or 0} lectures ({row['link']})"
+                )
+    finally:
+        index.close()
+
+
+def export_courses_catalog(
+    urls: list[str],
+    courses_file: str | None,
+    cookies: str,
+    catalog_file: str,
+):
+    """Crawls courses one by one and streams their catalog to a file."""
+    from maktab_dl.catalog import export_catalog
+
+    course_urls = _read_course_urls(urls, courses_file)
+    if not course_urls:
+        print("No course URLs given. Use --url or --courses-file.")
+        return
+    try:
+        crawler = _build_crawler(cookies, output_default_path, read_only=True)
+        if crawler is None:
+            return
+        count = export_catalog(crawler.iter_course_infos(course_urls), catalog_file)
+        print(f"Exported {count} units to: {catalog_file}")
+    except Exception as e:
+        print(f"Error exporting catalog: {e}")
+
+
+def download_videos(
+    url: str,
+    cookies: str,
+    output: str,
+    blob_store: bool = False,
+    quality_policy: QualityPolicy | None = None,
+    parse_workers: int = 0,
+    post_process: bool = False,
+    offline: bool = False,
+    threads: int = 1,
+    transfer: TransferSettings | None = None,
+    sink_url: str | None = None,
+    s3_endpoint: str | None = None,
+    lookahead: int = 2,
+    schedule: TransferSchedule | None = None,
+):
+    """Loads course information from a URL and downloads videos for that course."""
+    sink = None
+    crawler = None
+    try:
+        if sink_url:
+            from maktab_dl.sinks import S3Sink
 
+            sink = S3Sink.from_url(sink_url, output, endpoint_url=s3_endpoint)
+        post_processor = None
+        if post_process:
+            from maktab_dl.postprocess import PostProcessor
+
+            post_processor = PostProcessor()
+        crawler = _build_crawler(
+            cookies,
+            output,
+            blob_store=blob_store,
+            quality_policy=quality_policy,
+            parse_workers=parse_workers,
+            post_processor=post_processor,
+            transfer=transfer,
+            sink=sink,
+            schedule=schedule,
+        )
+        if crawler is None:
+            return
         course_info = crawler.crawl_course_link(input_link=url)
         cleaned_link = course_info.link
         crawler.enroll_course_link(cleaned_link)
-        crawler.download_course_videos(course_info)
+        crawler.download_course_videos(
+            course_info, max_threads=threads, lookahead=lookahead
+        )
+        if offline:
+            from maktab_dl.localizer import AssetLocalizer
+
+            AssetLocalizer(crawler).localize_course(course_info)
         print(f"Finished downloading course videos from: {cleaned_link}")
     except Exception as e:
         print(f"Error downloading videos: {e}")
+    finally:
+        if crawler is not None:
+            crawler.close()
+        elif sink is not None:
+            sink.close()
 
 
 if __name__ == "__main__":
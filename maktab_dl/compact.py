@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import sys
+from typing import TYPE_CHECKING, Iterator, NamedTuple
+
+if TYPE_CHECKING:
+    from maktab_dl.index import CourseIndex
+    from maktab_dl.schemas import CourseInfo
+
+
+class CompactUnit(NamedTuple):
+    id: int
+    title: str
+    slug: str
+    type: str
+    attachment: bool = False
+    project_required: bool = False
+    inactive: bool = False
+
+
+class CompactChapter(NamedTuple):
+    id: int
+    title: str
+    slug: str
+    unit_set: tuple[CompactUnit, ...] = ()
+
+
+class CompactCourseModel(NamedTuple):
+    slug_id: int | None
+    slug: str
+    title: str
+
+
+class CompactChapters(NamedTuple):
+    chapters: tuple[CompactChapter, ...] = ()
+
+
+class CompactCourse(NamedTuple):
+    """
+    Read-only stand-in for `CourseInfo` with only what downloads are planned by.
+
+    Attribute paths match the schemas (``course.title``,
+    ``chapters.chapters``, ``unit_set``), so `OutputLayout` and the unit
+    download code take either. Descriptions are left out; `CompactCatalog`
+    reads them from the index on demand.
+    """
+
+    link: str
+    course: CompactCourseModel
+    chapters: CompactChapters
+
+    def units(self) -> Iterator[tuple[CompactChapter, CompactUnit]]:
+        for chapter in self.chapters.chapters:
+            for unit in chapter.unit_set:
+                yield chapter, unit
+
+
+def _compact_unit(unit) -> CompactUnit:
+    return CompactUnit(
+        unit.id,
+        unit.title,
+        unit.slug,
+        # A handful of distinct values shared by every unit
+        sys.intern(unit.type),
+        bool(unit.attachment),
+        bool(unit.project_required),
+        bool(unit.inactive),
+    )
+
+
+def compact_course(course_info: CourseInfo) -> CompactCourse:
+    """Copy the planning fields of a crawled course into compact records."""
+    course = course_info.course
+    return CompactCourse(
+        course_info.link,
+        CompactCourseModel(course.slug_id, course.slug, course.title),
+        CompactChapters(
+            tuple(
+                CompactChapter(
+                    chapter.id,
+                    chapter.title,
+                    chapter.slug,
+                    tuple(_compact_unit(unit) for unit in chapter.unit_set),
+                )
+                for chapter in course_info.chapters.chapters
+            )
+        ),
+    )
+
+
+class CompactCatalog:
+    """
+    Many courses held as `CompactCourse` records, keyed by course link.
+
+    Use it where thousands of courses are planned or scheduled at once;
+    a course costs a few hundred bytes plus its titles and slugs instead of
+    a tree of validated models with every description. Build it from
+    crawls with `add`, or straight from the local index with `from_index`.
+    """
+
+    def __init__(self, index: CourseIndex | None = None):
+        self.index = index
+        self._courses: dict[str, CompactCourse] = {}
+
+    def add(self, course: CourseInfo | CompactCourse) -> CompactCourse:
+        if not isinstance(course, CompactCourse):
+            course = compact_course(course)
+        self._courses[course.link] = course
+        return course
+
+    def get(self, link: str) -> CompactCourse | None:
+        return self._courses.get(link)
+
+    def __contains__(self, link: str) -> bool:
+        return link in self._courses
+
+    def __iter__(self) -> Iterator[CompactCourse]:
+        return iter(self._courses.values())
+
+    def __len__(self) -> int:
+        return len(self._courses)
+
+    def unit_count(self) -> int:
+        return sum(
+            len(chapter.unit_set)
+            for course in self._courses.values()
+            for chapter in course.chapters.chapters
+        )
+
+    def description(self, unit_id: int) -> str:
+        """Description of a unit, read from the index."""
+        if self.index is None:
+            return ""
+        return self.index.unit_description(unit_id) or ""
+
+    @classmethod
+    def from_index(cls, index: CourseIndex) -> CompactCatalog:
+        """Load every indexed course without building schema models."""
+        catalog = cls(index)
+        units: dict[int, list[CompactUnit]] = {}
+        for row in index.unit_rows():
+            units.setdefault(row[0], []).append(
+                CompactUnit(
+                    row[1],
+                    row[2],
+                    row[3],
+                    sys.intern(row[4] or ""),
+                    bool(row[5]),
+                    bool(row[6]),
+                    bool(row[7]),
+                )
+            )
+        chapters: dict[str, list[CompactChapter]] = {}
+        for course_slug, chapter_id, title, slug in index.chapter_rows():
+            chapters.setdefault(course_slug, []).append(
+                CompactChapter(chapter_id, title, slug, tuple(units.get(chapter_id, ())))
+            )
+        for course_row in index.courses():
+            slug = course_row["slug"]
+            catalog.add(
+                CompactCourse(
+                    course_row["link"],
+                    CompactCourseModel(
+                        course_row["slug_id"], slug, course_row["title"]
+                    ),
+                    CompactChapters(tuple(chapters.get(slug, ()))),
+                )
+            )
+        return catalog
@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from maktab_dl.layout import OutputLayout
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class SyncDaemon:
+    """
+    Keeps one authenticated crawler alive and syncs courses on a schedule.
+
+    Every `interval` seconds each course listed in `courses_file` is
+    re-crawled (two API calls) and only units whose content is missing on
+    disk are downloaded. Changes to `courses_file` are picked up within
+    `watch_interval` seconds and new courses are synced right away. A JSON
+    status document is served on ``http://<status_host>:<status_port>/status``.
+    """
+
+    def __init__(
+        self,
+        crawler,
+        courses_file: str = "courses.txt",
+        interval: int = 3600,
+        status_host: str = "127.0.0.1",
+        status_port: int | None = 8765,
+        watch_interval: int = 5,
+    ):
+        self.crawler = crawler
+        self.courses_file = courses_file
+        self.interval = interval
+        self.status_host = status_host
+        self.status_port = status_port
+        self.watch_interval = watch_interval
+        self.course_urls: list[str] = []
+        self._courses_mtime: float | None = None
+        self._enrolled: set[str] = set()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+        self.status: dict = {
+            "state": "starting",
+            "started_at": _now(),
+            "cycles": 0,
+            "last_cycle_started": None,
+            "last_cycle_finished": None,
+            "next_cycle": None,
+            "courses": {},
+        }
+
+    def _set_status(self, **kwargs) -> None:
+        with self._lock:
+            self.status.update(kwargs)
+
+    def _set_course_status(self, url: str, **kwargs) -> None:
+        with self._lock:
+            self.status["courses"].setdefault(url, {}).update(kwargs)
+
+    def status_json(self) -> str:
+        schedule = getattr(self.crawler, "schedule", None)
+        with self._lock:
+            if schedule is not None:
+                self.status["transfers"] = schedule.state()
+            return json.dumps(self.status, ensure_ascii=False, indent=2)
+
+    def _load_courses(self) -> list[str]:
+        """Reloads `courses_file` when it changed and returns newly added URLs."""
+        try:
+            mtime = os.path.getmtime(self.courses_file)
+        except OSError:
+            logging.error(f"Courses file not found: {self.courses_file}")
+            return []
+        if mtime == self._courses_mtime:
+            return []
+        self._courses_mtime = mtime
+        with open(self.courses_file, "r", encoding="utf-8") as f:
+            urls = [line.strip() for line in f if line.strip()]
+        added = [url for url in urls if url not in self.course_urls]
+        removed = [url for url in self.course_urls if url not in urls]
+        self.course_urls = urls
+        with self._lock:
+            for url in removed:
+                self.status["courses"].pop(url, None)
+        if added or removed:
+            logging.info(
+                f"Courses file changed: {len(added)} added, {len(removed)} removed"
+            )
+        return added
+
+    def _recorded_sizes(self, course_slug: str) -> dict[str, int] | None:
+        """Sizes of the finished downloads of a course, from the crawler's index."""
+        course_index = getattr(self.crawler, "index", None)
+        if course_index is None:
+            return None
+        return {
+            row["path"]: row["size"]
+            for row in course_index.downloads(course_slug, state="done")
+            if row["size"]
+        }
+
+    def sync_course(self, course_url: str) -> int:
+        """Downloads the units of a course that are missing on disk; returns their count."""
+        self._set_course_status(course_url, state="syncing")
+        try:
+            course_info = self.crawler.crawl_course_link(course_url)
+            if course_url not in self._enrolled:
+                self.crawler.enroll_course_link(course_info.link)
+                self._enrolled.add(course_url)
+            layout = OutputLayout(self.crawler.output_path, course_info)
+            index = layout.build_index()
+            recorded = self._recorded_sizes(course_info.course.slug)
+            missing = {
+                paths.unit.id
+                for paths in layout.units()
+                if not layout.is_complete(paths.unit.id, index, recorded)
+            }
+            self._set_course_status(
+                course_url,
+                title=course_info.course.title,
+                units=len(layout.units()),
+                missing=len(missing),
+            )
+            if missing:
+                logging.info(
+                    f"Syncing {len(missing)} new or missing units of {course_info.course.title}"
+                )
+                self.crawler.download_course_videos(course_info, unit_ids=missing)
+            else:
+                logging.info(f"Course is up to date: {course_info.course.title}")
+            self._set_course_status(
+                course_url, state="idle", last_sync=_now(), last_error=None
+            )
+            return len(missing)
+        except Exception as e:
+            logging.error(f"Error syncing course {course_url}: {e}")
+            self._set_course_status(course_url, state="error", last_error=str(e))
+            return 0
+
+    def sync_all(self) -> None:
+        self._set_status(state="syncing", last_cycle_started=_now())
+        for course_url in list(self.course_urls):
+            if self._stop.is_set():
+                break
+            self.sync_course(course_url)
+        with self._lock:
+            self.status["cycles"] += 1
+            self.status["state"] = "idle"
+            self.status["last_cycle_finished"] = _now()
+
+    def _start_status_server(self) -> None:
+        if self.status_port is None:
+            return
+        daemon = self
+
+        class StatusHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/status"):
+                    self.send_error(404)
+                    return
+                body = daemon.status_json().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug(f"Status request: {format % args}")
+
+        self._server = ThreadingHTTPServer(
+            (self.status_host, self.status_port), StatusHandler
+        )
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logging.info(
+            f"Status endpoint on http://{self.status_host}:{self._server.server_port}/status"
+        )
+
+    def run(self) -> None:
+        """Runs sync cycles until `stop` is called or the process is interrupted."""
+        self._start_status_server()
+        try:
+            self._load_courses()
+            next_cycle = time.monotonic()
+            while not self._stop.is_set():
+                if time.monotonic() >= next_cycle:
+                    self.sync_all()
+                    next_cycle = time.monotonic() + self.interval
+                    self._set_status(
+                        next_cycle=datetime.fromtimestamp(
+                            time.time() + self.interval
+                        ).strftime("%Y-%m-%d %H:%M:%S")
+                    )
+                self._stop.wait(self.watch_interval)
+                for course_url in self._load_courses():
+                    self.sync_course(course_url)
+        except KeyboardInterrupt:
+            logging.info("Stopping sync daemon")
+        finally:
+            self._set_status(state="stopped")
+            if self._server is not None:
+                self._server.shutdown()
+                self._server.server_close()
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import TYPE_CHECKING
+from maktab_dl.index import INDEX_FILE_NAME, CourseIndex
+from maktab_dl.layout import OutputLayout
+from maktab_dl.store import STORE_DIR_NAME, BlobStore
+from maktab_dl.utils import sanitize_filename
+
+if TYPE_CHECKING:
+    from maktab_dl.schemas import CourseInfo
+
+
+def known_checksums(output_path: str, course_slug: str | None = None) -> dict[str, str]:
+    """
+    ``sha-256=<hex>`` digests of files already downloaded into `output_path`,
+    from its blob store and course index, keyed by URL without query string.
+    Nothing is created when neither exists.
+    """
+    checksums: dict[str, str] = {}
+    store_index = os.path.join(output_path, STORE_DIR_NAME, BlobStore.INDEX_FILE)
+    if os.path.exists(store_index):
+        try:
+            with open(store_index, "r", encoding="utf-8") as f:
+                for key, entry in json.load(f).items():
+                    checksums[key] = f"sha-256={entry['sha256']}"
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"Ignoring unreadable blob store index {store_index}: {e}")
+    db = os.path.join(output_path, INDEX_FILE_NAME)
+    if os.path.exists(db):
+        index = CourseIndex(db)
+        try:
+            for row in index.downloads(course_slug, state="done"):
+                if row["url"] and row["sha256"]:
+                    key = BlobStore.url_key(row["url"])
+                    checksums[key] = f"sha-256={row['sha256']}"
+        finally:
+            index.close()
+    return checksums
+
+
+class LinkExporter:
+    """
+    Streams the download links of a course into a downloader input file.
+
+    Unit pages are fetched concurrently through the crawler but links are
+    written in course order as soon as each page is resolved.
+
+    Formats:
+        idm: one URL per line with ``#`` comments, for IDM-style importers.
+        aria2: an aria2c input file with ``dir=``/``out=`` options so files
+            land in the same layout ``download_course_videos`` uses.
+    """
+
+    FORMATS = ("idm", "aria2")
+    EXTENSIONS = {"idm": "_links.txt", "aria2": "_links.aria2"}
+
+    def __init__(
+        self,
+        crawler,
+        fmt: str = "idm",
+        max_workers: int = 4,
+        split: int = 8,
+        checksums: dict[str, str] | None = None,
+    ):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unknown link format: {fmt}")
+        self.crawler = crawler
+        self.fmt = fmt
+        self.max_workers = max_workers
+        # aria2c connections per video; small files are fetched in one piece
+        self.split = split
+        # url -> "sha-256=<hex>" when a digest is known ahead of time, see
+        # `known_checksums`
+        self.checksums: dict[str, str] = checksums or {}
+
+    def default_file_path(self, course_info: CourseInfo, output_path: str) -> str:
+        course_name = sanitize_filename(course_info.course.title)
+        return os.path.join(
+            output_path, course_name, f"{course_name}{self.EXTENSIONS[self.fmt]}"
+        )
+
+    def export(self, course_info: CourseInfo, links_file: str) -> int:
+        """Write all links of a course to `links_file` and return their count."""
+        os.makedirs(os.path.dirname(os.path.abspath(links_file)), exist_ok=True)
+        layout = OutputLayout(self.crawler.output_path, course_info)
+        count = 0
+        with open(links_file, "w", encoding="utf-8") as f:
+            f.write(f"# Course: {course_info.course.title}\n")
+            pages = self.crawler.iter_unit_pages(
+                course_info, max_workers=self.max_workers
+            )
+            for i, chapter, j, unit, unit_links in pages:
+                if j == 0:
+                    f.write(f"# Chapter: {chapter.title}\n")
+                if unit_links is None:
+                    logging.error(f"Skipping links for unit {unit.title}")
+                    continue
+                paths = layout.unit(unit.id)
+                links = self.crawler._collect_unit_links(
+                    unit_links, paths.chapter_directory, paths.unit_name, unit
+                )
+                for kind, url, output_file in links:
+                    self._write_link(f, kind, url, output_file)
+                    count += 1
+                f.flush()
+        logging.info(f"Exported {count} links to {links_file}")
+        return count
+
+    def _write_link(self, f, kind: str, url: str, output_file: str) -> None:
+        f.write(f"{url}\n")
+        if self.fmt != "aria2":
+            return
+        f.write(f"  dir={os.path.dirname(output_file)}\n")
+        f.write(f"  out={os.path.basename(output_file)}\n")
+        if kind == "video" and self.split > 1:
+            f.write(f"  split={self.split}\n")
+            f.write(f"  max-connection-per-server={min(self.split, 16)}\n")
+        checksum = self.checksums.get(url) or self.checksums.get(
+            BlobStore.url_key(url)
+        )
+        if checksum:
+            f.write(f"  checksum={checksum}\n")
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, NamedTuple
+from maktab_dl.compact import CompactCourse, compact_course
+from maktab_dl.layout import OutputLayout
+
+if TYPE_CHECKING:
+    from maktab_dl.handler import MaktabkhoonehCrawler
+
+FAILURES_FILE_NAME = "maktab_failures.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS failures (
+    course_link TEXT NOT NULL,
+    unit_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    error_class TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    first_failed_at REAL,
+    updated_at REAL,
+    next_attempt_at REAL,
+    PRIMARY KEY (course_link, unit_id, kind, url)
+);
+CREATE INDEX IF NOT EXISTS failures_due ON failures (next_attempt_at);
+"""
+
+
+class FailedItem(NamedTuple):
+    course_link: str
+    unit_id: int
+    # unit, video, subtitle or file
+    kind: str
+    url: str
+    error_class: str
+    error: str
+    attempts: int
+    next_attempt_at: float
+
+
+def failed_url(error: BaseException, default: str) -> str:
+    """URL of the request an HTTP error came from, else `default`."""
+    try:
+        return str(error.request.url)
+    except (AttributeError, RuntimeError):
+        return default
+
+
+class FailureQueue:
+    """
+    Dead-letter queue of units and assets that failed to download.
+
+    Each failure is kept per ``(course, unit, kind, url)`` with the error
+    class, message and attempt count. Failing again pushes the next retry
+    out exponentially from `backoff` seconds, up to `max_backoff`.
+    """
+
+    def __init__(
+        self, path: str, backoff: float = 60.0, max_backoff: float = 6 * 3600
+    ):
+        self.path = path
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.close()
+
+    def record(
+        self,
+        course_link: str,
+        unit_id: int,
+        kind: str,
+        url: str,
+        error: BaseException,
+    ) -> int:
+        """Adds or updates a failure; returns its attempt count."""
+        now = time.time()
+        with self._lock:
+            db = self.connection
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT attempts FROM failures "
+                    "WHERE course_link = ? AND unit_id = ? AND kind = ? AND url = ?",
+                    (course_link, unit_id, kind, url),
+                ).fetchone()
+                attempts = row[0] + 1 if row else 1
+                delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+                db.execute(
+                    """
+                    INSERT INTO failures (course_link, unit_id, kind, url, error_class,
+                                          error, attempts, first_failed_at, updated_at,
+                                          next_attempt_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (course_link, unit_id, kind, url) DO UPDATE SET
+                        error_class = excluded.error_class,
+                        error = excluded.error,
+                        attempts = excluded.attempts,
+                        updated_at = excluded.updated_at,
+                        next_attempt_at = excluded.next_attempt_at
+                    """,
+                    (
+                        course_link,
+                        unit_id,
+                        kind,
+                        url,
+                        type(error).__name__,
+                        str(error),
+                        attempts,
+                        now,
+                        now,
+                        now + delay,
+                    ),
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return attempts
+
+    def items(self, course_link: str | None = None) -> list[FailedItem]:
+        sql = (
+            "SELECT course_link, unit_id, kind, url, error_class, error, attempts, "
+            "next_attempt_at FROM failures"
+        )
+        params: tuple = ()
+        if course_link is not None:
+            sql += " WHERE course_link = ?"
+            params = (course_link,)
+        with self._lock:
+            rows = self.connection.execute(
+                sql + " ORDER BY course_link, unit_id, kind", params
+            ).fetchall()
+        return [FailedItem(*row) for row in rows]
+
+    def units(
+        self, course_link: str | None = None, max_attempts: int | None = None
+    ) -> list[tuple[str, int, float]]:
+        """``(course_link, unit_id, due_at)`` of units with failures left to retry."""
+        sql = (
+            "SELECT course_link, unit_id, max(next_attempt_at) FROM failures "
+            "WHERE ? IS NULL OR course_link = ? GROUP BY course_link, unit_id "
+            "HAVING ? IS NULL OR max(attempts) < ? ORDER BY 3"
+        )
+        with self._lock:
+            return self.connection.execute(
+                sql, (course_link, course_link, max_attempts, max_attempts)
+            ).fetchall()
+
+    def resolve(self, course_link: str, unit_id: int, before: float) -> int:
+        """
+        Drops failures of a unit not seen again since `before`; returns how
+        many are left for it.
+        """
+        with self._lock:
+            db = self.connection
+            db.execute(
+                "DELETE FROM failures "
+                "WHERE course_link = ? AND unit_id = ? AND updated_at < ?",
+                (course_link, unit_id, before),
+            )
+            return db.execute(
+                "SELECT count(*) FROM failures WHERE course_link = ? AND unit_id = ?",
+                (course_link, unit_id),
+            ).fetchone()[0]
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT kind, count(*) FROM failures GROUP BY kind"
+            ).fetchall()
+        return dict(rows)
+
+
+class FailureReplayer:
+    """
+    Retries only the units in a `FailureQueue`, across any number of courses.
+
+    A unit is downloaded again once all of its failures are due; files that
+    are already complete are skipped by the usual size checks, so only the
+    failed assets transfer again. Items that reach `max_attempts` stay in
+    the queue for inspection but are no longer retried.
+    """
+
+    def __init__(
+        self,
+        crawler: MaktabkhoonehCrawler,
+        queue: FailureQueue,
+        max_attempts: int = 5,
+    ):
+        self.crawler = crawler
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self._courses: dict[str, tuple[CompactCourse, OutputLayout]] = {}
+
+    def _course(self, course_link: str) -> tuple[CompactCourse, OutputLayout]:
+        if course_link not in self._courses:
+            course_info = compact_course(self.crawler.crawl_course_link(course_link))
+            self.crawler.enroll_course_link(course_info.link)
+            self.crawler.quality_policy.start_course(course_info)
+            self._courses[course_link] = (
+                course_info,
+                OutputLayout(self.crawler.output_path, course_info),
+            )
+        return self._courses[course_link]
+
+    def retry_unit(self, course_link: str, unit_id: int) -> bool:
+        """Downloads a failed unit again; True when nothing failed this time."""
+        started = time.time()
+        unit_url = course_link
+        try:
+            course_info, layout = self._course(course_link)
+            paths = layout.unit(unit_id)
+            unit_url = self.crawler._unit_url(
+                course_info.link, paths.chapter, paths.unit
+            )
+            self.crawler._download_unit(course_info.link, paths)
+        except Exception as e:
+            logging.error(f"Retry of unit {unit_id} failed: {e}")
+            self.queue.record(
+                course_link, unit_id, "unit", failed_url(e, unit_url), e
+            )
+        return self.queue.resolve(course_link, unit_id, started) == 0
+
+    def run(self, course_link: str | None = None, wait: bool = True) -> tuple[int, int]:
+        """
+        Retries due units until none are left, sleeping until the next one is
+        due unless `wait` is off. Returns ``(recovered, still_failing)`` units.
+        """
+        recovered = 0
+        while True:
+            pending = self.queue.units(course_link, self.max_attempts)
+            now = time.time()
+            due = [(link, unit_id) for link, unit_id, due_at in pending if due_at <= now]
+            if not due:
+                if not pending or not wait:
+                    break
+                delay = pending[0][2] - now
+                logging.info(f"Next retry of {len(pending)} units in {delay:.0f} seconds")
+                time.sleep(delay)
+                continue
+            for link, unit_id in due:
+                logging.info(f"Retrying unit {unit_id} of {link}")
+                if self.retry_unit(link, unit_id):
+                    recovered += 1
+        if self.crawler.post_processor is not None:
+            self.crawler.post_processor.wait()
+        self.crawler.validators.save()
+        if self.crawler.blob_store is not None:
+            self.crawler.blob_store.save()
+        return recovered, len(self.queue.units(course_link))
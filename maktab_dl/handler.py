@@ -1,23 +1,86 @@
-import httpx
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, AsyncIterator, Iterator
 from maktab_dl.utils import (
     save_cookies,
     load_cookies,
     sanitize_filename,
     get_cookies_default_file_path,
 )
-import logging
-from maktab_dl.schemas import (
-    LoginResponse,
-    UserInfo,
-    CourseModel,
-    CourseChaptersModel,
-    CourseInfo,
+from maktab_dl.layout import Asset, OutputLayout, UnitPaths
+from maktab_dl.parsing import (
+    PARSE_OFFLOAD_MIN_SIZE,
+    UnitLinks,
+    UnitLinkScanner,
+    extract_unit_links,
+    scan_unit_file,
+)
+from maktab_dl.manifest import (
+    SegmentDownloader,
+    Track,
+    manifest_kind,
+    parse_dash,
+    parse_hls_master,
+    parse_hls_media,
+)
+from maktab_dl.quality import (
+    HighestQualityPolicy,
+    QualityPolicy,
+    VideoCandidate,
+    rank_video_links,
+)
+from maktab_dl.failures import FailureQueue, failed_url
+from maktab_dl.logging import clear_log_context, set_log_context
+from maktab_dl.store import STORE_DIR_NAME, BlobStore
+from maktab_dl.transfer import (
+    HedgedRange,
+    PartialFile,
+    StallDetector,
+    TransferPaused,
+    TransferSettings,
+    TransferStalled,
 )
-from tqdm import tqdm
+from maktab_dl.verify import sample_digest
+from maktab_dl.validators import (
+    ValidatorStore,
+    write_if_changed,
+    write_stream_if_changed,
+)
+import hashlib
+import logging
 import os
-import lxml.html
 import random
+import threading
 import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+# httpx, lxml, tqdm and the pydantic schemas are imported where they are
+# used, so importing the crawler (and starting the CLI) stays cheap
+if TYPE_CHECKING:
+    import httpx
+    from maktab_dl.index import CourseIndex
+    from maktab_dl.postprocess import PostProcessor
+    from maktab_dl.sinks import StorageSink
+    from maktab_dl.transfer import TransferSchedule
+    from maktab_dl.tuning import ConcurrencyTuner
+    from maktab_dl.schemas import (
+        UserInfo,
+        CourseModel,
+        CourseChaptersModel,
+        CourseInfo,
+        Chapter,
+        Unit,
+    )
+
+
+def _range_validator(headers) -> str | None:
+    """Strong validator for ``If-Range``; weak ETags are not allowed there."""
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("last-modified")
 
 
 class MaktabkhoonehCrawler:
@@ -35,6 +98,18 @@ class MaktabkhoonehCrawler:
         cookies_path: str | None = None,
         output_path: str | None = None,
         proxy: str | None = None,
+        blob_store: bool = False,
+        segment_workers: int = 4,
+        quality_policy: QualityPolicy | None = None,
+        video_sizes: dict[str, int] | None = None,
+        index: CourseIndex | None = None,
+        parse_workers: int = 0,
+        post_processor: PostProcessor | None = None,
+        tuner: ConcurrencyTuner | None = None,
+        transfer: TransferSettings | None = None,
+        failures: FailureQueue | None = None,
+        sink: StorageSink | None = None,
+        schedule: TransferSchedule | None = None,
         *args,
         **kwargs,
     ):
@@ -65,11 +140,46 @@ class MaktabkhoonehCrawler:
         if os.path.exists(self.output_path) is False:
             os.makedirs(self.output_path)
         self.proxy = proxy
+        # Optional content-addressed store that dedups repeated files
+        self.blob_store: BlobStore | None = (
+            BlobStore(os.path.join(self.output_path, STORE_DIR_NAME))
+            if blob_store
+            else None
+        )
+        # Parallel segment fetches per HLS/DASH video
+        self.segment_workers = segment_workers
+        # Which video variant to download, and sizes already known from a plan
+        self.quality_policy: QualityPolicy = quality_policy or HighestQualityPolicy()
+        self.video_sizes: dict[str, int] = video_sizes or {}
+        # Optional SQLite index of crawled courses and finished downloads
+        self.index: CourseIndex | None = index
+        # Processes that parse large unit pages off the GIL; 0 parses inline
+        self.parse_workers = parse_workers
+        self._parse_executor: ProcessPoolExecutor | None = None
+        self._parse_lock = threading.Lock()
+        # Optional hooks run on finished assets while transfers continue
+        self.post_processor: PostProcessor | None = post_processor
+        # Gate for concurrent media transfers, sized from measured goodput
+        self.tuner: ConcurrencyTuner | None = tuner
+        # Read timeouts, stall detection and hedging of media transfers
+        self.transfer: TransferSettings = transfer or TransferSettings()
+        # Optional dead-letter queue of failed units and assets to replay
+        self.failures: FailureQueue | None = failures
+        # Optional remote storage that takes downloads instead of output_path
+        self.sink: StorageSink | None = sink
+        # Optional hours and bandwidth caps for media transfers
+        self.schedule: TransferSchedule | None = schedule
+        # Unit being processed by the current thread, for bookkeeping
+        self._unit_context = threading.local()
+        # ETag/Last-Modified of subtitles and saved pages for conditional syncs
+        self.validators = ValidatorStore(self.output_path)
         super().__init__(*args, **kwargs)
 
     @property
     def client(self) -> httpx.Client:
         if self._client is None:
+            import httpx
+
             self._client = httpx.Client(follow_redirects=True, proxy=self.proxy)
         return self._client
 
@@ -88,15 +198,36 @@ class MaktabkhoonehCrawler:
         params: dict | None = None,
         data: dict | None = None,
         files: list | None = None,
+        stream: bool = False,
     ):
+        """
+        Send a request with retries. With `stream` the body is not read; the
+        caller iterates it and must close the response.
+        """
+        import httpx
+
         for i in range(3):
             try:
-                response = self.client.request(
-                    method, url, headers=headers, params=params, data=data, files=files
+                response = self.client.send(
+                    self.client.build_request(
+                        method,
+                        url,
+                        headers=headers,
+                        params=params,
+                        data=data,
+                        files=files,
+                    ),
+                    stream=stream,
                 )
+                if response.status_code == 304:
+                    # Answer to a conditional request; the caller keeps its copy
+                    return response
                 response.raise_for_status()
                 break
             except httpx.HTTPStatusError as e:
+                if stream:
+                    # Error bodies are small; read them so the connection is freed
+                    e.response.read()
                 if e.response.status_code == 429:
                     logging.error("Too many requests. Sleeping for 60 seconds")
                     time.sleep(60)
@@ -121,6 +252,8 @@ class MaktabkhoonehCrawler:
     # other methods and attributes
 
     def login(self, force_save_cookies: bool = True) -> UserInfo | None:
+        from maktab_dl.schemas import LoginResponse, UserInfo
+
         url = f"{self.AUTH_API_URL}/check-active-user"
         payload = {"tessera": self.username, "g-recaptcha-response": "recaptcha-token"}
 
@@ -164,7 +297,8 @@ class MaktabkhoonehCrawler:
             save_cookies(self.client, self.cookies_path)
         return self.user_info
 
-    def _clean_course_link(self, link: str) -> str:
+    @staticmethod
+    def _clean_course_link(link: str) -> str:
         logging.info(f"Cleaning course link: {link}")
         if not link.startswith("https://"):
             link = "https://" + link.replace("http://", "")
@@ -176,6 +310,8 @@ class MaktabkhoonehCrawler:
         return cleaned
 
     def _crawl_course(self, course_name: str) -> CourseModel:
+        from maktab_dl.schemas import CourseModel
+
         logging.info(f"Crawling course info: {course_name}")
         url = f"{self.COURSE_API_URL}/{course_name}"
         response = self.request(url=url)
@@ -184,6 +320,8 @@ class MaktabkhoonehCrawler:
         return output
 
     def _crawl_course_chapters(self, course_name: str) -> CourseChaptersModel:
+        from maktab_dl.schemas import CourseChaptersModel
+
         logging.info(f"Crawling course chapters: {course_name}")
 
         url = f"{self.COURSE_API_URL}/{course_name}chapters/"
@@ -193,6 +331,8 @@ class MaktabkhoonehCrawler:
         return output
 
     def crawl_course_link(self, input_link: str) -> CourseInfo:
+        from maktab_dl.schemas import CourseInfo
+
         link = self._clean_course_link(input_link)
         logging.info(f"Course info crawl started for link: {link}")
         logging.info(f"Extract Course name from link: {link}")
@@ -200,10 +340,25 @@ class MaktabkhoonehCrawler:
         course = self._crawl_course(course_name)
         chapters = self._crawl_course_chapters(course_name)
         output = CourseInfo(link=link, course=course, chapters=chapters)
+        if self.index is not None:
+            try:
+                self.index.upsert_course(output)
+            except Exception as e:
+                logging.error(f"Error indexing course {link}: {e}")
         logging.info(f"Course info crawl finished for link: {link}")
         return output
 
+    def iter_course_infos(self, course_urls):
+        """Crawl courses one at a time, skipping (and logging) the ones that fail."""
+        for course_url in course_urls:
+            try:
+                yield self.crawl_course_link(course_url)
+            except Exception as e:
+                logging.error(f"Error crawling course {course_url}: {e}")
+
     def enroll_course_link(self, link: str) -> CourseModel:
+        from maktab_dl.schemas import CourseModel
+
         logging.info(f"Enroll course started for link: {link}")
         logging.info(f"Extract Course name from link: {link}")
         course_name = link.split("course/")[-1]
@@ -213,52 +368,713 @@ class MaktabkhoonehCrawler:
         logging.info(f"Enroll course finished for link: {link}")
         return CourseModel(**response.json())
 
+    def _absolute_url(self, link: str) -> str:
+        return f"{self.BASE_URL}{link}" if not link.startswith("http") else link
+
+    def _unit_url(self, course_link: str, chapter: Chapter, unit: Unit) -> str:
+        chapter_url = f"{chapter.slug}-ch{chapter.id}"
+        return f"{course_link}{chapter_url}/{unit.slug}/"
+
+    def _parse_unit_page(self, response_text: str) -> UnitLinks:
+        """Extract the links of a unit page, in a parse worker when it is large."""
+        if self.parse_workers <= 0 or len(response_text) < PARSE_OFFLOAD_MIN_SIZE:
+            return extract_unit_links(response_text)
+        with self._parse_lock:
+            if self._parse_executor is None:
+                self._parse_executor = ProcessPoolExecutor(
+                    max_workers=self.parse_workers
+                )
+        return self._parse_executor.submit(extract_unit_links, response_text).result()
+
+    def close_parse_pool(self) -> None:
+        with self._parse_lock:
+            if self._parse_executor is not None:
+                self._parse_executor.shutdown()
+                self._parse_executor = None
+
+    def close(self) -> None:
+        """Release worker processes and flush the blob index and storage sink at the end of a run."""
+        self.close_parse_pool()
+        if self.blob_store is not None:
+            self.blob_store.save()
+        if self.sink is not None:
+            self.sink.close()
+
+    def _scan_unit_page(
+        self, unit_url: str, content_file: str | None = None
+    ) -> UnitLinks:
+        """
+        Stream a unit page through the link scanner.
+
+        With `content_file` the page is also written there as UTF-8 while it
+        arrives, revalidated like `_revalidate` does, so the whole body is
+        never held in memory. Pages bound for parse workers are buffered.
+        """
+        if content_file is None and self.parse_workers > 0:
+            response = self.request(url=unit_url)
+            response.raise_for_status()
+            return self._parse_unit_page(response.text)
+        headers = (
+            self.validators.conditional_headers(unit_url, content_file)
+            if content_file
+            else {}
+        )
+        response = self.request(url=unit_url, headers=headers, stream=True)
+        try:
+            if response.status_code == 304:
+                logging.info(f"Not modified, keeping: {content_file}")
+                return scan_unit_file(content_file)
+            response.raise_for_status()
+            scanner = UnitLinkScanner()
+            if content_file is None:
+                for text in response.iter_text(chunk_size=64 * 1024):
+                    scanner.feed(text)
+                return scanner.close()
+
+            def chunks():
+                for text in response.iter_text(chunk_size=64 * 1024):
+                    scanner.feed(text)
+                    yield text.encode("utf-8")
+
+            if self.sink is not None:
+                with self.sink.open(content_file) as writer:
+                    for chunk in chunks():
+                        writer.write(chunk)
+                logging.info(f"Stored: {content_file}")
+                return scanner.close()
+
+            changed, sha256, size = write_stream_if_changed(content_file, chunks())
+            if changed:
+                logging.info(f"Saved: {content_file}")
+            else:
+                logging.info(f"Unchanged, keeping: {content_file}")
+            self.validators.update_digest(unit_url, content_file, response, sha256, size)
+            return scanner.close()
+        finally:
+            response.close()
+
+    def _fetch_unit_page(self, unit_url: str) -> UnitLinks | None:
+        logging.info(f"Getting Page unit started: {unit_url}")
+        try:
+            links = self._scan_unit_page(unit_url)
+        except Exception as e:
+            logging.error(f"Error getting page unit {unit_url}: {e}")
+            return None
+        logging.info(f"Getting Page unit finished: {unit_url}")
+        return links
+
+    def iter_unit_pages(
+        self,
+        course_info: CourseInfo,
+        max_workers: int = 4,
+        lookahead: int | None = None,
+    ):
+        """
+        Fetch and parse unit pages concurrently and yield them in course order.
+
+        At most `lookahead` (by default ``2 * max_workers``) pages are in
+        flight or buffered at a time. Yields ``(chapter_index, chapter,
+        unit_index, unit, links)`` tuples; ``links`` is None when the page
+        could not be fetched.
+        """
+        units = (
+            (i, chapter, j, unit)
+            for i, chapter in enumerate(course_info.chapters.chapters)
+            for j, unit in enumerate(chapter.unit_set)
+        )
+        window = max(1, lookahead or max(1, max_workers) * 2)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            pending = deque()
+            for item in units:
+                i, chapter, j, unit = item
+                unit_url = self._unit_url(course_info.link, chapter, unit)
+                pending.append((item, executor.submit(self._fetch_unit_page, unit_url)))
+                if len(pending) >= window:
+                    item, future = pending.popleft()
+                    yield (*item, future.result())
+            while pending:
+                item, future = pending.popleft()
+                yield (*item, future.result())
+
+    def iter_course_assets(
+        self,
+        course_info: CourseInfo,
+        max_workers: int = 4,
+        lookahead: int | None = None,
+    ) -> Iterator[Asset]:
+        """
+        Resolve the assets of a course lazily, in course order.
+
+        Unit pages are fetched as the caller consumes assets, with the same
+        bounded look-ahead as `iter_unit_pages`; nothing is downloaded or
+        written. Text, quiz and assignment units yield their page as a
+        ``page`` asset before the files it links to. Units whose page could
+        not be fetched are logged and skipped.
+        """
+        layout = OutputLayout(self.output_path, course_info)
+        pages = self.iter_unit_pages(course_info, max_workers, lookahead)
+        for _, chapter, _, unit, links in pages:
+            if links is None:
+                logging.error(f"Skipping assets of unit {unit.title}")
+                continue
+            paths = layout.unit(unit.id)
+            if unit.type != "lecture":
+                yield Asset(
+                    course_info.link,
+                    paths,
+                    "page",
+                    self._unit_url(course_info.link, chapter, unit),
+                    os.path.join(paths.chapter_directory, f"{paths.unit_name}.html"),
+                )
+            for kind, url, output_file in self._collect_unit_links(
+                links, paths.chapter_directory, paths.unit_name, unit
+            ):
+                yield Asset(
+                    course_info.link,
+                    paths,
+                    kind,
+                    url,
+                    output_file,
+                    self.video_sizes.get(url),
+                )
+
+    async def aiter_course_assets(
+        self,
+        course_info: CourseInfo,
+        max_workers: int = 4,
+        lookahead: int | None = None,
+    ) -> AsyncIterator[Asset]:
+        """`iter_course_assets` for asyncio code; pages are fetched off the event loop."""
+        import asyncio
+
+        assets = self.iter_course_assets(course_info, max_workers, lookahead)
+        done = object()
+        try:
+            while (asset := await asyncio.to_thread(next, assets, done)) is not done:
+                yield asset
+        finally:
+            await asyncio.to_thread(assets.close)
+
+    def _video_size(self, video_url: str) -> int | None:
+        """Byte size of a video from the plan metadata, or from a HEAD request."""
+        if video_url in self.video_sizes:
+            return self.video_sizes[video_url]
+        if manifest_kind(video_url):
+            return None
+        try:
+            response = self.client.head(self._absolute_url(video_url))
+            response.raise_for_status()
+            size = int(response.headers.get("content-length", 0)) or None
+        except Exception as e:
+            logging.error(f"Error getting video size {video_url}: {e}")
+            return None
+        if size is not None:
+            self.video_sizes[video_url] = size
+        return size
+
+    def _select_video(self, video_links: list[str]) -> VideoCandidate | None:
+        if not video_links:
+            return None
+        return self.quality_policy.select(
+            rank_video_links(video_links), self._video_size
+        )
+
+    def _select_video_link(self, video_links: list[str]) -> str | None:
+        candidate = self._select_video(video_links)
+        return candidate.url if candidate else None
+
+    @staticmethod
+    def _video_extension(video_url: str) -> str:
+        """
+        Extension a video link is saved with. Streams are written as their
+        media container, MPEG-TS for HLS (MP4 when its segments are
+        fragmented MP4, known once the playlist is read) and MP4 for DASH.
+        """
+        kind = manifest_kind(video_url)
+        if kind is not None:
+            return "ts" if kind == "hls" else "mp4"
+        return video_url.split("?")[0].split(".")[-1]
+
+    def _lecture_path(
+        self, chapter_directory: str, unit_name: str, ext: str, in_folder: bool
+    ) -> str:
+        """Lectures with a subtitle keep video and subtitle in their own folder."""
+        if in_folder:
+            base_name = os.path.splitext(unit_name)[0]
+            return os.path.join(chapter_directory, base_name, f"{base_name}.{ext}")
+        return os.path.join(chapter_directory, f"{unit_name}.{ext}")
+
+    def _attachment_path(
+        self, attachment_url: str, chapter_directory: str, unit_name: str
+    ) -> str:
+        attachment_name = attachment_url.split("?")[0].split("/")[-1]
+        file_name = f"{sanitize_filename(attachment_name)}"
+        return f"{chapter_directory}{os.sep}{unit_name}_{file_name}"
+
+    def _html_file_path(
+        self, url: str, chapter_directory: str, unit_name: str
+    ) -> str | None:
+        name_parts = url.split("/")[-1].split(".")
+        if len(name_parts) < 2:
+            return None
+        extension = name_parts[-1].lower()
+        clean_unit_name = unit_name.replace("_", " ").strip()
+        return os.path.join(chapter_directory, f"{clean_unit_name}.{extension}")
+
+    def _collect_unit_links(
+        self,
+        links: UnitLinks,
+        chapter_directory: str,
+        unit_name: str,
+        unit: Unit,
+    ) -> list[tuple[str, str, str]]:
+        """
+        Resolve the downloadable links of a unit page to their target paths.
+
+        Returns ``(kind, url, output_file)`` tuples laid out exactly as
+        ``download_course_videos`` would write them.
+        """
+        results = []
+        if unit.attachment:
+            attachment_link = links.attachment
+            if attachment_link:
+                results.append(
+                    (
+                        "attachment",
+                        attachment_link,
+                        self._attachment_path(
+                            attachment_link, chapter_directory, unit_name
+                        ),
+                    )
+                )
+        if unit.type == "lecture":
+            subtitle_link = links.subtitle
+            if subtitle_link:
+                results.append(
+                    (
+                        "subtitle",
+                        self._absolute_url(subtitle_link),
+                        self._lecture_path(chapter_directory, unit_name, "vtt", True),
+                    )
+                )
+            video_url = self._select_video_link(list(links.videos))
+            if video_url:
+                video_url = self._absolute_url(video_url)
+                ext = self._video_extension(video_url)
+                results.append(
+                    (
+                        "video",
+                        video_url,
+                        self._lecture_path(
+                            chapter_directory, unit_name, ext, bool(subtitle_link)
+                        ),
+                    )
+                )
+        else:
+            for url in self._extract_files_from_html(links):
+                output_file = self._html_file_path(url, chapter_directory, unit_name)
+                if output_file:
+                    results.append(("file", url, output_file))
+        return results
+
+    def _materialize_from_store(self, url: str, output_file: str, headers) -> bool:
+        """
+        Link the stored copy of `url` to `output_file` while the origin still
+        serves the same content, judged by the `headers` of its HEAD
+        response. True only when a file was placed.
+        """
+        if self.blob_store is None or self.sink is not None:
+            return False
+        try:
+            entry = self.blob_store.lookup(url)
+            if entry is None:
+                return False
+            if not self.blob_store.is_current(entry, headers):
+                logging.info(f"Changed upstream, not reusing stored copy: {url}")
+                if self.blob_store.is_linked(entry, output_file):
+                    # Same-size changes would otherwise pass the size check
+                    os.remove(output_file)
+                return False
+            return self.blob_store.materialize(url, output_file, entry)
+        except Exception as e:
+            logging.error(f"Error linking {output_file} from blob store: {e}")
+            return False
+
+    def _ingest_into_store(self, url: str, output_file: str, headers=None) -> None:
+        if self.blob_store is None or self.sink is not None:
+            return
+        try:
+            self.blob_store.ingest(url, output_file, headers)
+        except OSError as e:
+            logging.error(f"Error adding {output_file} to blob store: {e}")
+
+    def _revalidate(self, url: str, output_file: str) -> bytes:
+        """
+        Fetch a small asset with a conditional request and store it.
+
+        The file is only rewritten when its content changed; on ``304`` or
+        identical content the local copy is returned untouched.
+        """
+        if self.sink is not None:
+            response = self.request(url=url)
+            self.sink.put(output_file, response.content)
+            logging.info(f"Stored: {output_file}")
+            return response.content
+        headers = self.validators.conditional_headers(url, output_file)
+        response = self.request(url=url, headers=headers)
+        if response.status_code == 304:
+            logging.info(f"Not modified, keeping: {output_file}")
+            with open(output_file, "rb") as f:
+                return f.read()
+        content = response.content
+        if write_if_changed(output_file, content):
+            logging.info(f"Saved: {output_file}")
+        else:
+            logging.info(f"Unchanged, keeping: {output_file}")
+        self.validators.update(url, output_file, response, content)
+        return content
+
+    def _record_download(
+        self,
+        url: str,
+        output_file: str,
+        sha256: str | None = None,
+        size: int | None = None,
+    ) -> None:
+        if self.index is None:
+            return
+        try:
+            # Files in a remote sink are recorded by their URI
+            local = self.sink is None
+            self.index.record_download(
+                os.path.abspath(output_file) if local else self.sink.uri(output_file),
+                getattr(self._unit_context, "unit_id", None),
+                url,
+                os.path.getsize(output_file) if local else size,
+                sha256=sha256,
+                sample_sha256=sample_digest(output_file) if local else None,
+            )
+        except Exception as e:
+            logging.error(f"Error recording download {output_file}: {e}")
+
+    def _transfer_slot(self):
+        return self.tuner.slot() if self.tuner is not None else nullcontext()
+
+    def _await_transfer_window(self) -> None:
+        if self.schedule is not None:
+            self.schedule.wait()
+
+    def _record_transfer_error(self, error: Exception) -> None:
+        """Tell the tuner about throttling and dropped connections."""
+        import httpx
+
+        if self.tuner is None:
+            return
+        if isinstance(error, httpx.HTTPStatusError):
+            if error.response.status_code in (429, 503):
+                self.tuner.record_error()
+        elif isinstance(error, (httpx.TransportError, ConnectionError)):
+            self.tuner.record_error()
+
+    def _record_failure(
+        self,
+        kind: str,
+        url: str,
+        error: Exception,
+        course_link: str | None = None,
+        unit_id: int | None = None,
+    ) -> None:
+        """Put a failed unit or asset in the failure queue for `retry-failed`."""
+        failed = getattr(self._unit_context, "failed", None)
+        if failed is not None and kind != "unit":
+            failed.append(url)
+        if self.failures is None:
+            return
+        course_link = course_link or getattr(self._unit_context, "course_link", None)
+        unit_id = unit_id or getattr(self._unit_context, "unit_id", None)
+        if course_link is None or unit_id is None:
+            return
+        try:
+            attempts = self.failures.record(
+                course_link, unit_id, kind, failed_url(error, url), error
+            )
+            logging.info(f"Queued failed {kind} {url} for retry (attempt {attempts})")
+        except Exception as e:
+            logging.error(f"Error recording failure of {url}: {e}")
+
+    def _post_process(self, kind: str, path: str, **context) -> None:
+        # Hooks work on local files
+        if self.post_processor is None or self.sink is not None:
+            return
+        context.setdefault("unit_id", getattr(self._unit_context, "unit_id", None))
+        self.post_processor.submit(kind, path, **context)
+
+    def _index_unit_assets(
+        self, links: UnitLinks, chapter_directory: str, unit_name: str, unit: Unit
+    ) -> None:
+        if self.index is None:
+            return
+        try:
+            for kind, url, output_file in self._collect_unit_links(
+                links, chapter_directory, unit_name, unit
+            ):
+                self.index.record_asset(
+                    unit.id,
+                    kind,
+                    url,
+                    os.path.abspath(output_file),
+                    self.video_sizes.get(url),
+                )
+        except Exception as e:
+            logging.error(f"Error indexing assets of unit {unit.title}: {e}")
+
+    def _stream_to_file(
+        self,
+        url: str,
+        output_file: str,
+        file_size: int,
+        desc: str,
+        validator: str | None = None,
+    ) -> str:
+        """
+        Download `url` to `output_file` through a `PartialFile` and return
+        the SHA-256 of the content.
+
+        The partial is continued when an earlier run left one for the same
+        URL and ETag or Last-Modified `validator`, and is renamed into place
+        once complete. With a storage `sink` the content streams there
+        directly.
+        """
+        if self.sink is not None:
+            return self._stream(url, output_file, file_size, desc)
+        partial = PartialFile(output_file, url, validator, file_size)
+        digest = hashlib.sha256()
+        offset = partial.resumable_size()
+        if offset:
+            with open(partial.part_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            logging.info(f"Resuming {output_file} from {offset} bytes")
+        else:
+            partial.start()
+        sha256 = self._stream(
+            url, partial.part_path, file_size, desc, validator, offset, digest
+        )
+        partial.finish()
+        return sha256
+
+    def _stream(
+        self,
+        url: str,
+        output_file: str,
+        file_size: int,
+        desc: str,
+        validator: str | None = None,
+        offset: int = 0,
+        digest=None,
+    ) -> str:
+        """
+        Stream `url` into `output_file` and return the SHA-256 of the content.
+
+        `offset` bytes already written, hashed into `digest`, are continued
+        with a Range request guarded by ``If-Range`` with `validator`.
+
+        A read gives up after ``transfer.read_timeout`` seconds without data,
+        and a transfer slower than ``transfer.stall_min_rate`` over
+        ``transfer.stall_window`` counts as stalled. Stalled or dropped
+        transfers resume from the current offset with a Range request on a
+        fresh connection. With ``transfer.hedge`` the remaining range is
+        raced on a second connection instead, and the first copy to finish
+        is kept. With a storage `sink` the content streams there instead of
+        to disk, and stalled transfers are resumed rather than hedged.
+
+        With a `schedule`, transfers wait for a window, are paced to its
+        rate and pause when it closes, resuming from the same offset in the
+        next one.
+        """
+        import httpx
+        from tqdm import tqdm
+
+        settings = self.transfer
+        timeout = httpx.Timeout(30.0, read=settings.read_timeout)
+        digest = digest or hashlib.sha256()
+        resumes = 0
+        hedge: HedgedRange | None = None
+        hedge_digest = None
+        self._await_transfer_window()
+        with self._transfer_slot(), tqdm(
+            total=file_size,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            desc=desc,
+            bar_format='{desc:30} {percentage:3.0f}% |{bar:40}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]',
+            colour='green',
+            ncols=100,
+            ascii=False,
+            dynamic_ncols=True
+        ) as progress_bar, (
+            # Remote sinks take the stream directly, without a local copy
+            self.sink.open(output_file)
+            if self.sink
+            else open(output_file, "r+b" if offset else "wb")
+        ) as file:
+            if offset:
+                file.seek(offset)
+                progress_bar.update(offset)
+            try:
+                while True:
+                    headers = {"Range": f"bytes={offset}-"} if offset else {}
+                    if offset and validator:
+                        headers["If-Range"] = validator
+                    try:
+                        with self.client.stream(
+                            "GET", url, headers=headers, timeout=timeout
+                        ) as response:
+                            response.raise_for_status()  # Raise an error for bad responses (4xx or 5xx)
+                            if offset and response.status_code != 206:
+                                logging.info(f"Range ignored for {url}, starting over")
+                                if self.sink is not None:
+                                    file.restart()
+                                else:
+                                    file.seek(0)
+                                    file.truncate()
+                                digest = hashlib.sha256()
+                                offset = 0
+                                progress_bar.reset(total=file_size)
+                            stall = StallDetector(
+                                settings.stall_min_rate, settings.stall_window
+                            )
+                            # Iterate over the response content in chunks
+                            for chunk in response.iter_bytes(chunk_size=8192):
+                                file.write(chunk)
+                                digest.update(chunk)
+                                offset += len(chunk)
+                                progress_bar.update(len(chunk))
+                                if self.tuner is not None:
+                                    self.tuner.record_bytes(len(chunk))
+                                if self.schedule is not None:
+                                    paced = time.monotonic()
+                                    if not self.schedule.throttle(len(chunk)):
+                                        raise TransferPaused(
+                                            f"window closed at {offset} bytes"
+                                        )
+                                    # Pacing to the cap is not a stall
+                                    stall.exclude(time.monotonic() - paced)
+                                if hedge is not None:
+                                    if hedge.done.is_set() and hedge.ok:
+                                        break
+                                elif stall.update(len(chunk)):
+                                    # A hedge is spliced into a local file
+                                    if not settings.hedge or self.sink is not None:
+                                        raise TransferStalled(
+                                            f"below {settings.stall_min_rate} B/s "
+                                            f"for {settings.stall_window:g}s"
+                                        )
+                                    hedge = HedgedRange(
+                                        self.client,
+                                        url,
+                                        f"{output_file}.hedge",
+                                        offset,
+                                        timeout,
+                                        self.schedule,
+                                    )
+                                    hedge_digest = digest.copy()
+                                    hedge.start()
+                            else:
+                                if hedge is not None:
+                                    hedge.cancel()
+                                return digest.hexdigest()
+                    except TransferPaused:
+                        if hedge is not None:
+                            hedge.cancel()
+                            hedge = None
+                        logging.info(
+                            f"Transfer window closed, pausing {url} at {offset} bytes"
+                        )
+                        self._await_transfer_window()
+                        continue
+                    except (TransferStalled, httpx.TransportError) as e:
+                        if hedge is None:
+                            resumes += 1
+                            if resumes > settings.max_resumes:
+                                # The caller records the error it gives up on
+                                raise
+                        if not isinstance(e, TransferStalled):
+                            self._record_transfer_error(e)
+                        if hedge is None:
+                            logging.info(
+                                f"Transfer of {url} interrupted at {offset} bytes "
+                                f"({e}); resuming on a new connection"
+                            )
+                            continue
+                    # The primary connection lost the race or broke while hedged
+                    if hedge.wait():
+                        hedge.splice_into(file, hedge_digest)
+                        progress_bar.n = file.tell()
+                        progress_bar.refresh()
+                        logging.info(f"Hedged connection finished {url} first")
+                        return hedge_digest.hexdigest()
+                    hedge = None
+                    resumes += 1
+                    if resumes > settings.max_resumes:
+                        raise TransferStalled(f"gave up on {url} after {resumes} attempts")
+            except BaseException:
+                if hedge is not None:
+                    hedge.cancel()
+                raise
+
     def _download(self, url, output_file: str):
+        import httpx
+
         logging.info(f"Downloading url: {url}")
         try:
             head_response = self.client.head(url)
             head_response.raise_for_status()
+            if self._materialize_from_store(url, output_file, head_response.headers):
+                self._record_download(url, output_file)
+                return True
             file_size = int(
                 head_response.headers.get("content-length", 0)
             )  # Total file size
-            if os.path.exists(output_file):
+            if self.sink is not None:
+                if self.sink.size(output_file) == file_size:
+                    logging.info(f"File already stored: {output_file}")
+                    self._record_download(url, output_file, size=file_size)
+                    return False
+            elif os.path.exists(output_file):
                 logging.info(f"File already exists: {output_file}")
                 # check size
                 if os.path.getsize(output_file) == file_size:
                     logging.info(f"File already downloaded: {output_file}")
+                    self._ingest_into_store(url, output_file, head_response.headers)
+                    self._record_download(url, output_file)
                     return False
                 else:
                     logging.info(
                         f"File already exists but size is different: {output_file}"
                     )
                     os.remove(output_file)
-            with self.client.stream("GET", url) as response:
-                response.raise_for_status()  # Raise an error for bad responses (4xx or 5xx)
-                # Open the output file in write-binary mode
-                with tqdm(
-                    total=file_size,
-                    unit="B",
-                    unit_scale=True,
-                    unit_divisor=1024,
-                    desc=f"📥 {os.path.basename(output_file)}",
-                    bar_format='{desc:30} {percentage:3.0f}% |{bar:40}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]',
-                    colour='green',
-                    ncols=100,
-                    ascii=False,
-                    dynamic_ncols=True
-                ) as progress_bar:
-                    with open(output_file, "wb") as file:
-                        # Iterate over the response content in chunks
-                        for chunk in response.iter_bytes(chunk_size=8192):
-                            file.write(chunk)
-                            progress_bar.update(len(chunk))
+            sha256 = self._stream_to_file(
+                url,
+                output_file,
+                file_size,
+                f"📥 {os.path.basename(output_file)}",
+                _range_validator(head_response.headers),
+            )
             logging.info(f"File downloaded successfully to {output_file}")
+            self._ingest_into_store(url, output_file, head_response.headers)
+            self._record_download(url, output_file, sha256, file_size)
             return True
         except httpx.RequestError as e:
             logging.error(f"An error occurred while requesting the file: {e}")
+            self._record_transfer_error(e)
+            self._record_failure("file", url, e)
             return False
         except Exception as e:
             logging.error(f"An error occurred: {e}")
+            self._record_transfer_error(e)
+            self._record_failure("file", url, e)
             return False
 
     def _download_video(
@@ -270,44 +1086,163 @@ class MaktabkhoonehCrawler:
         try:
             head_response = self.client.head(video_url)
             head_response.raise_for_status()
+            if self._materialize_from_store(video_url, output_file, head_response.headers):
+                self._record_download(video_url, output_file)
+                return True
             file_size = int(
                 head_response.headers.get("content-length", 0)
             )  # Total file size
-            if os.path.exists(output_file):
+            if self.sink is not None:
+                if self.sink.size(output_file) == file_size:
+                    logging.info(f"File already stored: {output_file}")
+                    self._record_download(video_url, output_file, size=file_size)
+                    return False
+            elif os.path.exists(output_file):
                 logging.info(f"File already exists: {output_file}")
                 # check size
                 if os.path.getsize(output_file) == file_size:
                     logging.info(f"File already downloaded: {output_file}")
+                    self._ingest_into_store(
+                        video_url, output_file, head_response.headers
+                    )
+                    self._record_download(video_url, output_file)
                     return False
                 else:
                     logging.info(
                         f"File already exists but size is different: {output_file}"
                     )
                     os.remove(output_file)
-            with self.client.stream("GET", video_url) as response:
-                response.raise_for_status()  # Raise an error for bad responses (4xx or 5xx)
-                # Open the output file in write-binary mode
+            sha256 = self._stream_to_file(
+                video_url,
+                output_file,
+                file_size,
+                f"🎥 {os.path.basename(output_file)}",
+                _range_validator(head_response.headers),
+            )
+            self._ingest_into_store(video_url, output_file, head_response.headers)
+            self._record_download(video_url, output_file, sha256, file_size)
+            return True
+        except Exception as e:
+            logging.error(f"Error downloading video: {e}")
+            self._record_transfer_error(e)
+            self._record_failure("video", video_url, e)
+            return False
+
+    def _resolve_manifest(self, manifest_url: str, kind: str) -> list[Track]:
+        response = self.request(url=manifest_url)
+        if kind == "dash":
+            groups: dict[int, list[Track]] = {}
+            for track in parse_dash(response.text, str(response.url)):
+                groups.setdefault(track.group, []).append(track)
+            return [self._select_track(tracks) for tracks in groups.values()]
+        variants = parse_hls_master(response.text, str(response.url))
+        if not variants:
+            return [parse_hls_media(response.text, str(response.url))]
+        playlists: dict[str, Track] = {}
+
+        def load_playlist(url: str, bandwidth: int) -> Track:
+            if url not in playlists:
+                response = self.request(url=url)
+                playlists[url] = parse_hls_media(
+                    response.text, str(response.url), bandwidth
+                )
+            return playlists[url]
+
+        bandwidths = {x.url: x.bandwidth for x in variants}
+
+        def estimate_size(url: str) -> int | None:
+            track = load_playlist(url, bandwidths[url])
+            if not track.duration or not track.bandwidth:
+                return None
+            return int(track.duration * track.bandwidth / 8)
+
+        candidate = self.quality_policy.select(
+            [VideoCandidate(x.url, x.bandwidth) for x in variants], estimate_size
+        )
+        self.quality_policy.record(
+            candidate if candidate.size is not None
+            else candidate._replace(size=estimate_size(candidate.url))
+        )
+        variant = next(x for x in variants if x.url == candidate.url)
+        logging.info(f"Selected HLS variant {variant.resolution or variant.bandwidth}")
+        return [load_playlist(variant.url, variant.bandwidth)]
+
+    def _select_track(self, tracks: list[Track]) -> Track:
+        """Let the quality policy choose one of alternative DASH representations."""
+
+        def estimate_size(key: str) -> int | None:
+            track = tracks[int(key)]
+            if not track.duration or not track.bandwidth:
+                return None
+            return int(track.duration * track.bandwidth / 8)
+
+        candidate = self.quality_policy.select(
+            [VideoCandidate(str(i), x.bandwidth) for i, x in enumerate(tracks)],
+            estimate_size,
+        )
+        self.quality_policy.record(
+            candidate if candidate.size is not None
+            else candidate._replace(size=estimate_size(candidate.url))
+        )
+        track = tracks[int(candidate.url)]
+        logging.info(f"Selected DASH {track.kind} representation {track.bandwidth}")
+        return track
+
+    def _fetch_segment(self, url: str) -> bytes:
+        # A closed window stops the next segment rather than this one
+        self._await_transfer_window()
+        response = self.client.get(url)
+        response.raise_for_status()
+        if self.schedule is not None:
+            self.schedule.throttle(len(response.content))
+        return response.content
+
+    def _download_manifest_video(self, manifest_url: str, output_base: str) -> bool:
+        """
+        Download an HLS/DASH stream into ``output_base.<ext>``.
+
+        Separate DASH audio is written next to it as ``output_base.audio.<ext>``.
+        """
+        from tqdm import tqdm
+
+        logging.info(f"Downloading {manifest_kind(manifest_url)} video: {manifest_url}")
+        try:
+            tracks = self._resolve_manifest(manifest_url, manifest_kind(manifest_url))
+            res = False
+            for track in tracks:
+                suffix = "" if track.kind == "video" else f".{track.kind}"
+                output_file = f"{output_base}{suffix}.{track.ext}"
+                if self.sink is not None and self.sink.size(output_file) is not None:
+                    logging.info(f"File already stored: {output_file}")
+                    continue
                 with tqdm(
-                    total=file_size,
-                    unit="B",
-                    unit_scale=True,
-                    unit_divisor=1024,
+                    total=len(track.segments) + (1 if track.init else 0),
+                    unit="seg",
                     desc=f"🎥 {os.path.basename(output_file)}",
-                    bar_format='{desc:30} {percentage:3.0f}% |{bar:40}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]',
                     colour='green',
-                    ncols=100,
-                    ascii=False,
-                    dynamic_ncols=True
+                    dynamic_ncols=True,
                 ) as progress_bar:
-                    with open(output_file, "wb") as file:
-                        # Iterate over the response content in chunks
-                        for chunk in response.iter_bytes(chunk_size=8192):
-                            if chunk:
-                                file.write(chunk)
-                                progress_bar.update(len(chunk))
-            return True
+                    downloader = SegmentDownloader(
+                        self._fetch_segment,
+                        max_workers=self.segment_workers,
+                        on_segment=lambda size: progress_bar.update(1),
+                    )
+                    downloaded = downloader.download(track, output_file)
+                    res = downloaded or res
+                if self.sink is not None:
+                    # Segments are assembled locally, then moved to the sink
+                    size = os.path.getsize(output_file)
+                    self.sink.upload_file(output_file)
+                    os.remove(output_file)
+                    self._record_download(manifest_url, output_file, size=size)
+                    continue
+                self._record_download(manifest_url, output_file)
+                if downloaded:
+                    self._post_process("video", output_file, url=manifest_url)
+            return res
         except Exception as e:
-            logging.error(f"Error downloading video: {e}")
+            logging.error(f"Error downloading stream {manifest_url}: {e}")
+            self._record_failure("video", manifest_url, e)
             return False
 
     def _download_subtitle(
@@ -334,260 +1269,337 @@ class MaktabkhoonehCrawler:
             logging.error(f"Error downloading subtitle: {e}")
             return False
 
-    def _extract_video_link(self, response_text: str) -> list[str]:
-        html = lxml.html.fromstring(response_text)
-        links = html.xpath("//source/attribute::src")
-        return links
-
-    def _extract_subtitle_link(self, response_text: str) -> str | None:
-        html = lxml.html.fromstring(response_text)
-        subtitles = html.xpath('//track[@kind="subtitles"]/@src')
-        return next(iter(subtitles), None)
-
-    def _extract_attachment_link(self, response_text: str) -> str | None:
-        html = lxml.html.fromstring(response_text)
-        attachments = html.xpath('//div[@class="unit-content--download"]/a/@href')
-        return next(iter(attachments), None)
-
-    def _extract_files_from_html(self, html_content: str) -> list[str]:
-        """Extract file URLs from HTML content"""
-        try:
-            html = lxml.html.fromstring(html_content)
-            # Look specifically for RAR files
-            file_links = html.xpath('//a[contains(@href, ".rar")]/@href')
-            
-            # Convert relative URLs to absolute
-            file_links = [f"{self.BASE_URL}{link}" if not link.startswith('http') else link 
-                         for link in file_links]
-            
-            return list(set(file_links))  # Remove duplicates
-        except Exception as e:
-            logging.error(f"Error extracting files from HTML: {e}")
-            return []
+    def _extract_files_from_html(self, links: UnitLinks) -> list[str]:
+        """Absolute URLs of the RAR files linked from a page"""
+        # Look specifically for RAR files
+        file_links = [self._absolute_url(link) for link in links.rar_files]
+        return list(set(file_links))  # Remove duplicates
 
     def _download_html_files(self, file_urls: list[str], output_directory: str, unit_name: str) -> None:
         """Download files found in HTML content"""
         for url in file_urls:
             try:
-                # Get the file name and extension from the URL
-                original_name = url.split('/')[-1]
-                name_parts = original_name.split('.')
-                if len(name_parts) > 1:
-                    extension = name_parts[-1].lower()
-                    # Create a clean name from the unit name
-                    clean_unit_name = unit_name.replace('_', ' ').strip()
-                    # Create new filename with unit name and proper extension
-                    new_filename = f"{clean_unit_name}.{extension}"
-                    output_file = os.path.join(output_directory, new_filename)
-                    
+                # Name the file after the unit, keeping the URL's extension
+                output_file = self._html_file_path(url, output_directory, unit_name)
+                if output_file:
                     logging.info(f"Downloading file: {url}")
-                    logging.info(f"Saving as: {new_filename}")
-                    self._download(url=url, output_file=output_file)
+                    logging.info(f"Saving as: {os.path.basename(output_file)}")
+                    if self._download(url=url, output_file=output_file):
+                        self._post_process("file", output_file, url=url)
                 else:
                     logging.error(f"Could not determine file extension for: {url}")
             except Exception as e:
                 logging.error(f"Error downloading file {url}: {e}")
 
-    def download_course_videos(self, course_info: CourseInfo, max_threads: int = 1):
-        course_link = course_info.link
-        course_title = course_info.course.title
-        chapters = course_info.chapters.chapters
-        course_directory = os.path.join(self.output_path, sanitize_filename(course_title))
-        if not os.path.exists(course_directory):
+    def _fetch_unit_links(self, course_link: str, paths: UnitPaths) -> UnitLinks:
+        """Fetch and scan a unit page; pages of non-lecture units are saved too."""
+        unit_url = self._unit_url(course_link, paths.chapter, paths.unit)
+        if paths.unit.type == "lecture":
+            return self._scan_unit_page(unit_url)
+        # Non-lecture pages are saved as-is, so revalidate them
+        if self.sink is None:
+            os.makedirs(paths.chapter_directory, exist_ok=True)
+        content_file = os.path.join(paths.chapter_directory, f"{paths.unit_name}.html")
+        return self._scan_unit_page(unit_url, content_file)
+
+    def _download_unit(
+        self,
+        course_link: str,
+        paths: UnitPaths,
+        prefetched: Future[UnitLinks] | None = None,
+    ) -> list[str]:
+        """
+        Fetch one unit page and download everything it links to.
+
+        `prefetched` is the page already being fetched by
+        `_fetch_unit_links` in the background. Returns the URLs of assets
+        that failed, which are logged and queued but not raised; errors of
+        the unit page itself propagate to the caller, which decides whether
+        to retry.
+        """
+        chapter, unit = paths.chapter, paths.unit
+        chapter_directory = paths.chapter_directory
+        unit_name = paths.unit_name
+        if self.sink is None and not os.path.exists(chapter_directory):
+            logging.info(f"Creating chapter directory: {chapter_directory}")
+            os.makedirs(chapter_directory, exist_ok=True)
+        self._unit_context.unit_id = unit.id
+        self._unit_context.course_link = course_link
+        self._unit_context.failed = []
+        set_log_context(course=course_link, unit_id=unit.id)
+        logging.info(f"Processing unit: {unit.title}")
+        unit_type: str = unit.type
+
+        unit_url = self._unit_url(course_link, chapter, unit)
+        logging.info(f"Getting Page unit started: {unit_url}")
+        if prefetched is not None:
+            links = prefetched.result()
+        else:
+            links = self._fetch_unit_links(course_link, paths)
+        if unit_type != "lecture":
+            content_file = os.path.join(chapter_directory, f"{unit_name}.html")
+            self._record_download(unit_url, content_file)
+        logging.info(f"Getting Page unit finished: {unit_url}")
+        self._index_unit_assets(links, chapter_directory, unit_name, unit)
+
+        # Handle attachments for all unit types
+        has_attachment: bool = unit.attachment
+        if has_attachment:
+            logging.info("Handling attachment")
+            self._handle_attachment(
+                links=links,
+                chapter_directory=chapter_directory,
+                unit_name=unit_name,
+            )
+
+        # Handle content based on unit type
+        if unit_type == "lecture":
+            # Handle video content and subtitles for lectures
+            logging.info("Handling video content for lecture")
+            has_subtitle: bool = True
+            if has_subtitle:
+                logging.info("Handling video subtitle")
+                self._handle_subtitle(
+                    links=links,
+                    chapter_directory=chapter_directory,
+                    unit_name=unit_name,
+                )
+
+            logging.info("Handling video links")
+            self._handle_video(
+                links=links,
+                chapter_directory=chapter_directory,
+                unit_name=unit_name,
+            )
+        else:
+            # For non-lecture units (text, assignment, quiz) the
+            # page was already saved to content_file when fetched.
+            # Extract and download RAR files from the HTML
+            file_urls = self._extract_files_from_html(links)
+            if file_urls:
+                logging.info(f"Found {len(file_urls)} RAR files in HTML content")
+                self._download_html_files(file_urls, chapter_directory, unit_name)
+            if self.post_processor is not None:
+                link_map = {
+                    url: output_file
+                    for _, url, output_file in self._collect_unit_links(
+                        links, chapter_directory, unit_name, unit
+                    )
+                    if os.path.exists(output_file)
+                }
+                self._post_process(
+                    "page", content_file, url=unit_url, link_map=link_map
+                )
+        self.validators.save()
+        return self._unit_context.failed
+
+    def _process_unit(
+        self,
+        course_link: str,
+        paths: UnitPaths,
+        prefetched: Future[UnitLinks] | None = None,
+    ) -> None:
+        """Download a unit, logging failures, with the usual pauses between units."""
+        try:
+            self._download_unit(course_link, paths, prefetched)
+
+            rnd = random.randint(0, 1)
+            logging.info(f"Sleeping for {rnd} seconds")
+            time.sleep(rnd)
+
+        except Exception as e:
+            logging.error(f"Error in unit: {paths.unit.title}")
+            logging.error(e)
+            self._record_failure(
+                "unit",
+                self._unit_url(course_link, paths.chapter, paths.unit),
+                e,
+                course_link=course_link,
+                unit_id=paths.unit.id,
+            )
+            self.validators.save()
+
+            rnd = random.randint(0, 60)
+            logging.info(f"Sleeping for {rnd} seconds")
+            time.sleep(rnd)
+        finally:
+            clear_log_context()
+
+    def download_course_videos(
+        self,
+        course_info: CourseInfo,
+        max_threads: int = 1,
+        unit_ids: set[int] | None = None,
+        lookahead: int = 0,
+    ):
+        """
+        Download every unit of a course, or only the units in `unit_ids`.
+
+        With `max_threads` above one, units are processed concurrently and
+        media transfers are throttled by a `ConcurrencyTuner`. Otherwise
+        units run one after another in course order, and with `lookahead`
+        the pages of that many following units are fetched and parsed in
+        the background while the current unit's media transfers.
+        """
+        layout = OutputLayout(self.output_path, course_info)
+        course_directory = layout.course_directory
+        if self.sink is None and not os.path.exists(course_directory):
             logging.info(f"Creating course directory: {course_directory}")
             os.makedirs(course_directory, exist_ok=True)
+        self.quality_policy.start_course(course_info)
 
-        for i, chapter in enumerate(chapters):
-            logging.info(f"Processing chapter: {chapter.title}")
-            chapter_title = chapter.title
-            chapter_slug = chapter.slug
-            chapter_id = chapter.id
+        units = [
+            paths
+            for paths in layout.units()
+            if unit_ids is None or paths.unit.id in unit_ids
+        ]
+        chapters = layout.chapters()
+        next_chapter = 0
 
-            chapter_directory = os.path.join(
-                course_directory,
-                f"{i + 1}_{sanitize_filename(chapter_title)}"
-            )
-            if not os.path.exists(chapter_directory):
-                logging.info(f"Creating chapter directory: {chapter_directory}")
-                os.makedirs(chapter_directory, exist_ok=True)
-            chapter_url = f"{chapter_slug}-ch{chapter_id}"
-            chpater_units = chapter.unit_set
-            for j, unit in enumerate(chpater_units):
-                try:
-                    logging.info(f"Processing unit: {unit.title}")
-                    unit_title: str = unit.title
-                    unit_slug: str = unit.slug
-                    unit_type: str = unit.type
-                    unit_name: str = f"{j + 1}_{sanitize_filename(unit_title)}"
-
-                    unit_url = f"{course_link}{chapter_url}/{unit_slug}/"
-                    logging.info(f"Getting Page unit started: {unit_url}")
-                    response = self.request(url=unit_url)
-                    response.raise_for_status()
-                    response_text = response.text
-                    logging.info(f"Getting Page unit finished: {unit_url}")
-
-                    # Handle attachments for all unit types
-                    has_attachment: bool = unit.attachment
-                    if has_attachment:
-                        logging.info("Handling attachment")
-                        self._handle_attachment(
-                            response_text=response_text,
-                            chapter_directory=chapter_directory,
-                            unit_name=unit_name,
-                        )
+        def enter_chapters(upto: int) -> None:
+            # Announce every chapter up to `upto`, including the ones without
+            # (selected) units, so the log mirrors the course outline
+            nonlocal next_chapter
+            while next_chapter <= upto:
+                chapter, chapter_directory = chapters[next_chapter]
+                logging.info(f"Processing chapter: {chapter.title}")
+                if (
+                    unit_ids is None
+                    and self.sink is None
+                    and not os.path.exists(chapter_directory)
+                ):
+                    logging.info(f"Creating chapter directory: {chapter_directory}")
+                    os.makedirs(chapter_directory, exist_ok=True)
+                next_chapter += 1
 
-                    # Handle content based on unit type
-                    if unit_type == "lecture":
-                        # Handle video content and subtitles for lectures
-                        logging.info("Handling video content for lecture")
-                        has_subtitle: bool = True
-                        if has_subtitle:
-                            logging.info("Handling video subtitle")
-                            self._handle_subtitle(
-                                response_text=response_text,
-                                chapter_directory=chapter_directory,
-                                unit_name=unit_name,
-                            )
+        if max_threads > 1:
+            # Units run side by side; the tuner decides how many of them
+            # may stream media at once, up to `max_threads`
+            tuner = self.tuner
+            if tuner is None:
+                from maktab_dl.tuning import ConcurrencyTuner
 
-                        logging.info("Handling video links")
-                        self._handle_video(
-                            response_text=response_text,
-                            chapter_directory=chapter_directory,
-                            unit_name=unit_name,
+                self.tuner = ConcurrencyTuner(max_streams=max_threads)
+            try:
+                with ThreadPoolExecutor(max_workers=max_threads) as executor:
+                    for paths in units:
+                        enter_chapters(paths.chapter_index)
+                        executor.submit(self._process_unit, course_info.link, paths)
+                    enter_chapters(len(chapters) - 1)
+            finally:
+                self.tuner = tuner
+        else:
+
+            def process(paths: UnitPaths, page: Future[UnitLinks] | None) -> None:
+                enter_chapters(paths.chapter_index)
+                self._process_unit(course_info.link, paths, page)
+
+            prefetch = (
+                ThreadPoolExecutor(max_workers=lookahead, thread_name_prefix="prefetch")
+                if lookahead > 0
+                else None
+            )
+            pending: deque[tuple[UnitPaths, Future[UnitLinks] | None]] = deque()
+            try:
+                for paths in units:
+                    page = None
+                    if prefetch is not None:
+                        page = prefetch.submit(
+                            self._fetch_unit_links, course_info.link, paths
                         )
-                    else:
-                        # For non-lecture units (text, assignment, quiz)
-                        logging.info(f"Saving {unit_type} content")
-                        content_file = os.path.join(chapter_directory, f"{unit_name}.html")
-                        with open(content_file, "w", encoding="utf-8") as f:
-                            f.write(response_text)
-                        logging.info(f"Saved {unit_type} content to {content_file}")
-                        
-                        # Extract and download RAR files from the HTML
-                        file_urls = self._extract_files_from_html(response_text)
-                        if file_urls:
-                            logging.info(f"Found {len(file_urls)} RAR files in HTML content")
-                            self._download_html_files(file_urls, chapter_directory, unit_name)
-
-                    rnd = random.randint(0, 1)
-                    logging.info(f"Sleeping for {rnd} seconds")
-                    time.sleep(rnd)
-
-                except Exception as e:
-                    logging.error(f"Error in unit: {unit_title}")
-                    logging.error(e)
-
-                    rnd = random.randint(0, 60)
-                    logging.info(f"Sleeping for {rnd} seconds")
-                    time.sleep(rnd)
+                    pending.append((paths, page))
+                    if len(pending) > lookahead:
+                        process(*pending.popleft())
+                while pending:
+                    process(*pending.popleft())
+                enter_chapters(len(chapters) - 1)
+            finally:
+                if prefetch is not None:
+                    prefetch.shutdown(cancel_futures=True)
+
+        if self.post_processor is not None:
+            self.post_processor.wait()
+        if self.blob_store is not None:
+            self.blob_store.save()
 
     def __del__(self):
         del self
 
-    def _extract_download_urls(self, response_text: str) -> list[str]:
-        """Extract all download URLs from HTML content"""
-        try:
-            html = lxml.html.fromstring(response_text)
-            urls = []
-            
-            # Extract video URLs
-            video_urls = html.xpath("//source/attribute::src")
-            urls.extend(video_urls)
-            
-            # Extract subtitle URLs
-            subtitle_urls = html.xpath('//track[@kind="subtitles"]/@src')
-            urls.extend(subtitle_urls)
-            
-            # Extract attachment URLs
-            attachment_urls = html.xpath('//div[@class="unit-content--download"]/a/@href')
-            urls.extend(attachment_urls)
-            
-            # Extract RAR/ZIP file URLs
-            file_urls = html.xpath('//a[contains(@href, ".rar") or contains(@href, ".zip")]/@href')
-            urls.extend(file_urls)
-            
-            # Convert relative URLs to absolute
-            urls = [f"{self.BASE_URL}{url}" if not url.startswith('http') else url 
-                   for url in urls]
-            
-            return list(set(urls))  # Remove duplicates
-        except Exception as e:
-            logging.error(f"Error extracting download URLs: {e}")
-            return []
+    def _extract_download_urls(self, links: UnitLinks) -> list[str]:
+        """Extract all download URLs of a parsed unit page"""
+        urls = [
+            *links.videos,
+            *links.subtitles,
+            *links.attachments,
+            *links.archives,
+        ]
+        # Convert relative URLs to absolute
+        urls = [self._absolute_url(url) for url in urls]
+        return list(set(urls))  # Remove duplicates
 
-    def save_download_urls(self, course_info: CourseInfo, output_path: str) -> None:
+    def save_download_urls(
+        self, course_info: CourseInfo, output_path: str, max_workers: int = 4
+    ) -> None:
         """Save all download URLs to a file"""
         links_file = os.path.join(output_path, 'links.txt')
         with open(links_file, 'w', encoding='utf-8') as f:
             f.write("Course Download Links:\n")
             f.write("=" * 50 + "\n\n")
-            
+
             f.write(f"Course Main Link: {course_info.link}\n\n")
-            
-            for chapter in course_info.chapters.chapters:
-                f.write(f"\nChapter: {chapter.title}\n")
-                f.write("-" * 30 + "\n")
-                
-                for unit in chapter.unit_set:
-                    f.write(f"\nUnit: {unit.title}\n")
-                    f.write(f"Type: {unit.type}\n")
-                    
-                    # Get the unit URL
-                    chapter_url = f"{chapter.slug}-ch{chapter.id}"
-                    unit_url = f"{course_info.link}{chapter_url}/{unit.slug}/"
-                    f.write(f"Unit URL: {unit_url}\n")
-                    
-                    try:
-                        # Get the page content
-                        response = self.request(url=unit_url)
-                        response.raise_for_status()
-                        
-                        # Extract download URLs
-                        download_urls = self._extract_download_urls(response.text)
-                        if download_urls:
-                            f.write("\nDownload URLs:\n")
-                            for url in download_urls:
-                                f.write(f"{url}\n")
-                    except Exception as e:
-                        logging.error(f"Error getting URLs for unit {unit.title}: {e}")
-                    
-                    f.write("\n")
+
+            pages = self.iter_unit_pages(course_info, max_workers=max_workers)
+            for _, chapter, j, unit, links in pages:
+                if j == 0:
+                    f.write(f"\nChapter: {chapter.title}\n")
+                    f.write("-" * 30 + "\n")
+
+                f.write(f"\nUnit: {unit.title}\n")
+                f.write(f"Type: {unit.type}\n")
+                unit_url = self._unit_url(course_info.link, chapter, unit)
+                f.write(f"Unit URL: {unit_url}\n")
+
+                if links is not None:
+                    # Extract download URLs
+                    download_urls = self._extract_download_urls(links)
+                    if download_urls:
+                        f.write("\nDownload URLs:\n")
+                        for url in download_urls:
+                            f.write(f"{url}\n")
+
+                f.write("\n")
 
     def _handle_subtitle(
-        self, response_text: str, chapter_directory: str, unit_name: str
+        self, links: UnitLinks, chapter_directory: str, unit_name: str
     ) -> bool:
         res: bool = False
-        subtitle_link = self._extract_subtitle_link(response_text)
+        subtitle_link = links.subtitle
         if subtitle_link:
-            # Get the file extension from the URL
-            ext = "vtt"  # Default to .vtt extension for subtitles
-            
-            # url is relative
-            subtitle_url = f"{self.BASE_URL}{subtitle_link}"
-            
-            # Create a subfolder for the lecture
-            base_name = os.path.splitext(unit_name)[0]
-            lecture_folder = os.path.join(chapter_directory, base_name)
-            os.makedirs(lecture_folder, exist_ok=True)
-            
-            # Create subtitle path in the lecture folder
-            unit_subtitle_path = os.path.join(lecture_folder, f"{base_name}.{ext}")
-            
+            subtitle_url = self._absolute_url(subtitle_link)
+
+            # Subtitles live in a subfolder for the lecture
+            unit_subtitle_path = self._lecture_path(
+                chapter_directory, unit_name, "vtt", True
+            )
+            if self.sink is None:
+                os.makedirs(os.path.dirname(unit_subtitle_path), exist_ok=True)
+
             logging.info(f"Downloading subtitle started: {subtitle_url}")
             try:
-                # Download the subtitle file
-                response = self.client.get(subtitle_url)
-                response.raise_for_status()
-                
-                # Save the subtitle content
-                with open(unit_subtitle_path, 'wb') as f:
-                    f.write(response.content)
-                
+                # Only rewrite the subtitle when it changed upstream
+                content = self._revalidate(subtitle_url, unit_subtitle_path)
+                self._record_download(
+                    subtitle_url,
+                    unit_subtitle_path,
+                    hashlib.sha256(content).hexdigest(),
+                    len(content),
+                )
+                self._post_process("subtitle", unit_subtitle_path, url=subtitle_url)
                 logging.info(f"Subtitle downloaded successfully to: {unit_subtitle_path}")
                 res = True
             except Exception as e:
                 logging.error(f"Error downloading subtitle: {e}")
+                self._record_failure("subtitle", subtitle_url, e)
                 res = False
 
         else:
@@ -596,69 +1608,90 @@ class MaktabkhoonehCrawler:
         return res
 
     def _handle_attachment(
-        self, response_text: str, chapter_directory: str, unit_name: str
+        self, links: UnitLinks, chapter_directory: str, unit_name: str
     ) -> bool:
         res: bool = False
-        attachment_link = self._extract_attachment_link(response_text)
+        attachment_link = links.attachment
         if attachment_link:
             # url is not relative
             attachment_url = attachment_link
-            attachment_name = attachment_url.split("?")[0].split("/")[-1]
-            file_name = f"{sanitize_filename(attachment_name)}"
-
-            unit_attachment_path = f"{chapter_directory}{os.sep}{unit_name}_{file_name}"
+            unit_attachment_path = self._attachment_path(
+                attachment_url, chapter_directory, unit_name
+            )
             logging.info(f"Downloading attachment started: {attachment_url}")
             res = self._download(
                 url=attachment_url,
                 output_file=unit_attachment_path,
             )
             logging.info(f"Downloading attachment finished: {attachment_url}")
+            if res:
+                self._post_process(
+                    "attachment", unit_attachment_path, url=attachment_url
+                )
 
         else:
             logging.info("No attachment found")
         return res
 
-    def _handle_video(self, response_text: str, chapter_directory: str, unit_name: str):
-        video_links = self._extract_video_link(response_text)
+    def _handle_video(self, links: UnitLinks, chapter_directory: str, unit_name: str):
+        video_links = list(links.videos)
         logging.info(f"Found {len(video_links)} video links")
-        try:
-            logging.info("Trying to get hq video link")
-            video_url = next((x for x in video_links if "hq" in x))
-        except Exception as e:
-            logging.error(f"error: {e}")
-            logging.error(video_links)
-            video_url = video_links[0]
+        logging.info(f"Selecting video link ({self.quality_policy.name} quality)")
+        candidate = self._select_video(video_links)
+        if candidate is None:
+            logging.error("No video link found")
+            return False
+        video_url = candidate.url
+        if not manifest_kind(video_url):
+            # Manifest variants are accounted for when the playlist is resolved
+            self.quality_policy.record(
+                candidate if candidate.size is not None
+                else candidate._replace(size=self.video_sizes.get(video_url))
+            )
+
+        ext = self._video_extension(video_url)
+
+        # If there's a subtitle, use the lecture folder
+        subtitle_link = links.subtitle
+        unit_video_path = self._lecture_path(
+            chapter_directory, unit_name, ext, bool(subtitle_link)
+        )
+        # Manifest videos are assembled locally even with a sink
+        if self.sink is None or manifest_kind(video_url):
+            os.makedirs(os.path.dirname(unit_video_path), exist_ok=True)
+
+        if manifest_kind(video_url):
+            # Playlists are fetched segment by segment into one media file
+            return self._download_manifest_video(
+                self._absolute_url(video_url), os.path.splitext(unit_video_path)[0]
+            )
 
-        ext = video_url.split("?")[0].split(".")[-1]
-        
-        # Check if this lecture has a subtitle
-        subtitle_link = self._extract_subtitle_link(response_text)
-        if subtitle_link:
-            # If there's a subtitle, use the lecture folder
-            base_name = os.path.splitext(unit_name)[0]
-            lecture_folder = os.path.join(chapter_directory, base_name)
-            os.makedirs(lecture_folder, exist_ok=True)
-            unit_video_path = os.path.join(lecture_folder, f"{base_name}.{ext}")
-        else:
-            # If no subtitle, save directly in chapter directory
-            unit_video_path = os.path.join(chapter_directory, f"{unit_name}.{ext}")
-            
         logging.info(f"Downloading video started: {video_url}")
         res: bool = self._download_video(
             video_url=video_url,
             output_file=unit_video_path,
         )
         logging.info(f"Downloading video finished: {video_url}")
+        if res:
+            self._post_process("video", unit_video_path, url=video_url)
         return res
 
-    def download_courses_from_file(self, courses_file: str = "courses.txt") -> None:
+    def download_courses_from_file(
+        self,
+        courses_file: str = "courses.txt",
+        schedule: TransferSchedule | None = None,
+    ) -> None:
         """
         Download multiple courses from a text file containing course URLs.
         Each URL should be on a new line in the file.
         
         Args:
             courses_file (str): Path to the file containing course URLs
+            schedule (TransferSchedule): Windows in which media may transfer,
+                replacing the crawler's own
         """
+        if schedule is not None:
+            self.schedule = schedule
         if not os.path.exists(courses_file):
             logging.error(f"Courses file not found: {courses_file}")
             return
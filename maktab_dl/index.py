@@ -0,0 +1,369 @@
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from maktab_dl.schemas import CourseInfo
+
+INDEX_FILE_NAME = "maktab_index.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    slug TEXT PRIMARY KEY,
+    slug_id INTEGER,
+    link TEXT,
+    title TEXT,
+    heading TEXT,
+    type TEXT,
+    level TEXT,
+    description TEXT,
+    crawled_at TEXT
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    id INTEGER PRIMARY KEY,
+    course_slug TEXT NOT NULL,
+    position INTEGER,
+    title TEXT,
+    slug TEXT
+);
+CREATE INDEX IF NOT EXISTS chapters_course ON chapters (course_slug);
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    chapter_id INTEGER NOT NULL,
+    course_slug TEXT NOT NULL,
+    position INTEGER,
+    title TEXT,
+    slug TEXT,
+    type TEXT,
+    description TEXT,
+    attachment INTEGER,
+    project_required INTEGER,
+    inactive INTEGER
+);
+CREATE INDEX IF NOT EXISTS units_course ON units (course_slug);
+CREATE TABLE IF NOT EXISTS assets (
+    unit_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    path TEXT,
+    size INTEGER,
+    PRIMARY KEY (unit_id, kind, url)
+);
+CREATE TABLE IF NOT EXISTS downloads (
+    path TEXT PRIMARY KEY,
+    unit_id INTEGER,
+    url TEXT,
+    size INTEGER,
+    state TEXT,
+    updated_at TEXT,
+    sha256 TEXT,
+    sample_sha256 TEXT
+);
+CREATE INDEX IF NOT EXISTS downloads_unit ON downloads (unit_id);
+"""
+
+# Columns added after the first release, created on older index files
+_DOWNLOADS_MIGRATIONS = {"sha256": "TEXT", "sample_sha256": "TEXT"}
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(
+    kind UNINDEXED, ref UNINDEXED, course_slug UNINDEXED, title, description
+);
+"""
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class CourseIndex:
+    """
+    Local SQLite index of crawled courses, chapters, units, their assets and
+    download state.
+
+    Titles and descriptions are searchable through an FTS5 table when the
+    SQLite build has it, and through ``LIKE`` otherwise. The connection is
+    shared between threads behind a lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(_SCHEMA)
+        self._migrate()
+        try:
+            self.connection.executescript(_FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            logging.info("SQLite has no FTS5, falling back to LIKE search")
+            self.has_fts = False
+        self.connection.commit()
+
+    def _migrate(self) -> None:
+        columns = {
+            row["name"]
+            for row in self.connection.execute("PRAGMA table_info(downloads)")
+        }
+        for name, kind in _DOWNLOADS_MIGRATIONS.items():
+            if name not in columns:
+                self.connection.execute(f"ALTER TABLE downloads ADD COLUMN {name} {kind}")
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.close()
+
+    def upsert_course(self, course_info: CourseInfo) -> None:
+        """Replaces the stored chapters and units of a course with a fresh crawl."""
+        course = course_info.course
+        slug = course.slug or course_info.link.rstrip("/").split("/")[-1]
+        with self._lock, self.connection:
+            db = self.connection
+            db.execute(
+                "INSERT OR REPLACE INTO courses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    slug,
+                    course.slug_id,
+                    course_info.link,
+                    course.title,
+                    course.heading,
+                    course.type,
+                    course.level,
+                    course.description,
+                    _now(),
+                ),
+            )
+            db.execute("DELETE FROM chapters WHERE course_slug = ?", (slug,))
+            db.execute("DELETE FROM units WHERE course_slug = ?", (slug,))
+            search_rows = [("course", slug, slug, course.title, course.description)]
+            for i, chapter in enumerate(course_info.chapters.chapters):
+                db.execute(
+                    "INSERT OR REPLACE INTO chapters VALUES (?, ?, ?, ?, ?)",
+                    (chapter.id, slug, i, chapter.title, chapter.slug),
+                )
+                search_rows.append(("chapter", chapter.id, slug, chapter.title, ""))
+                db.executemany(
+                    "INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            unit.id,
+                            chapter.id,
+                            slug,
+                            j,
+                            unit.title,
+                            unit.slug,
+                            unit.type,
+                            unit.description,
+                            unit.attachment,
+                            unit.project_required,
+                            unit.inactive,
+                        )
+                        for j, unit in enumerate(chapter.unit_set)
+                    ],
+                )
+                search_rows.extend(
+                    ("unit", unit.id, slug, unit.title, unit.description)
+                    for unit in chapter.unit_set
+                )
+            if self.has_fts:
+                db.execute("DELETE FROM search WHERE course_slug = ?", (slug,))
+                db.executemany(
+                    "INSERT INTO search VALUES (?, ?, ?, ?, ?)", search_rows
+                )
+
+    def record_asset(
+        self, unit_id: int, kind: str, url: str, path: str, size: int | None = None
+    ) -> None:
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?)",
+                (unit_id, kind, url, path, size),
+            )
+
+    def record_download(
+        self,
+        path: str,
+        unit_id: int | None,
+        url: str,
+        size: int,
+        state: str = "done",
+        sha256: str | None = None,
+        sample_sha256: str | None = None,
+    ) -> None:
+        """
+        Record a finished file. A full digest recorded earlier is kept when
+        none is given and the sampled digest still matches.
+        """
+        with self._lock, self.connection:
+            self.connection.execute(
+                """
+                INSERT INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    unit_id = excluded.unit_id,
+                    url = excluded.url,
+                    size = excluded.size,
+                    state = excluded.state,
+                    updated_at = excluded.updated_at,
+                    sha256 = coalesce(
+                        excluded.sha256,
+                        CASE WHEN downloads.sample_sha256 = excluded.sample_sha256
+                             THEN downloads.sha256 END
+                    ),
+                    sample_sha256 = excluded.sample_sha256
+                """,
+                (path, unit_id, url, size, state, _now(), sha256, sample_sha256),
+            )
+
+    def downloads(
+        self, course_slug: str | None = None, state: str | None = None
+    ) -> list[dict]:
+        query = "SELECT d.* FROM downloads d"
+        conditions, params = [], []
+        if course_slug is not None:
+            query += " JOIN units u ON u.id = d.unit_id"
+            conditions.append("u.course_slug = ?")
+            params.append(course_slug)
+        if state is not None:
+            conditions.append("d.state = ?")
+            params.append(state)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            rows = self.connection.execute(query + " ORDER BY d.path", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def set_download_state(self, path: str, state: str) -> None:
+        with self._lock, self.connection:
+            self.connection.execute(
+                "UPDATE downloads SET state = ?, updated_at = ? WHERE path = ?",
+                (state, _now(), path),
+            )
+
+    def set_download_digest(self, path: str, sha256: str, sample_sha256: str) -> None:
+        with self._lock, self.connection:
+            self.connection.execute(
+                "UPDATE downloads SET sha256 = ?, sample_sha256 = ? WHERE path = ?",
+                (sha256, sample_sha256, path),
+            )
+
+    def unit_course_links(self, unit_ids: Iterable[int]) -> dict[int, str]:
+        """Course link of each unit, for re-downloading units by id."""
+        unit_ids = list(unit_ids)
+        if not unit_ids:
+            return {}
+        with self._lock:
+            rows = self.connection.execute(
+                f"""
+                SELECT u.id, c.link FROM units u JOIN courses c ON c.slug = u.course_slug
+                WHERE u.id IN ({", ".join("?" * len(unit_ids))})
+                """,
+                unit_ids,
+            ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def chapter_rows(self) -> list[sqlite3.Row]:
+        """``(course_slug, id, title, slug)`` of every chapter, in course order."""
+        with self._lock:
+            return self.connection.execute(
+                "SELECT course_slug, id, title, slug FROM chapters "
+                "ORDER BY course_slug, position"
+            ).fetchall()
+
+    def unit_rows(self) -> list[sqlite3.Row]:
+        """
+        ``(chapter_id, id, title, slug, type, attachment, project_required,
+        inactive)`` of every unit, in chapter order, without descriptions.
+        """
+        with self._lock:
+            return self.connection.execute(
+                "SELECT chapter_id, id, title, slug, type, attachment, "
+                "project_required, inactive FROM units ORDER BY chapter_id, position"
+            ).fetchall()
+
+    def unit_description(self, unit_id: int) -> str | None:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT description FROM units WHERE id = ?", (unit_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def search(self, text: str, limit: int = 50) -> list[dict]:
+        """Units, chapters and courses whose title or description match `text`."""
+        with self._lock:
+            if self.has_fts:
+                rows = self.connection.execute(
+                    """
+                    SELECT search.kind, search.ref, c.title AS course, c.link,
+                           search.title,
+                           snippet(search, 4, '[', ']', '...', 8) AS snippet
+                    FROM search JOIN courses c ON c.slug = search.course_slug
+                    WHERE search MATCH ? ORDER BY rank LIMIT ?
+                    """,
+                    (self._fts_query(text), limit),
+                ).fetchall()
+            else:
+                pattern = f"%{text}%"
+                rows = self.connection.execute(
+                    """
+                    SELECT 'unit' AS kind, u.id AS ref, c.title AS course, c.link,
+                           u.title, substr(u.description, 1, 80) AS snippet
+                    FROM units u JOIN courses c ON c.slug = u.course_slug
+                    WHERE u.title LIKE ? OR u.description LIKE ?
+                    UNION ALL
+                    SELECT 'course', c.slug, c.title, c.link, c.title,
+                           substr(c.description, 1, 80)
+                    FROM courses c WHERE c.title LIKE ? OR c.description LIKE ?
+                    LIMIT ?
+                    """,
+                    (pattern, pattern, pattern, pattern, limit),
+                ).fetchall()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _fts_query(text: str) -> str:
+        # Quote every term so user input cannot break the FTS query syntax
+        terms = [term.replace('"', '""') for term in text.split()]
+        return " ".join(f'"{term}"' for term in terms)
+
+    def stats(self) -> dict:
+        with self._lock:
+            db = self.connection
+            stats = {
+                "courses": db.execute("SELECT count(*) FROM courses").fetchone()[0],
+                "chapters": db.execute("SELECT count(*) FROM chapters").fetchone()[0],
+                "units": db.execute("SELECT count(*) FROM units").fetchone()[0],
+                "units_by_type": dict(
+                    db.execute(
+                        "SELECT type, count(*) FROM units GROUP BY type ORDER BY 2 DESC"
+                    ).fetchall()
+                ),
+                "downloads_by_state": dict(
+                    db.execute(
+                        "SELECT state, count(*) FROM downloads GROUP BY state"
+                    ).fetchall()
+                ),
+                "downloaded_bytes": db.execute(
+                    "SELECT coalesce(sum(size), 0) FROM downloads WHERE state = 'done'"
+                ).fetchone()[0],
+            }
+        return stats
+
+    def courses(self) -> list[dict]:
+        with self._lock:
+            rows = self.connection.execute(
+                """
+                SELECT c.slug, c.slug_id, c.title, c.link, c.crawled_at, count(u.id) AS units,
+                       sum(u.type = 'lecture') AS lectures
+                FROM courses c LEFT JOIN units u ON u.course_slug = c.slug
+                GROUP BY c.slug ORDER BY c.title
+                """
+            ).fetchall()
+        return [dict(row) for row in rows]
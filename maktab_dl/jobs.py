@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, NamedTuple
+from maktab_dl.compact import CompactCourse, compact_course
+from maktab_dl.layout import OutputLayout
+
+if TYPE_CHECKING:
+    from maktab_dl.handler import MaktabkhoonehCrawler
+
+JOBS_FILE_NAME = "maktab_jobs.db"
+
+
+class Job(NamedTuple):
+    id: int
+    course_link: str
+    unit_id: int
+    attempts: int
+    worker: str
+
+
+class JobStore(ABC):
+    """
+    Shared plan of unit downloads that workers claim under a lease.
+
+    A claimed job belongs to one worker until its lease runs out; workers
+    extend the lease with `heartbeat` while they download, so a job whose
+    worker died is handed to the next worker that asks for one. Subclass
+    this to put the queue behind another service.
+    """
+
+    @abstractmethod
+    def enqueue(self, course_link: str, unit_ids: list[int]) -> int:
+        """Adds units to the plan, ignoring ones already in it; returns how many were added."""
+
+    @abstractmethod
+    def claim(self, worker: str, lease_seconds: float) -> Job | None:
+        """Leases the next pending or abandoned job to `worker`."""
+
+    @abstractmethod
+    def heartbeat(self, job: Job, lease_seconds: float) -> bool:
+        """Extends the lease; False when the job was requeued to someone else."""
+
+    @abstractmethod
+    def complete(self, job: Job) -> bool:
+        ...
+
+    @abstractmethod
+    def fail(self, job: Job, error: str, max_attempts: int) -> bool:
+        """Requeues the job, or marks it failed after `max_attempts` tries."""
+
+    @abstractmethod
+    def counts(self) -> dict[str, int]:
+        ...
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    course_link TEXT NOT NULL,
+    unit_id INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL,
+    UNIQUE (course_link, unit_id)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_until);
+"""
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job store in a SQLite file, e.g. on a volume every worker host mounts.
+
+    Claims run in ``BEGIN IMMEDIATE`` transactions, so two workers can never
+    lease the same job. The file has to live on a filesystem with working
+    POSIX locks (local disk, NFSv4, SMB); WAL mode is only used locally.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 30.0):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path,
+            timeout=busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self.connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.close()
+
+    def _transaction(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            db = self.connection
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = db.execute(sql, params)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            return cursor
+
+    def enqueue(self, course_link: str, unit_ids: list[int]) -> int:
+        now = time.time()
+        with self._lock:
+            db = self.connection
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                before = db.total_changes
+                db.executemany(
+                    "INSERT OR IGNORE INTO jobs (course_link, unit_id, updated_at) "
+                    "VALUES (?, ?, ?)",
+                    [(course_link, unit_id, now) for unit_id in unit_ids],
+                )
+                added = db.total_changes - before
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return added
+
+    def claim(self, worker: str, lease_seconds: float) -> Job | None:
+        now = time.time()
+        with self._lock:
+            db = self.connection
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    """
+                    SELECT id, course_link, unit_id, attempts FROM jobs
+                    WHERE state = 'pending'
+                       OR (state = 'running' AND lease_until < ?)
+                    ORDER BY id LIMIT 1
+                    """,
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    db.execute("COMMIT")
+                    return None
+                job_id, course_link, unit_id, attempts = row
+                db.execute(
+                    """
+                    UPDATE jobs SET state = 'running', worker = ?, lease_until = ?,
+                                    attempts = attempts + 1, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (worker, now + lease_seconds, now, job_id),
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return Job(job_id, course_link, unit_id, attempts + 1, worker)
+
+    def heartbeat(self, job: Job, lease_seconds: float) -> bool:
+        now = time.time()
+        cursor = self._transaction(
+            "UPDATE jobs SET lease_until = ?, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND state = 'running'",
+            (now + lease_seconds, now, job.id, job.worker),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job: Job) -> bool:
+        cursor = self._transaction(
+            "UPDATE jobs SET state = 'done', lease_until = NULL, error = NULL, "
+            "updated_at = ? WHERE id = ? AND worker = ? AND state = 'running'",
+            (time.time(), job.id, job.worker),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job: Job, error: str, max_attempts: int) -> bool:
+        state = "failed" if job.attempts >= max_attempts else "pending"
+        cursor = self._transaction(
+            "UPDATE jobs SET state = ?, lease_until = NULL, error = ?, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND state = 'running'",
+            (state, error, time.time(), job.id, job.worker),
+        )
+        return cursor.rowcount == 1
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT state, count(*) FROM jobs GROUP BY state"
+            ).fetchall()
+        return dict(rows)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class DownloadWorker:
+    """
+    Claims unit jobs from a `JobStore` and downloads them with a crawler.
+
+    Run as many workers as there are hosts or disks; each one writes into
+    its crawler's output directory. The lease is renewed every
+    `heartbeat_interval` seconds while a unit downloads.
+    """
+
+    def __init__(
+        self,
+        crawler: MaktabkhoonehCrawler,
+        store: JobStore,
+        worker_id: str | None = None,
+        lease_seconds: float = 300,
+        heartbeat_interval: float = 60,
+        poll_interval: float = 5,
+        max_attempts: int = 3,
+        exit_when_idle: bool = False,
+    ):
+        self.crawler = crawler
+        self.store = store
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = min(heartbeat_interval, lease_seconds / 3)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.exit_when_idle = exit_when_idle
+        self.processed = 0
+        self._courses: dict[str, tuple[CompactCourse, OutputLayout]] = {}
+        self._stop = threading.Event()
+
+    def _course(self, course_link: str) -> tuple[CompactCourse, OutputLayout]:
+        if course_link not in self._courses:
+            # Workers live across many courses; keep only what downloads need
+            course_info = compact_course(self.crawler.crawl_course_link(course_link))
+            self.crawler.enroll_course_link(course_info.link)
+            layout = OutputLayout(self.crawler.output_path, course_info)
+            os.makedirs(layout.course_directory, exist_ok=True)
+            self.crawler.quality_policy.start_course(course_info)
+            self._courses[course_link] = (course_info, layout)
+        return self._courses[course_link]
+
+    def _keep_alive(self, job: Job, done: threading.Event) -> None:
+        while not done.wait(self.heartbeat_interval):
+            if not self.store.heartbeat(job, self.lease_seconds):
+                logging.error(f"Lost the lease on job {job.id}")
+                return
+
+    def process(self, job: Job) -> bool:
+        logging.info(f"Worker {self.worker_id} claimed unit {job.unit_id} (job {job.id})")
+        done = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._keep_alive, args=(job, done), daemon=True
+        )
+        heartbeat.start()
+        try:
+            course_info, layout = self._course(job.course_link)
+            failed = self.crawler._download_unit(
+                course_info.link, layout.unit(job.unit_id)
+            )
+            if failed:
+                raise RuntimeError(f"{len(failed)} assets failed, first: {failed[0]}")
+        except Exception as e:
+            logging.error(f"Job {job.id} failed: {e}")
+            self.store.fail(job, str(e), self.max_attempts)
+            return False
+        finally:
+            done.set()
+            heartbeat.join()
+        if not self.store.complete(job):
+            logging.error(f"Job {job.id} was requeued before it finished")
+        self.processed += 1
+        return True
+
+    def run(self) -> int:
+        """Processes jobs until stopped, or until the queue is empty with `exit_when_idle`."""
+        logging.info(f"Worker {self.worker_id} started")
+        try:
+            while not self._stop.is_set():
+                job = self.store.claim(self.worker_id, self.lease_seconds)
+                if job is None:
+                    if self.exit_when_idle:
+                        break
+                    self._stop.wait(self.poll_interval)
+                    continue
+                self.process(job)
+        except KeyboardInterrupt:
+            logging.info(f"Stopping worker {self.worker_id}")
+        if self.crawler.post_processor is not None:
+            self.crawler.post_processor.wait()
+        if self.crawler.blob_store is not None:
+            self.crawler.blob_store.save()
+        logging.info(f"Worker {self.worker_id} processed {self.processed} units")
+        return self.processed
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def enqueue_course(
+    crawler: MaktabkhoonehCrawler, store: JobStore, course_link: str
+) -> int:
+    """Crawls a course and plans a job for every unit; returns how many were new."""
+    course_info = crawler.crawl_course_link(course_link)
+    unit_ids = [
+        unit.id for chapter in course_info.chapters.chapters for unit in chapter.unit_set
+    ]
+    added = store.enqueue(course_info.link, unit_ids)
+    logging.info(
+        f"Enqueued {added} of {len(unit_ids)} units of {course_info.course.title}"
+    )
+    return added
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import os
+import re
+from typing import TYPE_CHECKING, NamedTuple
+from maktab_dl.utils import sanitize_filename
+
+if TYPE_CHECKING:
+    from maktab_dl.schemas import Chapter, CourseInfo, Unit
+
+# Files that belong to an unfinished write, not to a downloaded asset
+PARTIAL_SUFFIXES = (
+    ".part", ".part.json", ".hedge", ".segments", ".tmp", ".broken"
+)
+MEDIA_EXTENSIONS = ("mp4", "ts", "m4a", "webm", "mkv")
+
+_UNIT_NUMBER = re.compile(r"^(\d+)[_ ]")
+
+
+class UnitPaths(NamedTuple):
+    chapter_index: int
+    chapter: Chapter
+    unit_index: int
+    unit: Unit
+    chapter_directory: str
+    unit_name: str
+
+
+class Asset(NamedTuple):
+    """A downloadable file of a unit and where the crawler would write it."""
+
+    course_link: str
+    paths: UnitPaths
+    # page, video, subtitle, attachment or file
+    kind: str
+    url: str
+    path: str
+    # Bytes, when already known from a plan or a HEAD request
+    size: int | None = None
+
+    @property
+    def unit(self) -> Unit:
+        return self.paths.unit
+
+
+def _partial_target(path: str) -> str:
+    """The file an unfinished write such as ``a.mp4.part.json`` belongs to."""
+    for suffix in sorted(PARTIAL_SUFFIXES, key=len, reverse=True):
+        if path.endswith(suffix):
+            return path[: -len(suffix)]
+    return path
+
+
+class LocalIndex:
+    """
+    Files of a course directory, gathered by one ``os.scandir`` walk.
+
+    Files are grouped by chapter directory and the unit number every name
+    the crawler writes starts with (``3_Title.mp4``, ``3_Title_file.rar``,
+    ``3 Title.rar`` or anything inside the ``3_Title/`` lecture folder), so
+    the files of a unit are a single dictionary lookup.
+    """
+
+    def __init__(self, course_directory: str):
+        self.course_directory = course_directory
+        # (chapter directory name, unit number) -> [(path, size), ...]
+        self.units: dict[tuple[str, int], list[tuple[str, int]]] = {}
+        # Paths with an unfinished write next to them (``<path>.part``...)
+        self.partial: set[str] = set()
+        self._scan()
+
+    def _scan(self) -> None:
+        if not os.path.isdir(self.course_directory):
+            return
+        with os.scandir(self.course_directory) as chapters:
+            for chapter_entry in chapters:
+                if chapter_entry.is_dir():
+                    self._scan_chapter(chapter_entry.name, chapter_entry.path)
+
+    def _scan_chapter(self, chapter_name: str, chapter_path: str) -> None:
+        stack = [(chapter_path, None)]
+        while stack:
+            path, unit_number = stack.pop()
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    number = unit_number
+                    if number is None:
+                        match = _UNIT_NUMBER.match(entry.name)
+                        if match is None:
+                            continue
+                        number = int(match.group(1))
+                    if entry.is_dir():
+                        stack.append((entry.path, number))
+                    elif entry.name.endswith(PARTIAL_SUFFIXES):
+                        self.partial.add(_partial_target(entry.path))
+                    else:
+                        self.units.setdefault((chapter_name, number), []).append(
+                            (entry.path, entry.stat().st_size)
+                        )
+
+    def unit_files(self, paths: UnitPaths) -> list[tuple[str, int]]:
+        """Non-empty files written for a unit."""
+        chapter_name = os.path.basename(paths.chapter_directory)
+        files = self.units.get((chapter_name, paths.unit_index + 1), [])
+        clean_name = paths.unit_name.replace("_", " ").strip()
+        return [
+            (path, size)
+            for path, size in files
+            if size > 0
+            and (
+                os.path.relpath(path, paths.chapter_directory).startswith(
+                    (paths.unit_name, clean_name)
+                )
+            )
+        ]
+
+
+class OutputLayout:
+    """
+    Maps a course to the directory layout the crawler writes.
+
+    ``<output>/<course title>/<i>_<chapter title>/<j>_<unit title>...``; a
+    lecture with a subtitle keeps its video and subtitle in a
+    ``<j>_<unit title>/`` folder. The downloader and the reporting code both
+    resolve paths here so they cannot drift apart.
+    """
+
+    def __init__(self, output_path: str, course_info: CourseInfo):
+        self.output_path = output_path
+        self.course_info = course_info
+        self.course_directory = os.path.join(
+            output_path, sanitize_filename(course_info.course.title)
+        )
+        self._units: dict[int, UnitPaths] = {}
+        for i, chapter in enumerate(course_info.chapters.chapters):
+            chapter_directory = self.chapter_directory(i, chapter)
+            for j, unit in enumerate(chapter.unit_set):
+                self._units[unit.id] = UnitPaths(
+                    i, chapter, j, unit, chapter_directory, self.unit_name(j, unit)
+                )
+
+    def chapter_directory(self, chapter_index: int, chapter: Chapter) -> str:
+        return os.path.join(
+            self.course_directory,
+            f"{chapter_index + 1}_{sanitize_filename(chapter.title)}",
+        )
+
+    def chapters(self) -> list[tuple[Chapter, str]]:
+        """Every chapter in course order with its directory, empty ones included."""
+        return [
+            (chapter, self.chapter_directory(i, chapter))
+            for i, chapter in enumerate(self.course_info.chapters.chapters)
+        ]
+
+    @staticmethod
+    def unit_name(unit_index: int, unit: Unit) -> str:
+        return f"{unit_index + 1}_{sanitize_filename(unit.title)}"
+
+    def unit(self, unit_id: int) -> UnitPaths:
+        return self._units[unit_id]
+
+    def units(self) -> list[UnitPaths]:
+        """All units in course order."""
+        return list(self._units.values())
+
+    def build_index(self) -> LocalIndex:
+        return LocalIndex(self.course_directory)
+
+    def unit_files(self, unit_id: int, index: LocalIndex) -> list[tuple[str, int]]:
+        return index.unit_files(self._units[unit_id])
+
+    def is_complete(
+        self,
+        unit_id: int,
+        index: LocalIndex,
+        recorded: dict[str, int] | None = None,
+    ) -> bool:
+        """
+        Whether the main content of a unit is on disk: the video for a
+        lecture, the saved page for any other unit.
+
+        A video with an unfinished write next to it does not count, nor one
+        whose size differs from the size `recorded` for its absolute path
+        (e.g. the finished downloads of a `CourseIndex`).
+        """
+        paths = self._units[unit_id]
+        files = index.unit_files(paths)
+        if paths.unit.type == "lecture":
+            recorded = recorded or {}
+            return any(
+                path.rsplit(".", 1)[-1] in MEDIA_EXTENSIONS
+                and path not in index.partial
+                and recorded.get(os.path.abspath(path), size) == size
+                for path, size in files
+            )
+        html_file = os.path.join(paths.chapter_directory, f"{paths.unit_name}.html")
+        return any(path == html_file for path, _ in files)
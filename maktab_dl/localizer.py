@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from urllib.parse import urljoin, urlsplit
+from maktab_dl.layout import OutputLayout, UnitPaths
+from maktab_dl.parsing import scan_unit_file
+from maktab_dl.postprocess import rewrite_page_links
+from maktab_dl.utils import sanitize_filename
+from maktab_dl.validators import write_if_changed
+
+if TYPE_CHECKING:
+    from maktab_dl.handler import MaktabkhoonehCrawler
+    from maktab_dl.schemas import CourseInfo
+
+ASSETS_DIRECTORY_NAME = "_assets"
+
+# (tag, attribute) pairs that load a static file when the page is shown;
+# ``None`` is CSS in a style attribute or <style> element
+_ASSET_LINKS = {
+    ("img", "src"),
+    ("script", "src"),
+    ("embed", "src"),
+    ("object", "data"),
+    ("input", "src"),
+    ("link", "href"),
+}
+_ASSET_LINK_RELS = {"stylesheet", "icon", "shortcut", "preload", "apple-touch-icon"}
+_CSS_URL = re.compile(r"""url\(\s*['"]?([^'")]+)['"]?\s*\)""")
+
+
+def collect_page_assets(page_path: str, base_url: str) -> set[str]:
+    """Absolute URLs of the images, styles, scripts and embeds a saved page loads."""
+    import lxml.html
+
+    with open(page_path, "rb") as f:
+        document = lxml.html.fromstring(f.read().decode("utf-8"))
+    document.make_links_absolute(base_url, resolve_base_href=True)
+    assets = set()
+    for element, attribute, link, _ in document.iterlinks():
+        if not link.startswith(("http://", "https://")):
+            continue
+        if attribute in (None, "style"):
+            assets.add(link)
+        elif (element.tag, attribute) in _ASSET_LINKS:
+            if element.tag == "link":
+                rels = set((element.get("rel") or "").lower().split())
+                if not rels & _ASSET_LINK_RELS:
+                    continue
+            assets.add(link)
+    return assets
+
+
+def asset_file_name(url: str) -> str:
+    """Stable, collision-free local name for an asset URL."""
+    path = urlsplit(url).path
+    name = sanitize_filename(os.path.basename(path)) or "asset"
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+    return f"{digest}_{name}"
+
+
+class AssetLocalizer:
+    """
+    Makes the saved text, quiz and assignment pages of a course usable offline.
+
+    Every image, stylesheet, script and embedded file referenced by the
+    saved pages is collected across the whole course, deduplicated by URL
+    and fetched concurrently through the crawler's HTTP client into
+    ``<course>/_assets/``; images referenced from those stylesheets follow
+    in a second round. Each page then gets an offline copy (see
+    `rewrite_page_links`) pointing at the local files.
+    """
+
+    def __init__(self, crawler: MaktabkhoonehCrawler, max_workers: int = 8):
+        self.crawler = crawler
+        self.max_workers = max_workers
+
+    def _fetch(self, url: str, output_file: str) -> bool | None:
+        """True when fetched, False when already on disk, None on failure."""
+        if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+            return False
+        try:
+            response = self.crawler.request(url=url)
+            response.raise_for_status()
+        except Exception as e:
+            logging.error(f"Error fetching asset {url}: {e}")
+            return None
+        write_if_changed(output_file, response.content)
+        return True
+
+    def _fetch_all(
+        self, urls: set[str], assets_directory: str
+    ) -> tuple[dict[str, str], set[str]]:
+        """Local paths of the assets on disk, and the URLs fetched just now."""
+        targets = {
+            url: os.path.join(assets_directory, asset_file_name(url)) for url in urls
+        }
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(
+                executor.map(lambda item: (item[0], self._fetch(*item)), targets.items())
+            )
+        local_files = {url: targets[url] for url, state in results if state is not None}
+        return local_files, {url for url, state in results if state}
+
+    def _localize_stylesheets(
+        self, local_files: dict[str, str], fetched: set[str], assets_directory: str
+    ) -> None:
+        """Fetch what new stylesheets load and point them at the copies."""
+        # Stylesheets already on disk were rewritten when they were fetched
+        stylesheets = {
+            url: path
+            for url, path in local_files.items()
+            if url in fetched and path.endswith(".css")
+        }
+        references: dict[str, set[str]] = {}
+        for url, path in stylesheets.items():
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                for match in _CSS_URL.finditer(f.read()):
+                    if not match.group(1).startswith("data:"):
+                        references.setdefault(url, set()).add(match.group(1))
+        wanted = {
+            urljoin(url, link) for url, links in references.items() for link in links
+        }
+        nested, _ = self._fetch_all(wanted - set(local_files), assets_directory)
+        local_files.update(nested)
+        for url, links in references.items():
+            path = stylesheets[url]
+
+            def localize(match: re.Match) -> str:
+                local_path = local_files.get(urljoin(url, match.group(1)))
+                if local_path is None:
+                    return match.group(0)
+                return f'url("{os.path.relpath(local_path, assets_directory)}")'
+
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                css = f.read()
+            write_if_changed(path, _CSS_URL.sub(localize, css).encode("utf-8"))
+
+    def localize_course(self, course_info: CourseInfo) -> int:
+        """Localize the saved pages of a course; returns how many assets are on disk."""
+        layout = OutputLayout(self.crawler.output_path, course_info)
+        assets_directory = os.path.join(layout.course_directory, ASSETS_DIRECTORY_NAME)
+        pages: list[tuple[str, str, UnitPaths]] = []
+        for paths in layout.units():
+            if paths.unit.type == "lecture":
+                continue
+            page_path = os.path.join(paths.chapter_directory, f"{paths.unit_name}.html")
+            if os.path.exists(page_path):
+                unit_url = self.crawler._unit_url(
+                    course_info.link, paths.chapter, paths.unit
+                )
+                pages.append((page_path, unit_url, paths))
+
+        page_assets: dict[str, set[str]] = {}
+        for page_path, unit_url, _ in pages:
+            try:
+                page_assets[page_path] = collect_page_assets(page_path, unit_url)
+            except Exception as e:
+                logging.error(f"Error reading assets of {page_path}: {e}")
+        wanted = set().union(*page_assets.values()) if page_assets else set()
+        logging.info(
+            f"Localizing {len(wanted)} assets of {len(pages)} pages "
+            f"in {course_info.course.title}"
+        )
+        os.makedirs(assets_directory, exist_ok=True)
+        local_files, fetched = self._fetch_all(wanted, assets_directory)
+        self._localize_stylesheets(local_files, fetched, assets_directory)
+
+        for page_path, unit_url, paths in pages:
+            # Keep the attachment/file links the post-processor would localize
+            link_map = dict(local_files)
+            try:
+                for _, url, output_file in self.crawler._collect_unit_links(
+                    scan_unit_file(page_path),
+                    paths.chapter_directory,
+                    paths.unit_name,
+                    paths.unit,
+                ):
+                    if os.path.exists(output_file):
+                        link_map[url] = output_file
+                rewrite_page_links(page_path, link_map, unit_url)
+            except Exception as e:
+                logging.error(f"Error rewriting {page_path}: {e}")
+        logging.info(f"Localized {len(local_files)} assets into {assets_directory}")
+        return len(local_files)
@@ -1,23 +1,145 @@
+from __future__ import annotations
+
+import atexit
+import json
 import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from maktab_dl.utils import get_user_default_path
+
+# Course/unit the current thread works on, attached to its log records
+_context = threading.local()
+
+
+def set_log_context(**fields) -> None:
+    """Attach fields such as ``course`` and ``unit_id`` to this thread's log records."""
+    _context.__dict__.update(fields)
+
+
+def clear_log_context() -> None:
+    _context.__dict__.clear()
+
+
+def _subsystem(record: logging.LogRecord) -> str:
+    # The package logs through the root logger; name records by module instead
+    return record.module if record.name == "root" else record.name
+
+
+class ContextFilter(logging.Filter):
+    """
+    Applies per-subsystem levels and stamps records with the thread's context.
+
+    Runs in the thread that logs, before a record is queued, so only records
+    that will be written pay for the queue.
+    """
+
+    def __init__(self, default_level: int, levels: dict[str, int] | None = None):
+        super().__init__()
+        self.default_level = default_level
+        self.levels = levels or {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        subsystem = _subsystem(record)
+        if record.levelno < self.levels.get(subsystem, self.default_level):
+            return False
+        record.subsystem = subsystem
+        record.context = dict(_context.__dict__)
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queues records without formatting them.
+
+    The stock `QueueHandler` renders the message in the calling thread so
+    records can cross process boundaries; the listener here runs in the same
+    process, so formatting is left to it. Tracebacks are rendered up front
+    to drop the references to the worker's frames.
+    """
+
+    _traceback_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = self._traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record, with the course/unit context as fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "subsystem": getattr(record, "subsystem", record.name),
+            "thread": record.threadName,
+            "message": record.getMessage(),
+            **getattr(record, "context", {}),
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _level(value) -> int:
+    return value if isinstance(value, int) else logging.getLevelName(value.upper())
+
+
+def parse_log_levels(value: str) -> dict[str, int]:
+    """Parses per-subsystem levels such as ``handler=WARNING,tuning=DEBUG``."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, level = item.partition("=")
+        resolved = _level(level.strip())
+        if not name or not isinstance(resolved, int):
+            raise ValueError(f"Invalid log level: {item}")
+        levels[name.strip()] = resolved
+    return levels
 
 
 # Define a function to set up logging
-def setup_logging(log_file="maktab_dl.log", log_level=logging.INFO):
+def setup_logging(
+    log_file="maktab_dl.log",
+    log_level=logging.INFO,
+    json_format=False,
+    levels=None,
+    max_bytes=5 * 1024 * 1024,
+    backup_count=5,
+):
     """
     Configures logging to output to console and a rotating log file.
 
+    Records are put on a queue and formatted and written by a listener
+    thread, so downloading threads never block on console or disk I/O.
+
     Args:
-        log_file (str): Path to the log file.
+        log_file (str): Path to the log file; relative paths are placed in
+            the user directory, and None or "" disables the file.
         log_level (int): Logging level (e.g., logging.DEBUG, logging.INFO).
+        json_format (bool): Write the log file (or the console, without a
+            file) as JSON lines with course/unit context fields.
+        levels (dict): Levels per subsystem, either a module of this package
+            (``handler``, ``tuning``...) or a library logger (``httpx``).
     """
+    log_level = _level(log_level)
+    levels = {name: _level(level) for name, level in (levels or {}).items()}
 
     # Configure httpx logging to avoid spamming logs
-    logging.getLogger("httpx").setLevel(logging.WARNING)
-    logging.getLogger("httpcore").setLevel(logging.WARNING)
+    for name in ("httpx", "httpcore"):
+        levels.setdefault(name, logging.WARNING)
+        logging.getLogger(name).setLevel(levels[name])
 
     # Set up the logger
     logger = logging.getLogger()
-    logger.setLevel(log_level)
+    logger.setLevel(min(log_level, *levels.values()))
+    if getattr(logger, "_maktab_dl_configured", False):
+        return
+    logger._maktab_dl_configured = True
 
     # Formatter for logs
     formatter = logging.Formatter(
@@ -27,23 +149,26 @@ def setup_logging(log_file="maktab_dl.log", log_level=logging.INFO):
 
     # Console Handler
     console_handler = logging.StreamHandler()
-    console_handler.setLevel(log_level)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-
-    # TODO: Add FileHandler for logging to a file
-    # Ensure the directory exists for the log file
-    # package_dir = get_user_default_path()
-    # log_dir = os.path.join(package_dir, log_file)
+    console_handler.setFormatter(
+        JsonLinesFormatter() if json_format and not log_file else formatter
+    )
+    handlers = [console_handler]
 
     # File Handler with rotation
-    # file_handler = RotatingFileHandler(
-    #     log_dir, maxBytes=5 * 1024 * 1024, backupCount=5, encoding="UTF-8"
-    # )
-    # file_handler.setLevel(log_level)
-    # file_handler.setFormatter(formatter)
-    # logger.addHandler(file_handler)
-
+    if log_file:
+        log_path = os.path.join(get_user_default_path(), log_file)
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        file_handler = RotatingFileHandler(
+            log_path, maxBytes=max_bytes, backupCount=backup_count, encoding="UTF-8"
+        )
+        file_handler.setFormatter(JsonLinesFormatter() if json_format else formatter)
+        handlers.append(file_handler)
 
-# Initialize logging
-setup_logging()
+    queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(ContextFilter(log_level, levels))
+    logger.addHandler(queue_handler)
+    listener = QueueListener(queue_handler.queue, *handlers)
+    listener.start()
+    # Flush what is still queued when the program exits
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,352 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple
+from urllib.parse import urljoin
+
+
+class ManifestError(Exception):
+    """Raised for playlists we cannot turn into a single file."""
+
+
+class Variant(NamedTuple):
+    url: str
+    bandwidth: int = 0
+    resolution: str = ""
+
+
+class Track(NamedTuple):
+    """A list of media segments that concatenate into one playable file."""
+
+    kind: str  # "video" or "audio"
+    segments: list[str]
+    init: str | None = None
+    bandwidth: int = 0
+    ext: str = "mp4"
+    duration: float = 0.0
+    # Tracks of one DASH adaptation set are alternatives of each other
+    group: int = 0
+
+
+def manifest_kind(url: str) -> str | None:
+    """Returns "hls" or "dash" when `url` points at a streaming manifest."""
+    path = url.split("?")[0].split("#")[0].lower()
+    if path.endswith(".m3u8"):
+        return "hls"
+    if path.endswith(".mpd"):
+        return "dash"
+    return None
+
+
+def _hls_attributes(line: str) -> dict[str, str]:
+    attributes = line.split(":", 1)[1] if ":" in line else ""
+    return {
+        key: value.strip('"')
+        for key, value in re.findall(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', attributes)
+    }
+
+
+def parse_hls_master(text: str, base_url: str) -> list[Variant]:
+    """Lists the variant streams of an HLS master playlist (empty for media playlists)."""
+    variants = []
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    for index, line in enumerate(lines):
+        if not line.startswith("#EXT-X-STREAM-INF"):
+            continue
+        attributes = _hls_attributes(line)
+        uri = next(
+            (x for x in lines[index + 1 :] if not x.startswith("#")), None
+        )
+        if uri:
+            variants.append(
+                Variant(
+                    url=urljoin(base_url, uri),
+                    bandwidth=int(attributes.get("BANDWIDTH", 0) or 0),
+                    resolution=attributes.get("RESOLUTION", ""),
+                )
+            )
+    return variants
+
+
+def parse_hls_media(text: str, base_url: str, bandwidth: int = 0) -> Track:
+    """Turns an HLS media playlist into a `Track`."""
+    segments = []
+    init = None
+    duration = 0.0
+    for line in (x.strip() for x in text.splitlines()):
+        if not line:
+            continue
+        if line.startswith("#EXT-X-KEY"):
+            method = _hls_attributes(line).get("METHOD", "NONE")
+            if method != "NONE":
+                raise ManifestError(f"Encrypted HLS streams are not supported: {method}")
+        elif line.startswith("#EXT-X-BYTERANGE"):
+            raise ManifestError("HLS byte-range segments are not supported")
+        elif line.startswith("#EXT-X-MAP"):
+            uri = _hls_attributes(line).get("URI")
+            if uri:
+                init = urljoin(base_url, uri)
+        elif line.startswith("#EXTINF"):
+            try:
+                duration += float(line.split(":", 1)[1].split(",")[0])
+            except ValueError:
+                pass
+        elif not line.startswith("#"):
+            segments.append(urljoin(base_url, line))
+    if not segments:
+        raise ManifestError("HLS playlist has no segments")
+    # Fragmented MP4 playlists declare an init section, MPEG-TS ones do not
+    ext = "mp4" if init else "ts"
+    return Track("video", segments, init, bandwidth, ext, duration)
+
+
+def _local_name(element: ET.Element) -> str:
+    return element.tag.rsplit("}", 1)[-1]
+
+
+def _children(element: ET.Element, name: str) -> list[ET.Element]:
+    return [x for x in element if _local_name(x) == name]
+
+
+def _child(element: ET.Element | None, name: str) -> ET.Element | None:
+    if element is None:
+        return None
+    return next(iter(_children(element, name)), None)
+
+
+def _inherited(name: str, *elements: ET.Element) -> ET.Element | None:
+    """Returns the first `name` child, looking from the innermost element out."""
+    # Elements without children are falsy, so compare against None explicitly
+    return next(
+        (x for x in (_child(e, name) for e in elements) if x is not None), None
+    )
+
+
+def _iso_duration(value: str | None) -> float:
+    match = re.fullmatch(
+        r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:([\d.]+)S)?)?", value or ""
+    )
+    if not match:
+        return 0.0
+    days, hours, minutes, seconds = match.groups()
+    return (
+        int(days or 0) * 86400
+        + int(hours or 0) * 3600
+        + int(minutes or 0) * 60
+        + float(seconds or 0)
+    )
+
+
+def _fill_template(
+    template: str, representation_id: str, bandwidth: int, number=None, time_=None
+) -> str:
+    def replace(match: re.Match) -> str:
+        name, width = match.group(1), match.group(2)
+        if name == "":
+            return "$"
+        value = {
+            "RepresentationID": representation_id,
+            "Bandwidth": bandwidth,
+            "Number": number,
+            "Time": time_,
+        }[name]
+        if width and isinstance(value, int):
+            return f"{value:{width[1:]}}"
+        return str(value)
+
+    return re.sub(
+        r"\$(RepresentationID|Bandwidth|Number|Time|)(%0\d+d)?\$", replace, template
+    )
+
+
+def parse_dash(text: str, base_url: str) -> list[Track]:
+    """
+    Every video/audio representation of the first period of a static DASH
+    manifest; representations of one adaptation set share a `group`.
+    """
+    root = ET.fromstring(text)
+    if root.get("type") == "dynamic":
+        raise ManifestError("Live DASH manifests are not supported")
+    period = _child(root, "Period")
+    if period is None:
+        raise ManifestError("DASH manifest has no period")
+    total_duration = _iso_duration(
+        period.get("duration") or root.get("mediaPresentationDuration")
+    )
+    base = base_url
+    for element in (root, period):
+        base_element = _child(element, "BaseURL")
+        if base_element is not None and base_element.text:
+            base = urljoin(base, base_element.text.strip())
+
+    tracks = []
+    for group, adaptation in enumerate(_children(period, "AdaptationSet")):
+        for representation in _children(adaptation, "Representation"):
+            mime_type = (
+                representation.get("mimeType") or adaptation.get("mimeType") or ""
+            )
+            kind = adaptation.get("contentType") or mime_type.split("/")[0]
+            if kind not in ("video", "audio"):
+                continue
+            rep_base = base
+            for element in (adaptation, representation):
+                base_element = _child(element, "BaseURL")
+                if base_element is not None and base_element.text:
+                    rep_base = urljoin(rep_base, base_element.text.strip())
+            representation_id = representation.get("id", "")
+            bandwidth = int(representation.get("bandwidth", 0))
+            ext = "m4a" if kind == "audio" else "mp4"
+            if "webm" in mime_type:
+                ext = "webm"
+
+            template = _inherited("SegmentTemplate", representation, adaptation)
+            segment_list = _inherited("SegmentList", representation, adaptation)
+            init = None
+            segments = []
+            if template is not None:
+                fill = lambda value, **kw: urljoin(  # noqa: E731
+                    rep_base,
+                    _fill_template(value, representation_id, bandwidth, **kw),
+                )
+                if template.get("initialization"):
+                    init = fill(template.get("initialization"))
+                media = template.get("media", "")
+                number = int(template.get("startNumber", 1))
+                timescale = int(template.get("timescale", 1))
+                timeline = _child(template, "SegmentTimeline")
+                if timeline is not None:
+                    current = 0
+                    for s in _children(timeline, "S"):
+                        current = int(s.get("t", current))
+                        for _ in range(int(s.get("r", 0)) + 1):
+                            segments.append(
+                                fill(media, number=number, time_=current)
+                            )
+                            current += int(s.get("d"))
+                            number += 1
+                else:
+                    duration = int(template.get("duration", 0))
+                    if not duration or not total_duration:
+                        raise ManifestError(
+                            "DASH template without timeline or duration"
+                        )
+                    count = int(-(-total_duration * timescale // duration))
+                    for k in range(count):
+                        segments.append(
+                            fill(media, number=number + k, time_=k * duration)
+                        )
+            elif segment_list is not None:
+                initialization = _child(segment_list, "Initialization")
+                if initialization is not None and initialization.get("sourceURL"):
+                    init = urljoin(rep_base, initialization.get("sourceURL"))
+                segments = [
+                    urljoin(rep_base, x.get("media"))
+                    for x in _children(segment_list, "SegmentURL")
+                    if x.get("media")
+                ]
+            else:
+                # A single self-contained file per representation
+                segments = [rep_base]
+            if not segments:
+                continue
+            tracks.append(
+                Track(kind, segments, init, bandwidth, ext, total_duration, group)
+            )
+    if not tracks:
+        raise ManifestError("DASH manifest has no downloadable tracks")
+    return tracks
+
+
+class SegmentDownloader:
+    """
+    Fetches the segments of a `Track` in parallel and appends them in order
+    to one output file.
+
+    At most ``2 * max_workers`` segments are held in memory. Progress is
+    written next to the ``.part`` file after every segment, so an interrupted
+    download resumes from the first missing segment.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], bytes],
+        max_workers: int = 4,
+        retries: int = 3,
+        on_segment: Callable[[int], None] | None = None,
+    ):
+        self.fetch = fetch
+        self.max_workers = max(1, max_workers)
+        self.retries = retries
+        # Called with the byte size of each segment once it is written
+        self.on_segment = on_segment
+
+    def _fetch_with_retry(self, url: str) -> bytes:
+        for attempt in range(self.retries):
+            try:
+                return self.fetch(url)
+            except Exception as e:
+                if attempt == self.retries - 1:
+                    raise
+                delay = 2**attempt
+                logging.error(f"Segment failed, retrying in {delay}s: {url}: {e}")
+                time.sleep(delay)
+
+    def download(self, track: Track, output_file: str) -> bool:
+        """Returns True when `output_file` was completed by this call."""
+        if os.path.exists(output_file):
+            logging.info(f"File already downloaded: {output_file}")
+            return False
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        part_file = f"{output_file}.part"
+        state_file = f"{output_file}.segments"
+        urls = ([track.init] if track.init else []) + track.segments
+        # A re-encoded playlist may keep its segment count; only resume onto
+        # the segments of the very same playlist
+        playlist = hashlib.sha256("\n".join(urls).encode()).hexdigest()
+
+        done, offset = 0, 0
+        if os.path.exists(part_file) and os.path.exists(state_file):
+            with open(state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("playlist") == playlist:
+                done, offset = state["done"], state["size"]
+                logging.info(f"Resuming {output_file} at segment {done}/{len(urls)}")
+            else:
+                logging.info(f"Playlist changed, restarting {output_file}")
+        mode = "r+b" if done else "wb"
+        with open(part_file, mode) as out:
+            out.truncate(offset)
+            out.seek(offset)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                pending = deque()
+                remaining = iter(enumerate(urls[done:], start=done))
+                for index, url in remaining:
+                    pending.append(executor.submit(self._fetch_with_retry, url))
+                    if len(pending) >= self.max_workers * 2:
+                        break
+                while pending:
+                    data = pending.popleft().result()
+                    out.write(data)
+                    out.flush()
+                    done += 1
+                    offset += len(data)
+                    with open(state_file, "w", encoding="utf-8") as f:
+                        json.dump(
+                            {"playlist": playlist, "done": done, "size": offset}, f
+                        )
+                    if self.on_segment:
+                        self.on_segment(len(data))
+                    next_item = next(remaining, None)
+                    if next_item is not None:
+                        pending.append(
+                            executor.submit(self._fetch_with_retry, next_item[1])
+                        )
+        os.replace(part_file, output_file)
+        os.remove(state_file)
+        return True
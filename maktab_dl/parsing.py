@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import logging
+from typing import Iterable, NamedTuple
+
+# Pages smaller than this are parsed in the calling thread; shipping them to
+# another process costs more than parsing them
+PARSE_OFFLOAD_MIN_SIZE = 64 * 1024
+
+
+class UnitLinks(NamedTuple):
+    """
+    Links found on a unit page, as written in the page (possibly relative).
+
+    Small and picklable, so it is what parse workers send back instead of
+    an lxml tree.
+    """
+
+    videos: tuple[str, ...] = ()
+    subtitles: tuple[str, ...] = ()
+    attachments: tuple[str, ...] = ()
+    # <a> links to .rar or .zip files
+    archives: tuple[str, ...] = ()
+
+    @property
+    def subtitle(self) -> str | None:
+        return next(iter(self.subtitles), None)
+
+    @property
+    def attachment(self) -> str | None:
+        return next(iter(self.attachments), None)
+
+    @property
+    def rar_files(self) -> tuple[str, ...]:
+        return tuple(link for link in self.archives if ".rar" in link)
+
+
+class _UnitLinkTarget:
+    """lxml parser target that keeps only the elements we download from."""
+
+    def __init__(self):
+        self.videos: list[str] = []
+        self.subtitles: list[str] = []
+        self.attachments: list[str] = []
+        self.archives: list[str] = []
+        self._depth = 0
+        # Depths of open <div class="unit-content--download"> elements
+        self._download_divs: list[int] = []
+
+    def start(self, tag: str, attrib) -> None:
+        self._depth += 1
+        if tag == "source":
+            if attrib.get("src"):
+                self.videos.append(attrib["src"])
+        elif tag == "track":
+            if attrib.get("kind") == "subtitles" and attrib.get("src"):
+                self.subtitles.append(attrib["src"])
+        elif tag == "div":
+            if attrib.get("class") == "unit-content--download":
+                self._download_divs.append(self._depth)
+        elif tag == "a":
+            href = attrib.get("href")
+            if href is None:
+                return
+            if self._download_divs and self._download_divs[-1] == self._depth - 1:
+                self.attachments.append(href)
+            if ".rar" in href or ".zip" in href:
+                self.archives.append(href)
+
+    def end(self, tag: str) -> None:
+        if self._download_divs and self._download_divs[-1] == self._depth:
+            self._download_divs.pop()
+        self._depth -= 1
+
+    def data(self, data: str) -> None:
+        pass
+
+    def close(self) -> UnitLinks:
+        return UnitLinks(
+            tuple(self.videos),
+            tuple(self.subtitles),
+            tuple(self.attachments),
+            tuple(self.archives),
+        )
+
+
+class UnitLinkScanner:
+    """
+    Incremental scanner for unit pages.
+
+    Feed it the page in chunks as they arrive; no tree is built, so memory
+    stays at one chunk no matter how large the page is. Chunks are either
+    all ``str`` or all ``bytes``.
+    """
+
+    def __init__(self, encoding: str | None = None):
+        from lxml import etree
+
+        self._parser = etree.HTMLParser(target=_UnitLinkTarget(), encoding=encoding)
+        self._empty = True
+
+    def feed(self, chunk: str | bytes) -> None:
+        if chunk:
+            self._empty = False
+            self._parser.feed(chunk)
+
+    def close(self) -> UnitLinks:
+        if self._empty:
+            # Empty bodies have nothing to download
+            logging.error("Error parsing unit page: Document is empty")
+            return UnitLinks()
+        return self._parser.close()
+
+
+def scan_unit_links(chunks: Iterable[str | bytes], encoding: str | None = None) -> UnitLinks:
+    scanner = UnitLinkScanner(encoding)
+    for chunk in chunks:
+        scanner.feed(chunk)
+    return scanner.close()
+
+
+def scan_unit_file(path: str, chunk_size: int = 64 * 1024) -> UnitLinks:
+    """Links of a unit page saved to disk, read in chunks."""
+    with open(path, "rb") as f:
+        return scan_unit_links(iter(lambda: f.read(chunk_size), b""), "utf-8")
+
+
+def extract_unit_links(html_text: str) -> UnitLinks:
+    """
+    Extract every link the crawler downloads from a unit page.
+
+    Lives at module level so it can run in a `ProcessPoolExecutor`.
+    """
+    return scan_unit_links((html_text,))
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+from maktab_dl.validators import write_if_changed
+
+# hook(path, context) -> None; context holds what the crawler knows about the
+# asset, e.g. ``url``, ``unit_id`` and for pages ``link_map``
+PostProcessHook = Callable[[str, dict], None]
+
+POST_PROCESS_KINDS = ("video", "subtitle", "attachment", "file", "page")
+OFFLINE_PAGE_SUFFIX = ".offline.html"
+
+_VTT_TIMING = re.compile(
+    r"^((?:\d+:)?\d{2}:\d{2}\.\d{3})\s+-->\s+((?:\d+:)?\d{2}:\d{2}\.\d{3})"
+)
+# Voice/class spans and karaoke timestamps have no SRT equivalent
+_VTT_TAGS = re.compile(r"</?(?:c|v|lang|ruby|rt)(?:[.\s][^>]*)?>|<\d[\d:.]*>")
+
+
+def _srt_timestamp(vtt_timestamp: str) -> str:
+    if vtt_timestamp.count(":") == 1:
+        vtt_timestamp = f"00:{vtt_timestamp}"
+    return vtt_timestamp.replace(".", ",")
+
+
+def vtt_to_srt(vtt_text: str) -> str:
+    """Convert WebVTT cues to SRT, dropping headers, notes, styles and cue settings."""
+    cues = []
+    blocks = re.split(r"\n\s*\n", vtt_text.replace("\r\n", "\n").lstrip("\ufeff"))
+    for block in blocks:
+        lines = block.strip("\n").split("\n")
+        for k, line in enumerate(lines):
+            match = _VTT_TIMING.match(line.strip())
+            if match:
+                start, end = (_srt_timestamp(t) for t in match.groups())
+                text = "\n".join(_VTT_TAGS.sub("", cue) for cue in lines[k + 1 :])
+                cues.append(f"{start} --> {end}\n{text}")
+                break
+    return "".join(f"{n}\n{cue}\n\n" for n, cue in enumerate(cues, start=1))
+
+
+def convert_subtitle_to_srt(path: str, context: dict) -> None:
+    """Built-in subtitle hook: writes ``<name>.srt`` next to ``<name>.vtt``."""
+    if not path.lower().endswith(".vtt"):
+        return
+    with open(path, "r", encoding="utf-8-sig") as f:
+        srt = vtt_to_srt(f.read())
+    srt_path = f"{os.path.splitext(path)[0]}.srt"
+    if write_if_changed(srt_path, srt.encode("utf-8")):
+        logging.info(f"Converted subtitle to SRT: {srt_path}")
+
+
+def offline_page_path(page_path: str) -> str:
+    return f"{os.path.splitext(page_path)[0]}{OFFLINE_PAGE_SUFFIX}"
+
+
+def rewrite_page_links(
+    page_path: str, link_map: dict[str, str], base_url: str | None = None
+) -> str:
+    """
+    Write an offline copy of a saved page with links to downloaded files
+    pointing at the local copies.
+
+    Relative links are made absolute against `base_url` first so links to
+    pages we do not mirror keep working. The saved page itself is left as
+    fetched, so revalidating it against the site still works. Returns the
+    path of the offline copy.
+    """
+    import lxml.html
+
+    with open(page_path, "rb") as f:
+        document = lxml.html.fromstring(f.read().decode("utf-8"))
+    if base_url:
+        document.make_links_absolute(base_url, resolve_base_href=True)
+    page_directory = os.path.dirname(page_path)
+
+    def localize(link: str) -> str:
+        local_path = link_map.get(link)
+        if local_path is None:
+            return link
+        return os.path.relpath(local_path, page_directory).replace(os.sep, "/")
+
+    document.rewrite_links(localize)
+    offline_path = offline_page_path(page_path)
+    content = lxml.html.tostring(document, encoding="utf-8", doctype="<!DOCTYPE html>")
+    if write_if_changed(offline_path, content):
+        logging.info(f"Wrote offline page: {offline_path}")
+    return offline_path
+
+
+def localize_page_links(path: str, context: dict) -> None:
+    """Built-in page hook: rewrites links of a saved unit page to local files."""
+    rewrite_page_links(path, context.get("link_map", {}), context.get("url"))
+
+
+class PostProcessor:
+    """
+    Runs hooks on finished assets on a small thread pool.
+
+    The crawler submits every asset as soon as it is on disk, so subtitle
+    conversion and page rewriting overlap with the next transfers instead
+    of running as a separate pass afterwards. Hooks are registered per
+    asset kind (see `POST_PROCESS_KINDS`); a failing hook is logged and
+    does not affect the download.
+    """
+
+    def __init__(self, max_workers: int = 2, builtin_hooks: bool = True):
+        self.max_workers = max_workers
+        self.hooks: dict[str, list[PostProcessHook]] = {
+            kind: [] for kind in POST_PROCESS_KINDS
+        }
+        if builtin_hooks:
+            self.register("subtitle", convert_subtitle_to_srt)
+            self.register("page", localize_page_links)
+        self._executor: ThreadPoolExecutor | None = None
+        self._futures: set[Future] = set()
+        self._lock = threading.Lock()
+
+    def register(self, kind: str, hook: PostProcessHook) -> None:
+        if kind not in self.hooks:
+            raise ValueError(f"Unknown asset kind: {kind}")
+        self.hooks[kind].append(hook)
+
+    def _run(self, kind: str, path: str, context: dict) -> None:
+        for hook in self.hooks[kind]:
+            try:
+                hook(path, context)
+            except Exception as e:
+                name = getattr(hook, "__name__", repr(hook))
+                logging.error(f"Post-processing hook {name} failed on {path}: {e}")
+
+    def submit(self, kind: str, path: str, **context) -> None:
+        if not self.hooks.get(kind):
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="postprocess"
+                )
+            future = self._executor.submit(self._run, kind, path, context)
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+
+    def _discard(self, future: Future) -> None:
+        with self._lock:
+            self._futures.discard(future)
+
+    def wait(self) -> None:
+        """Block until every submitted asset has been processed."""
+        while True:
+            with self._lock:
+                pending = list(self._futures)
+            if not pending:
+                return
+            for future in pending:
+                future.result()
+
+    def close(self) -> None:
+        self.wait()
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
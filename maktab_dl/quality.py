@@ -0,0 +1,110 @@
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, NamedTuple
+
+
+class VideoCandidate(NamedTuple):
+    url: str
+    rank: int = 0  # higher means better quality
+    size: int | None = None
+
+
+def rank_video_links(video_links: list[str]) -> list[VideoCandidate]:
+    """Maktabkhooneh marks the high quality `<source>` with "hq" in its URL."""
+    return [VideoCandidate(url, 1 if "hq" in url else 0) for url in video_links]
+
+
+class QualityPolicy(ABC):
+    """
+    Chooses which variant of a lecture video to download.
+
+    `select` receives the candidates of one lecture and a `size_of` callback
+    that returns the byte size of a candidate URL (or None when unknown);
+    policies only call it when they need sizes. `start_course` and `record`
+    let stateful policies account for what a course has already committed.
+    """
+
+    name: str = ""
+
+    def start_course(self, course_info) -> None:
+        pass
+
+    @abstractmethod
+    def select(
+        self,
+        candidates: list[VideoCandidate],
+        size_of: Callable[[str], int | None],
+    ) -> VideoCandidate:
+        ...
+
+    def record(self, candidate: VideoCandidate) -> None:
+        pass
+
+
+class HighestQualityPolicy(QualityPolicy):
+    """Always the best variant; the first one wins ties, as before."""
+
+    name = "highest"
+
+    def select(self, candidates, size_of):
+        return max(candidates, key=lambda x: x.rank)
+
+
+class LowestQualityPolicy(QualityPolicy):
+    name = "lowest"
+
+    def select(self, candidates, size_of):
+        return min(candidates, key=lambda x: x.rank)
+
+
+class ByteBudgetPolicy(QualityPolicy):
+    """
+    Keeps each course within `budget` bytes of video.
+
+    Picks the best variant that still fits in what is left of the course
+    budget and falls back to the smallest variant once nothing fits.
+    """
+
+    name = "budget"
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.spent = 0
+        # Units of a course may download concurrently
+        self._lock = threading.Lock()
+
+    def start_course(self, course_info) -> None:
+        self.spent = 0
+
+    def select(self, candidates, size_of):
+        sized = [
+            c if c.size is not None else c._replace(size=size_of(c.url))
+            for c in candidates
+        ]
+        known = [c for c in sized if c.size is not None]
+        if not known:
+            logging.info("No video sizes known, using the lowest quality")
+            return min(sized, key=lambda x: x.rank)
+        remaining = self.budget - self.spent
+        fitting = [c for c in known if c.size <= remaining]
+        if fitting:
+            return max(fitting, key=lambda x: (x.rank, x.size))
+        logging.info(f"Course video budget exhausted ({self.spent}/{self.budget} bytes)")
+        return min(known, key=lambda x: x.size)
+
+    def record(self, candidate: VideoCandidate) -> None:
+        with self._lock:
+            self.spent += candidate.size or 0
+
+
+def quality_policy_from_name(name: str, budget: int | None = None) -> QualityPolicy:
+    if name == HighestQualityPolicy.name:
+        return HighestQualityPolicy()
+    if name == LowestQualityPolicy.name:
+        return LowestQualityPolicy()
+    if name == ByteBudgetPolicy.name:
+        if not budget:
+            raise ValueError("The budget quality policy needs a byte budget")
+        return ByteBudgetPolicy(budget)
+    raise ValueError(f"Unknown quality policy: {name}")
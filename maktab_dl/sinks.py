@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+# S3 rejects multipart parts below 5 MiB, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class SinkWriter(ABC):
+    """
+    Receives one file as a stream of chunks.
+
+    Use it as a context manager: leaving the block normally commits the
+    file, an exception discards it.
+    """
+
+    size = 0
+
+    @abstractmethod
+    def write(self, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def commit(self) -> None:
+        ...
+
+    @abstractmethod
+    def abort(self) -> None:
+        ...
+
+    @abstractmethod
+    def restart(self) -> None:
+        """Discard what was written so far and start the file over."""
+
+    def __enter__(self) -> SinkWriter:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class StorageSink(ABC):
+    """
+    Destination for downloaded files other than the local output directory.
+
+    Files are addressed by the local path the crawler would have written,
+    so the course layout is kept; subclasses map it to their own names.
+    """
+
+    @abstractmethod
+    def open(self, path: str) -> SinkWriter:
+        ...
+
+    @abstractmethod
+    def size(self, path: str) -> int | None:
+        """Size of a stored file, or None when it is not stored."""
+
+    @abstractmethod
+    def uri(self, path: str) -> str:
+        """Where a file is stored, as recorded in the course index."""
+
+    def close(self) -> None:
+        """Wait for pending writes and release connections."""
+
+    def put(self, path: str, data: bytes) -> None:
+        with self.open(path) as writer:
+            writer.write(data)
+
+    def upload_file(self, path: str, chunk_size: int = 1024 * 1024) -> None:
+        """Store a file that had to be assembled locally."""
+        with open(path, "rb") as f, self.open(path) as writer:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                writer.write(chunk)
+
+
+class S3Writer(SinkWriter):
+    """
+    Streams a file into an S3 multipart upload.
+
+    Parts are uploaded on a small thread pool while the next part fills, so
+    at most ``(max_concurrency + 1) * part_size`` bytes are buffered. Files
+    smaller than one part are sent with a single ``PutObject``.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        key: str,
+        part_size: int,
+        executor: ThreadPoolExecutor,
+        max_concurrency: int,
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.executor = executor
+        self.size = 0
+        self._buffer = bytearray()
+        self._upload_id: str | None = None
+        self._parts: list[Future] = []
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def _upload_part(self, number: int, data: bytes) -> dict:
+        try:
+            response = self.client.upload_part(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                PartNumber=number,
+                Body=data,
+            )
+            return {"ETag": response["ETag"], "PartNumber": number}
+        finally:
+            self._slots.release()
+
+    def _send_part(self, data: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key
+            )["UploadId"]
+        for part in self._parts:
+            if part.done() and part.exception() is not None:
+                raise part.exception()
+        # Blocks while `max_concurrency` parts are still uploading
+        self._slots.acquire()
+        self._parts.append(
+            self.executor.submit(self._upload_part, len(self._parts) + 1, data)
+        )
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._send_part(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+
+    def commit(self) -> None:
+        if self._upload_id is None:
+            self.client.put_object(
+                Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer)
+            )
+            return
+        if self._buffer:
+            self._send_part(bytes(self._buffer))
+            self._buffer.clear()
+        try:
+            parts = [part.result() for part in self._parts]
+        except Exception:
+            self.abort()
+            raise
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def abort(self) -> None:
+        self._buffer.clear()
+        if self._upload_id is None:
+            return
+        for part in self._parts:
+            part.exception()
+        try:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+            )
+        except Exception as e:
+            logging.error(f"Error aborting upload of {self.key}: {e}")
+        self._upload_id = None
+
+    def restart(self) -> None:
+        self.abort()
+        self._parts = []
+        self.size = 0
+
+
+class S3Sink(StorageSink):
+    """
+    Writes downloads to an S3-compatible bucket (AWS, MinIO, Ceph...).
+
+    The object key is `prefix` plus the file's path below `root` (the
+    crawler's output directory), so the bucket mirrors the local layout.
+    Needs ``boto3``; pass `client` to use a preconfigured one, e.g. for a
+    local MinIO or a moto server.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        root: str,
+        prefix: str = "",
+        client=None,
+        endpoint_url: str | None = None,
+        part_size: int = 8 * 1024 * 1024,
+        max_concurrency: int = 2,
+    ):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError("S3 parts must be at least 5 MiB")
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.root = os.path.abspath(root)
+        self.prefix = prefix.strip("/")
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="s3-upload"
+        )
+
+    @classmethod
+    def from_url(cls, url: str, root: str, **kwargs) -> S3Sink:
+        """Sink for an ``s3://bucket/prefix`` URL."""
+        parts = urlsplit(url)
+        if parts.scheme != "s3" or not parts.netloc:
+            raise ValueError(f"Not an s3://bucket/prefix URL: {url}")
+        return cls(parts.netloc, root, prefix=parts.path, **kwargs)
+
+    def key(self, path: str) -> str:
+        relative = os.path.relpath(os.path.abspath(path), self.root)
+        key = relative.replace(os.sep, "/")
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def uri(self, path: str) -> str:
+        return f"s3://{self.bucket}/{self.key(path)}"
+
+    def open(self, path: str) -> S3Writer:
+        return S3Writer(
+            self.client,
+            self.bucket,
+            self.key(path),
+            self.part_size,
+            self._executor,
+            self.max_concurrency,
+        )
+
+    def size(self, path: str) -> int | None:
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self.key(path))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return response["ContentLength"]
+
+    def close(self) -> None:
+        self._executor.shutdown()
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+STORE_DIR_NAME = ".maktab_store"
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Returns the hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    """Hardlinks `src` to `dst`, copying instead when they are on different filesystems."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class BlobStore:
+    """
+    Content-addressed store for downloaded files.
+
+    Blobs live under ``<root>/blobs/<sha[:2]>/<sha>`` and an index maps each
+    source URL (without its query string, which is often a signature) to the
+    blob digest, size and HTTP validators. A URL seen again is served from
+    the store by hardlinking the blob to the new target path instead of
+    downloading it, once `is_current` confirms the origin still serves the
+    same content.
+
+    The index is written at most every `save_interval` seconds while files
+    are ingested; call `save` when a run ends.
+
+    Files placed in the output tree are hardlinks of the blob, so they must
+    never be rewritten in place; the crawler removes a file before writing it.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(
+        self, root: str, verify_hash: bool = False, save_interval: float = 30.0
+    ):
+        self.root = root
+        self.blobs_dir = os.path.join(root, "blobs")
+        self.index_path = os.path.join(root, self.INDEX_FILE)
+        # Re-hash blobs on every reuse instead of only checking their size
+        self.verify_hash = verify_hash
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        self._index: dict[str, dict] = self._load_index()
+
+    @staticmethod
+    def url_key(url: str) -> str:
+        return url.split("?")[0].split("#")[0]
+
+    def _load_index(self) -> dict[str, dict]:
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Ignoring unreadable blob store index {self.index_path}: {e}")
+            return {}
+
+    def _save_index(self) -> None:
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def save(self) -> None:
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.blobs_dir, sha256[:2], sha256)
+
+    def lookup(self, url: str) -> dict | None:
+        """Returns the index entry of `url` if its blob is present and intact."""
+        with self._lock:
+            entry = self._index.get(self.url_key(url))
+        if entry is None:
+            return None
+        blob = self.blob_path(entry["sha256"])
+        if not os.path.exists(blob) or os.path.getsize(blob) != entry["size"]:
+            logging.info(f"Stale blob store entry for {url}")
+            return None
+        if self.verify_hash and file_sha256(blob) != entry["sha256"]:
+            logging.error(f"Corrupted blob in store: {blob}")
+            os.remove(blob)
+            return None
+        return entry
+
+    @staticmethod
+    def is_current(entry: dict, headers) -> bool:
+        """
+        Whether the response headers of a HEAD request still describe the
+        stored content: same ETag, else same Last-Modified, else same size.
+        """
+        etag, last_modified = headers.get("etag"), headers.get("last-modified")
+        if entry.get("etag") and etag:
+            return etag == entry["etag"]
+        if entry.get("last_modified") and last_modified:
+            return last_modified == entry["last_modified"]
+        length = headers.get("content-length")
+        return length is not None and int(length) == entry["size"]
+
+    def materialize(
+        self, url: str, output_file: str, entry: dict | None = None
+    ) -> bool:
+        """
+        Places the stored copy of `url`, or its looked up `entry`, at
+        `output_file`. False when nothing was placed: `url` is not stored or
+        `output_file` already is its blob.
+        """
+        if entry is None:
+            entry = self.lookup(url)
+        if entry is None:
+            return False
+        if self.is_linked(entry, output_file):
+            return False
+        blob = self.blob_path(entry["sha256"])
+        link_or_copy(blob, output_file)
+        logging.info(f"Linked {output_file} from blob store")
+        return True
+
+    def is_linked(self, entry: dict, path: str) -> bool:
+        """Whether `path` is a hardlink of the blob of `entry`."""
+        blob = self.blob_path(entry["sha256"])
+        return (
+            os.path.exists(blob)
+            and os.path.exists(path)
+            and os.path.samefile(blob, path)
+        )
+
+    def evict(self, url: str) -> None:
+        """Drops `url` and its blob, e.g. after a copy of it was found corrupt."""
+        with self._lock:
+            entry = self._index.pop(self.url_key(url), None)
+            if entry is None:
+                return
+            self._save_index()
+        blob = self.blob_path(entry["sha256"])
+        if os.path.exists(blob):
+            os.remove(blob)
+
+    def ingest(self, url: str, file_path: str, headers=None) -> str:
+        """
+        Adds a downloaded file to the store and returns its digest; `headers`
+        of the response it came from supply the validators.
+        """
+        with self._lock:
+            known = self._index.get(self.url_key(url))
+        if known is not None and self.is_linked(known, file_path):
+            # Already a link of its blob: no need to hash it again
+            sha256, size = known["sha256"], known["size"]
+        else:
+            sha256 = file_sha256(file_path)
+            size = os.path.getsize(file_path)
+            blob = self.blob_path(sha256)
+            if os.path.exists(blob) and os.path.getsize(blob) == size:
+                # Same content under another URL: share the existing blob
+                link_or_copy(blob, file_path)
+            else:
+                link_or_copy(file_path, blob)
+        entry = {"sha256": sha256, "size": size}
+        if headers is not None:
+            entry["etag"] = headers.get("etag")
+            entry["last_modified"] = headers.get("last-modified")
+        with self._lock:
+            if self._index.get(self.url_key(url)) != entry:
+                self._index[self.url_key(url)] = entry
+                self._dirty = True
+            if self._dirty and time.monotonic() - self._saved_at >= self.save_interval:
+                self._save_index()
+        return sha256
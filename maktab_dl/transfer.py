@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class TransferSettings(NamedTuple):
+    # Seconds without any data before a read is abandoned
+    read_timeout: float = 60.0
+    # A transfer slower than this many bytes/s over `stall_window` seconds is stalled
+    stall_min_rate: int = 32 * 1024
+    stall_window: float = 30.0
+    # New connections a single file may use before it is given up
+    max_resumes: int = 5
+    # Race the remaining range on a second connection instead of dropping
+    # the stalled one
+    hedge: bool = False
+
+
+class TransferStalled(Exception):
+    pass
+
+
+class TransferPaused(Exception):
+    pass
+
+
+class StallDetector:
+    """
+    Flags a transfer whose throughput over the last `window` seconds is below `min_rate`.
+
+    Time spent deliberately waiting, such as pacing to a bandwidth cap, is
+    left out with `exclude`, so a throttled transfer is not mistaken for a
+    stalled one.
+    """
+
+    def __init__(self, min_rate: int, window: float):
+        self.min_rate = min_rate
+        self.window = window
+        self._excluded = 0.0
+        self.started = self._clock()
+        self._samples: deque[tuple[float, int]] = deque()
+        self._window_bytes = 0
+
+    def _clock(self) -> float:
+        return time.monotonic() - self._excluded
+
+    def exclude(self, seconds: float) -> None:
+        self._excluded += seconds
+
+    def update(self, size: int) -> bool:
+        now = self._clock()
+        self._samples.append((now, size))
+        self._window_bytes += size
+        while self._samples and self._samples[0][0] < now - self.window:
+            self._window_bytes -= self._samples.popleft()[1]
+        return (
+            now - self.started >= self.window
+            and self._window_bytes < self.min_rate * self.window
+        )
+
+
+class PartialFile:
+    """
+    ``<path>.part`` being downloaded, next to a ``<path>.part.json`` sidecar
+    with the URL, validator and size it was started from.
+
+    A partial is only continued when the sidecar matches the current
+    response; anything else starts over, and the file is renamed to `path`
+    once complete.
+    """
+
+    def __init__(self, path: str, url: str, validator: str | None, size: int):
+        self.path = path
+        self.part_path = f"{path}.part"
+        self.meta_path = f"{path}.part.json"
+        self.meta = {"url": url, "validator": validator, "size": size}
+
+    def resumable_size(self) -> int:
+        """Bytes of a matching partial to continue from; 0 after dropping a stale one."""
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            size = os.path.getsize(self.part_path)
+        except (OSError, ValueError):
+            meta, size = None, 0
+        if (
+            meta == self.meta
+            and self.meta["validator"]
+            and 0 < size < self.meta["size"]
+        ):
+            return size
+        self.discard()
+        return 0
+
+    def start(self) -> None:
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+
+    def discard(self) -> None:
+        for path in (self.part_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def finish(self) -> None:
+        os.replace(self.part_path, self.path)
+        os.remove(self.meta_path)
+
+
+class HedgedRange:
+    """
+    Fetches ``bytes=<offset>-`` of a URL into a side file on its own thread.
+
+    Started when the primary connection stalls; whichever of the two
+    finishes first is kept and the other is cancelled.
+    """
+
+    def __init__(
+        self,
+        client: httpx.Client,
+        url: str,
+        path: str,
+        offset: int,
+        timeout: float | httpx.Timeout,
+        schedule: TransferSchedule | None = None,
+    ):
+        self.client = client
+        self.url = url
+        self.path = path
+        self.offset = offset
+        self.timeout = timeout
+        # Shares the bandwidth cap and windows of the primary transfer
+        self.schedule = schedule
+        self.ok = False
+        self.error: Exception | None = None
+        self.done = threading.Event()
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        logging.info(f"Hedging {self.url} from byte {self.offset} on a second connection")
+        self._thread.start()
+
+    def cancel(self) -> None:
+        """Stop the hedged request; its side file is removed when it winds down."""
+        self._cancelled.set()
+        if self.done.is_set() and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def wait(self) -> bool:
+        self.done.wait()
+        return self.ok
+
+    def _run(self) -> None:
+        try:
+            with self.client.stream(
+                "GET",
+                self.url,
+                headers={"Range": f"bytes={self.offset}-"},
+                timeout=self.timeout,
+            ) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise TransferStalled("server does not support range requests")
+                with open(self.path, "wb") as f:
+                    for chunk in response.iter_bytes(chunk_size=64 * 1024):
+                        if self._cancelled.is_set():
+                            return
+                        f.write(chunk)
+                        if self.schedule is not None and not self.schedule.throttle(
+                            len(chunk)
+                        ):
+                            raise TransferPaused("transfer window closed")
+            self.ok = True
+        except Exception as e:
+            self.error = e
+            logging.error(f"Hedged request for {self.url} failed: {e}")
+        finally:
+            if (self._cancelled.is_set() or not self.ok) and os.path.exists(self.path):
+                os.remove(self.path)
+            self.done.set()
+
+    def splice_into(self, file, digest) -> None:
+        """Replace everything after `offset` in `file` with the hedged bytes."""
+        file.seek(self.offset)
+        file.truncate()
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                file.write(chunk)
+                digest.update(chunk)
+        os.remove(self.path)
+
+
+class TransferWindow(NamedTuple):
+    # Minutes after local midnight; a window that ends before it starts runs
+    # past midnight, and one that ends where it starts lasts all day
+    start: int
+    end: int
+    # Bytes/s shared by all media transfers while the window is open
+    rate: int | None = None
+
+    def contains(self, minute: int) -> bool:
+        if self.start == self.end:
+            return True
+        if self.start < self.end:
+            return self.start <= minute < self.end
+        return minute >= self.start or minute < self.end
+
+
+def parse_transfer_window(value: str) -> TransferWindow:
+    """Parses ``HH:MM-HH:MM`` with an optional ``@RATE`` cap, e.g. ``01:00-07:00@2M``."""
+    from maktab_dl.utils import parse_size
+
+    hours, _, rate = value.partition("@")
+    match = re.fullmatch(r"\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*", hours)
+    if not match:
+        raise ValueError(f"Invalid transfer window: {value}")
+    start_hour, start_minute, end_hour, end_minute = map(int, match.groups())
+    if max(start_hour, end_hour) > 24 or max(start_minute, end_minute) > 59:
+        raise ValueError(f"Invalid transfer window: {value}")
+    return TransferWindow(
+        (start_hour * 60 + start_minute) % 1440,
+        (end_hour * 60 + end_minute) % 1440,
+        parse_size(rate) if rate.strip() else None,
+    )
+
+
+def _minute_of_day(now: float) -> int:
+    local = time.localtime(now)
+    return local.tm_hour * 60 + local.tm_min
+
+
+class TransferSchedule:
+    """
+    Local hours in which media may transfer, each with an optional bandwidth cap.
+
+    Transfers call `wait` before they start and `throttle` after every
+    chunk. `throttle` paces the chunks of all threads to the open window's
+    rate and returns False once no window is open, so the transfer can stop,
+    keep what it has and resume after `wait`. Crawling and planning are not
+    gated.
+    """
+
+    def __init__(self, windows: list[TransferWindow], check_interval: float = 1.0):
+        if not windows:
+            raise ValueError("A transfer schedule needs at least one window")
+        self.windows = tuple(windows)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._window: TransferWindow | None = None
+        self._checked_at: float | None = None
+        self._next_send = 0.0
+
+    def current(self, now: float | None = None) -> TransferWindow | None:
+        minute = _minute_of_day(time.time() if now is None else now)
+        return next((window for window in self.windows if window.contains(minute)), None)
+
+    def seconds_until_open(self, now: float | None = None) -> float:
+        now = time.time() if now is None else now
+        if self.current(now) is not None:
+            return 0.0
+        minute = _minute_of_day(now)
+        minutes = min((window.start - minute) % 1440 for window in self.windows)
+        return max(0.0, minutes * 60 - now % 60)
+
+    def state(self) -> str:
+        delay = self.seconds_until_open()
+        if not delay:
+            return "open"
+        resume_at = datetime.fromtimestamp(time.time() + delay).strftime("%H:%M")
+        return f"paused until {resume_at}"
+
+    def wait(self) -> TransferWindow:
+        """Blocks until a window is open and returns it."""
+        paused = False
+        while True:
+            window = self.current()
+            if window is not None:
+                if paused:
+                    logging.info("Transfer window opened, resuming media transfers")
+                return window
+            if not paused:
+                logging.info(f"Outside transfer windows, media {self.state()}")
+                paused = True
+            time.sleep(min(max(self.seconds_until_open(), 1.0), 60.0))
+
+    def throttle(self, size: int) -> bool:
+        """Accounts `size` bytes just received; False when no window is open."""
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is None or now - self._checked_at >= self.check_interval:
+                self._window = self.current()
+                self._checked_at = now
+            window = self._window
+            if window is None:
+                return False
+            if not window.rate:
+                return True
+            # Chunks of every transfer are booked back to back at the window's rate
+            self._next_send = max(self._next_send, now) + size / window.rate
+            delay = self._next_send - now
+        time.sleep(delay)
+        return True
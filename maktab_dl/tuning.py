@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ConcurrencyTuner:
+    """
+    Adjusts how many media transfers run at once from measured goodput.
+
+    Transfers take a slot with `slot()` and report received bytes and
+    errors. Every `interval` seconds the tuner compares the aggregate
+    goodput with the previous window: it adds a stream while goodput grows
+    by at least `min_gain`, steps back once it flattens, and halves the
+    limit when throttling (429/503) or connection resets show up. After
+    `probe_windows` stable windows it probes one more stream again, so the
+    limit follows changing link conditions. The limit stays within
+    ``[min_streams, max_streams]``.
+    """
+
+    def __init__(
+        self,
+        min_streams: int = 1,
+        max_streams: int = 8,
+        initial_streams: int | None = None,
+        interval: float = 5.0,
+        min_gain: float = 0.05,
+        probe_windows: int = 6,
+    ):
+        if not 1 <= min_streams <= max_streams:
+            raise ValueError("Need 1 <= min_streams <= max_streams")
+        self.min_streams = min_streams
+        self.max_streams = max_streams
+        self.limit = max(min_streams, min(initial_streams or min_streams, max_streams))
+        self.interval = interval
+        self.min_gain = min_gain
+        self.probe_windows = probe_windows
+        self.active = 0
+        self._condition = threading.Condition()
+        self._window_started = time.monotonic()
+        self._window_bytes = 0
+        self._window_errors = 0
+        self._previous_goodput: float | None = None
+        self._last_step = 0
+        self._stable_windows = 0
+
+    @contextmanager
+    def slot(self):
+        """Hold one transfer slot for the duration of the block."""
+        with self._condition:
+            while self.active >= self.limit:
+                self._condition.wait()
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.active -= 1
+                self._condition.notify_all()
+
+    def record_bytes(self, size: int) -> None:
+        with self._condition:
+            self._window_bytes += size
+            self._maybe_adjust()
+
+    def record_error(self) -> None:
+        """Report throttling or a reset connection."""
+        with self._condition:
+            self._window_errors += 1
+            self._maybe_adjust()
+
+    def _set_limit(self, limit: int, reason: str) -> None:
+        limit = max(self.min_streams, min(limit, self.max_streams))
+        if limit != self.limit:
+            logging.info(f"Media streams {self.limit} -> {limit} ({reason})")
+            self._last_step = limit - self.limit
+            self.limit = limit
+            self._condition.notify_all()
+        else:
+            self._last_step = 0
+
+    def _maybe_adjust(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._window_started
+        if elapsed < self.interval:
+            return
+        goodput = self._window_bytes / elapsed
+        errors = self._window_errors
+        self._window_started = now
+        self._window_bytes = 0
+        self._window_errors = 0
+        previous = self._previous_goodput
+        self._previous_goodput = goodput
+        if errors:
+            self._stable_windows = 0
+            self._set_limit(self.limit // 2, f"{errors} throttling/reset errors")
+            return
+        if self.active < self.limit:
+            # Not enough work queued to use the streams we already have
+            return
+        if previous is None or goodput > previous * (1 + self.min_gain):
+            self._stable_windows = 0
+            if self._last_step < 0:
+                # Recovered after stepping back; hold this limit for a window
+                self._last_step = 0
+            else:
+                self._set_limit(self.limit + 1, f"goodput {goodput / 1024:.0f} KiB/s")
+            return
+        if self._last_step > 0:
+            # The last added stream did not pay off
+            self._stable_windows = 0
+            self._set_limit(self.limit - 1, f"goodput flat at {goodput / 1024:.0f} KiB/s")
+            return
+        self._last_step = 0
+        self._stable_windows += 1
+        if self._stable_windows >= self.probe_windows:
+            self._stable_windows = 0
+            self._set_limit(self.limit + 1, "probing")
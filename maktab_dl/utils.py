@@ -1,11 +1,16 @@
+from __future__ import annotations
+
 import os
 import json
 import pathlib
-from lxml.html import Element
 import re
-from pydantic import BaseModel
-from typing import Type, TypeVar
-from pydantic import ValidationError
+from typing import TYPE_CHECKING, Type, TypeVar
+
+# lxml and pydantic are only needed by a few helpers; import them lazily so
+# the CLI starts fast
+if TYPE_CHECKING:
+    from lxml.html import Element
+    from pydantic import BaseModel
 
 
 def save_cookies(client, filepath):
@@ -53,7 +58,7 @@ def save_model_to_json(model: BaseModel, filename: str, indent: int = 4) -> None
         f.write(json_string)
 
 
-T = TypeVar("T", bound=BaseModel)
+T = TypeVar("T", bound="BaseModel")
 
 
 def load_model_from_json(model_type: Type[T], filename: str) -> T:
@@ -71,6 +76,8 @@ def load_model_from_json(model_type: Type[T], filename: str) -> T:
         json.JSONDecodeError: If the JSON file is not valid JSON.
         ValidationError: If the JSON data doesn't match the model.
     """
+    from pydantic import ValidationError
+
     try:
         with open(filename, "r", encoding="utf-8") as f:
             json_data = json.load(f)
@@ -105,6 +112,15 @@ def sanitize_filename(filename, replacement="_"):
     return filename[:max_length]
 
 
+def parse_size(value: str) -> int:
+    """Parses a byte size such as `700M`, `2G` or `1.5GB` (binary units)."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([kmgt]?)i?b?\s*", value.lower())
+    if not match:
+        raise ValueError(f"Invalid size: {value}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** " kmgt".index(unit or " "))
+
+
 def get_package_file_path():
     """
     Constructs the full path to package dir.
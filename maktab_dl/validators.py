@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Iterable
+
+
+def write_if_changed(path: str, content: bytes) -> bool:
+    """
+    Atomically writes `content` to `path` unless the file already holds it.
+
+    Returns True when the file was (re)written. An unchanged file keeps its
+    mtime so incremental backups skip it.
+    """
+    if os.path.exists(path) and os.path.getsize(path) == len(content):
+        with open(path, "rb") as f:
+            if f.read() == content:
+                return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return True
+
+
+def _file_digest(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_stream_if_changed(path: str, chunks: Iterable[bytes]) -> tuple[bool, str, int]:
+    """
+    Like `write_if_changed`, for content that arrives in chunks.
+
+    The chunks go to a temporary file as they come, so the content is never
+    held in memory. Returns ``(changed, sha256, size)``.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    digest = hashlib.sha256()
+    size = 0
+    with open(tmp_path, "wb") as f:
+        for chunk in chunks:
+            digest.update(chunk)
+            size += len(chunk)
+            f.write(chunk)
+    sha256 = digest.hexdigest()
+    if (
+        os.path.exists(path)
+        and os.path.getsize(path) == size
+        and _file_digest(path) == sha256
+    ):
+        os.remove(tmp_path)
+        return False, sha256, size
+    os.replace(tmp_path, path)
+    return True, sha256, size
+
+
+class ValidatorStore:
+    """
+    Remembers HTTP validators of small assets written to the output tree.
+
+    Entries are keyed by the file path relative to the output root and hold
+    the source URL, its ``ETag``/``Last-Modified`` headers and the SHA-256 of
+    the content last written, so a later sync can send a conditional request
+    and leave the file untouched when nothing changed.
+    """
+
+    FILE_NAME = ".maktab_validators.json"
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.path = os.path.join(output_path, self.FILE_NAME)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._entries: dict[str, dict] = self._load()
+
+    def _load(self) -> dict[str, dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Ignoring unreadable validators file {self.path}: {e}")
+            return {}
+
+    def _key(self, output_file: str) -> str:
+        return os.path.relpath(output_file, self.output_path).replace(os.sep, "/")
+
+    def conditional_headers(self, url: str, output_file: str) -> dict:
+        """Returns ``If-None-Match``/``If-Modified-Since`` headers for a file we still have."""
+        with self._lock:
+            entry = self._entries.get(self._key(output_file))
+        if (
+            entry is None
+            or entry.get("url") != url
+            or not os.path.exists(output_file)
+            or os.path.getsize(output_file) != entry.get("size")
+        ):
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def update(self, url: str, output_file: str, response, content: bytes) -> None:
+        self.update_digest(
+            url, output_file, response, hashlib.sha256(content).hexdigest(), len(content)
+        )
+
+    def update_digest(
+        self, url: str, output_file: str, response, sha256: str, size: int
+    ) -> None:
+        entry = {
+            "url": url,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "sha256": sha256,
+            "size": size,
+        }
+        key = self._key(output_file)
+        with self._lock:
+            if self._entries.get(key) != entry:
+                self._entries[key] = entry
+                self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable, NamedTuple
+
+if TYPE_CHECKING:
+    from maktab_dl.index import CourseIndex
+
+SAMPLE_BLOCK_SIZE = 1024 * 1024
+VERIFY_MODES = ("full", "fast")
+
+
+def sample_digest(path: str, block_size: int = SAMPLE_BLOCK_SIZE) -> str:
+    """
+    SHA-256 over the size and the head, middle and tail blocks of a file.
+
+    Reads at most three blocks, so it is cheap enough to take for every
+    download and catches truncation and most torn or zeroed regions.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(path, "rb") as f:
+        if size <= 3 * block_size:
+            digest.update(f.read())
+        else:
+            for offset in (0, (size - block_size) // 2, size - block_size):
+                f.seek(offset)
+                digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+
+def mmap_sha256(path: str, chunk_size: int = 16 * 1024 * 1024) -> str:
+    """
+    Full SHA-256 of a file through a read-only memory map.
+
+    hashlib releases the GIL on large buffers, so several files hash in
+    parallel on a thread pool without copying data through Python reads.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, size, chunk_size):
+                    digest.update(view[offset : offset + chunk_size])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+class VerifyResult(NamedTuple):
+    path: str
+    unit_id: int | None
+    url: str
+    # ok, recorded (no digest known yet, now recorded), remote (stored in a
+    # sink, not checked), missing, size, digest
+    status: str
+    detail: str = ""
+
+    @property
+    def failed(self) -> bool:
+        return self.status in ("missing", "size", "digest")
+
+
+def verify_file(row: dict, mode: str = "full") -> tuple[VerifyResult, str | None]:
+    """
+    Check one recorded download against the file on disk.
+
+    Returns the result and, in full mode, the digest that was computed.
+    """
+    path = row["path"]
+
+    def result(status: str, detail: str = "") -> VerifyResult:
+        return VerifyResult(path, row["unit_id"], row["url"], status, detail)
+
+    if "://" in path:
+        # Recorded by a storage sink; there is no local copy to check
+        return result("remote"), None
+
+    if not os.path.exists(path):
+        return result("missing"), None
+    size = os.path.getsize(path)
+    if row["size"] is not None and size != row["size"]:
+        return result("size", f"{size} bytes on disk, {row['size']} recorded"), None
+    if mode == "fast":
+        if row["sample_sha256"] is None:
+            return result("ok", "size only"), None
+        if sample_digest(path) != row["sample_sha256"]:
+            return result("digest", "sampled blocks differ"), None
+        return result("ok"), None
+    sha256 = mmap_sha256(path)
+    if row["sha256"] is None:
+        return result("recorded"), sha256
+    if sha256 != row["sha256"]:
+        return result("digest", "content differs"), sha256
+    return result("ok"), sha256
+
+
+def verify_downloads(
+    index: CourseIndex,
+    mode: str = "full",
+    max_workers: int | None = None,
+    course_slug: str | None = None,
+) -> list[VerifyResult]:
+    """
+    Verify every download recorded in the index on a thread pool.
+
+    Mismatched files are marked ``corrupt`` (or ``missing``) in the index,
+    and files marked so earlier that check out again, e.g. after a repair,
+    are marked ``done``; in full mode, files without a recorded digest get
+    one.
+    """
+    if mode not in VERIFY_MODES:
+        raise ValueError(f"Unknown verify mode: {mode}")
+    rows: Iterable[dict] = index.downloads(course_slug=course_slug)
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        for row, (res, sha256) in zip(
+            rows, executor.map(lambda row: verify_file(row, mode), rows)
+        ):
+            if res.status == "recorded":
+                index.set_download_digest(res.path, sha256, sample_digest(res.path))
+            if not res.failed and row["state"] != "done":
+                index.set_download_state(res.path, "done")
+            elif res.failed:
+                logging.error(f"Verify {res.status}: {res.path} {res.detail}")
+                index.set_download_state(
+                    res.path, "missing" if res.status == "missing" else "corrupt"
+                )
+            results.append(res)
+    return results